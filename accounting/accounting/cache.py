@@ -0,0 +1,60 @@
+from collections import OrderedDict
+import dataclasses
+from typing import Generic, Hashable, TypeVar
+
+KeyT = TypeVar('KeyT', bound=Hashable)
+ValueT = TypeVar('ValueT')
+
+
+class LRUCache(Generic[KeyT, ValueT]):
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: OrderedDict[KeyT, ValueT] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: KeyT) -> ValueT | None:
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: KeyT, value: ValueT):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: KeyT):
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+@dataclasses.dataclass(frozen=True)
+class TaskPrice:
+    id: int
+    assignment_cost: int
+    closing_cost: int
+
+
+class HotRowCache:
+    def __init__(self, max_size: int):
+        self.account_ids: LRUCache[str, int] = LRUCache(max_size)
+        self.task_prices: LRUCache[str, TaskPrice] = LRUCache(max_size)
+        self.open_billing_cycle_ids: LRUCache[int, int] = LRUCache(max_size)
+
+    def stats(self) -> dict:
+        return {
+            'account_ids': self.account_ids.stats(),
+            'task_prices': self.task_prices.stats(),
+            'open_billing_cycle_ids': self.open_billing_cycle_ids.stats(),
+        }
+
+
+# Rows are cached in memory of the process, it is shared by the event handlers of the consumer
+hot_rows = HotRowCache(max_size=100_000)
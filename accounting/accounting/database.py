@@ -1,25 +1,52 @@
 from pydantic import BaseSettings
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from sqlmodel import SQLModel
+
+from schema_migrations import SchemaMode, setup_schema
 
 engine: AsyncEngine | None = None
+session_factory = sessionmaker(class_=AsyncSession, expire_on_commit=False)
 
 
 class Settings(BaseSettings):
     url: str
+    echo: bool = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800
+    query_cache_size: int = 500
+    prepared_statement_cache_size: int = 256
+    schema_mode: SchemaMode = SchemaMode.migrate
 
     class Config:
         env_prefix = 'database_'
 
 
 def create_session() -> AsyncSession:
-    return sessionmaker(engine, AsyncSession, expire_on_commit=False)()
+    return session_factory()
+
+
+def create_engine(settings: Settings) -> AsyncEngine:
+    connect_args = {}
+    if make_url(settings.url).get_driver_name() == 'asyncpg':
+        connect_args['prepared_statement_cache_size'] = settings.prepared_statement_cache_size
+    return create_async_engine(
+        settings.url,
+        echo=settings.echo,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_pre_ping=settings.pool_pre_ping,
+        pool_recycle=settings.pool_recycle,
+        query_cache_size=settings.query_cache_size,
+        connect_args=connect_args,
+    )
 
 
 async def setup(settings: Settings):
     global engine
-    engine = create_async_engine(settings.url, echo=True)
-    from accounting import models  # noqa
-    async with engine.begin() as connection:
-        await connection.run_sync(SQLModel.metadata.create_all)
+    engine = create_engine(settings)
+    session_factory.configure(bind=engine)
+    from accounting.migrations import migrations
+    await setup_schema(engine, migrations, settings.schema_mode)
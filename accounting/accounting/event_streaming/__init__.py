@@ -0,0 +1,2 @@
+topics = 'accounts-stream', 'accounts', 'task-stream', 'task-lifecycle',
+group = 'accounting'
@@ -3,16 +3,28 @@ import logging
 
 import event_streaming
 from accounting import database
+from accounting.cache import hot_rows
+from accounting.event_streaming import group, topics
 import accounting.event_streaming.handlers  # noqa
 
-topics = 'accounts-stream', 'accounts', 'task-stream', 'task-lifecycle',
-group = 'accounting'
+cache_stats_interval = 60
 
+logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
+async def log_cache_stats():
+    while True:
+        await asyncio.sleep(cache_stats_interval)
+        logger.info('Hot row cache: %s', hot_rows.stats())
+
+
 async def main():
     await database.setup(database.Settings())
-    await event_streaming.consume(event_streaming.Settings(), topics, group)
+    cache_stats_logging = asyncio.create_task(log_cache_stats())
+    try:
+        await event_streaming.consume(event_streaming.Settings(), topics, group)
+    finally:
+        cache_stats_logging.cancel()
 
-asyncio.run(main(), debug=True)
+asyncio.run(main())
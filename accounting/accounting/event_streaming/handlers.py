@@ -2,41 +2,53 @@ from typing import Any, Mapping
 import logging
 
 import event_streaming
+from upserts import MergePolicy, upsert
 from accounting import database
+from accounting.cache import hot_rows
 from accounting.models import Account, AccountRole, Task
 from accounting.transactions.billing import initialize_account
-from accounting.transactions.tasks import price_task, charge_fee_for_task_assignment, assess_amount_for_task_closing
-from accounting.transactions.utils import get_or_create
+from accounting.transactions.tasks import TaskEvent, apply_task_event, price_task
 
 logger = logging.getLogger(__name__)
 
 
+def get_account_data(event_data: Mapping[str, Any]) -> dict:
+    return {field: value for field, value in event_data.items() if field in Account.__fields__}
+
+
+def get_task_description(event_version: int, event_data: Mapping[str, Any]) -> str | None:
+    if event_version == 1:  # Drop support for v1 after releasing of v2-producer
+        return f"{event_data['title']}\n{event_data['description']}"
+    elif event_version == 2:
+        jira_id = event_data['jira_id']
+        jira_prefix = jira_id and f'[{jira_id}] '
+        return f"{jira_prefix}{event_data['title']}\n{event_data['description']}"
+    return None
+
+
 @event_streaming.on_event('AccountCreated')
 @event_streaming.on_event('AccountUpdated')
 async def on_account_updated(event_name: str, event_version: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
     if not event_data.get('public_id'):
         logger.warning('Invalid data, public_id is required!')
         return
     public_id = event_data['public_id']
+    hot_rows.account_ids.pop(public_id)
+    account_data = get_account_data(event_data)
     async with database.create_session() as session:
-        account, created = await get_or_create(session, Account, public_id=public_id, defaults=event_data)
-        if not created:
-            for field in account.dict():
-                if field in event_data:
-                    setattr(account, field, event_data[field])
+        await upsert(session, Account, account_data, MergePolicy.overwrite)
         await session.commit()
 
 
 @event_streaming.on_event('AccountRoleChanged')
 async def on_account_role_changed(event_name: str, event_version: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
+    public_id = event_data['public_id']
+    hot_rows.account_ids.pop(public_id)
     async with database.create_session() as session:
-        public_id = event_data['public_id']
-        account, _created = await get_or_create(session, Account, public_id=public_id)
-        account.role = AccountRole(event_data['role'])
+        account, _created = await upsert(
+            session, Account, {'public_id': public_id, 'role': AccountRole(event_data['role'])}, MergePolicy.overwrite,
+        )
         await session.commit()
-        await session.refresh(account)
     if account.role == AccountRole.worker:
         await initialize_account(account.public_id)
 
@@ -44,22 +56,19 @@ async def on_account_role_changed(event_name: str, event_version: int, event_dat
 @event_streaming.on_event('TaskCreated')
 @event_streaming.on_event('TaskUpdated')
 async def on_task_updated(event_name: str, event_version: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
     public_id = event_data['public_id']
+    hot_rows.task_prices.pop(public_id)
+    task_data = {'public_id': public_id}
+    description = get_task_description(event_version, event_data)
+    if description is not None:
+        task_data['description'] = description
     async with database.create_session() as session:
-        task, _created = await get_or_create(session, Task, public_id=public_id)
-        if event_version == 1:  # Drop support for v1 after releasing of v2-producer
-            task.description = f"{event_data['title']}\n{event_data['description']}"
-        elif event_version == 2:
-            jira_id = event_data['jira_id']
-            jira_prefix = jira_id and f'[{jira_id}] '
-            task.description = f"{jira_prefix}{event_data['title']}\n{event_data['description']}"
+        await upsert(session, Task, task_data, MergePolicy.overwrite)
         await session.commit()
 
 
 @event_streaming.on_event('TaskAdded')
 async def on_task_added(event_name: str, event_version: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
     public_id = event_data['task']
     await price_task(public_id)
 
@@ -67,12 +76,7 @@ async def on_task_added(event_name: str, event_version: int, event_data: Mapping
 @event_streaming.on_event('TaskAssigned')
 @event_streaming.on_event('TaskClosed')
 async def on_task_assigned(event_name: str, event_version: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
-    task = event_data['task']
-    await price_task(task)  # if TaskAdded is haven't gotten yet
-    account = event_data['assignee']
-    await initialize_account(account)
-    if event_name == 'TaskAssigned':
-        await charge_fee_for_task_assignment(task, account)
-    elif event_name == 'TaskClosed':
-        await assess_amount_for_task_closing(task, account)
+    # The task is priced and the account is initialized within the same transaction if it's needed
+    await apply_task_event(TaskEvent(
+        event_name, event_data['task'], event_data['assignee'], event_streaming.current_event_id.get(),
+    ))
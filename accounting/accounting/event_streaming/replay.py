@@ -0,0 +1,238 @@
+"""
+Rebuilds the accounting projection by replaying its topics in bulk, then hands over to the live consumer group.
+
+    python -m accounting.event_streaming.replay [--from-timestamp 2023-01-01T00:00:00 | --from-offset 0]
+                                                [--defer-indexes] [--no-handover]
+
+The live consumer has to be stopped for the time of the replay. Every partition is read from the given position up to
+its end offset taken at the start, then these offsets are committed for the live group, so the live consumer continues
+right after the replayed events. Kafka rejects the commit while members of the group are running.
+
+Events are not handled one by one as the live consumer does: they are read by large fetches, folded in memory by
+chunks and every chunk is written by a single transaction through COPY, see accounting.transactions.bulk_load.
+Task events claimed by the projection already are skipped, so a replay over an existing projection doesn't charge
+accounts twice. As billing cycles are closed and paid by the periodical tasks rather than by events, replayed charges
+go to the open cycle of the account, and prices of the tasks missing from the projection are set anew.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import struct
+import time
+from typing import AsyncIterator, Dict, List
+
+from aiokafka import AIOKafkaConsumer, ConsumerRecord, TopicPartition
+
+import event_streaming
+from event_streaming.encoding import EventCodec
+from event_streaming.schema_registry import SchemaRegistry, ValidationError
+from accounting import database
+from accounting.event_streaming import group, topics
+from accounting.event_streaming.handlers import get_account_data, get_task_description
+from accounting.models import AccountRole
+from accounting.transactions.bulk_load import (
+    ProjectionChunk, analyze_tables, create_indexes, drop_indexes, get_deferrable_indexes, write_chunk,
+)
+from accounting.transactions.tasks import TaskEvent
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+# Events the projection is built of, the rest are skipped as the live consumer has no handlers for them
+replayed_event_names = {
+    'AccountCreated', 'AccountUpdated', 'AccountRoleChanged', 'TaskCreated', 'TaskUpdated', 'TaskAdded',
+    'TaskAssigned', 'TaskClosed',
+}
+
+
+def fold_event(chunk: ProjectionChunk, message: dict):
+    event_name, event_version, event_data = message['event_name'], message.get('event_version', 1), message['data']
+    if event_name in ('AccountCreated', 'AccountUpdated'):
+        if not event_data.get('public_id'):
+            logger.warning('Invalid data of %s, public_id is required!', message.get('event_id'))
+            return
+        account_data = get_account_data(event_data)
+        if account_data.get('role'):
+            account_data['role'] = AccountRole(account_data['role'])
+        chunk.update_account(event_data['public_id'], account_data)
+    elif event_name == 'AccountRoleChanged':
+        chunk.change_role(event_data['public_id'], AccountRole(event_data['role']))
+    elif event_name in ('TaskCreated', 'TaskUpdated'):
+        description = get_task_description(event_version, event_data)
+        chunk.update_task(event_data['public_id'], {} if description is None else {'description': description})
+    elif event_name == 'TaskAdded':
+        chunk.price_task(event_data['task'])
+    elif event_name in ('TaskAssigned', 'TaskClosed'):
+        chunk.add_task_event(TaskEvent(event_name, event_data['task'], event_data['assignee'], message.get('event_id')))
+
+
+async def seek_partitions(
+    consumer: AIOKafkaConsumer,
+    from_timestamp: datetime.datetime | None,
+    from_offset: int | None,
+) -> Dict[TopicPartition, int]:
+    """Assigns all partitions of the topics to the consumer, returns their end offsets the replay stops at."""
+    await consumer.topics()  # metadata of the topics is fetched
+    partitions = [
+        TopicPartition(topic, partition) for topic in topics for partition in consumer.partitions_for_topic(topic) or ()
+    ]
+    consumer.assign(partitions)
+    end_offsets = await consumer.end_offsets(partitions)
+    if from_timestamp is not None:
+        offsets = await consumer.offsets_for_times({
+            partition: int(from_timestamp.timestamp() * 1000) for partition in partitions
+        })
+        for partition in partitions:
+            # Partitions without records since the timestamp have nothing to replay
+            offset_and_timestamp = offsets[partition]
+            offset = end_offsets[partition] if offset_and_timestamp is None else offset_and_timestamp.offset
+            consumer.seek(partition, offset)
+    elif from_offset is not None:
+        beginning_offsets = await consumer.beginning_offsets(partitions)
+        for partition in partitions:
+            consumer.seek(partition, min(max(from_offset, beginning_offsets[partition]), end_offsets[partition]))
+    else:
+        await consumer.seek_to_beginning(*partitions)
+    return end_offsets
+
+
+async def read_chunks(
+    consumer: AIOKafkaConsumer, end_offsets: Dict[TopicPartition, int], chunk_size: int,
+) -> AsyncIterator[List[ConsumerRecord]]:
+    remaining = set()
+    for partition, end_offset in end_offsets.items():
+        if await consumer.position(partition) < end_offset:
+            remaining.add(partition)
+    records: List[ConsumerRecord] = []
+    while remaining:
+        batch = await consumer.getmany(*remaining, timeout_ms=1000, max_records=chunk_size - len(records))
+        for partition, partition_records in batch.items():
+            records.extend(record for record in partition_records if record.offset < end_offsets[partition])
+            # Events produced since the start are left to the live consumer
+            if await consumer.position(partition) >= end_offsets[partition]:
+                remaining.discard(partition)
+        if len(records) >= chunk_size or (records and not remaining):
+            yield records
+            records = []
+
+
+async def hand_over(settings: event_streaming.Settings, end_offsets: Dict[TopicPartition, int]):
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=settings.bootstrap_servers,
+        group_id=group,
+        enable_auto_commit=False,
+    )
+    await consumer.start()
+    try:
+        consumer.assign(list(end_offsets))
+        await consumer.commit(end_offsets)
+    finally:
+        await consumer.stop()
+    logger.info('Offsets of %s are committed for group %s', ', '.join(topics), group)
+
+
+async def main(
+    from_timestamp: datetime.datetime | None,
+    from_offset: int | None,
+    chunk_size: int,
+    fetch_max_bytes: int,
+    max_partition_fetch_bytes: int,
+    defer_indexes: bool,
+    handover: bool,
+):
+    settings = event_streaming.Settings()
+    await database.setup(database.Settings(pool_size=1, max_overflow=0))
+    schema_registry = SchemaRegistry()
+    schema_registry.load_schemas(settings.schemas_directory)
+    codec = EventCodec(schema_registry)
+
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=settings.bootstrap_servers,
+        enable_auto_commit=False,
+        fetch_max_bytes=fetch_max_bytes,
+        max_partition_fetch_bytes=max_partition_fetch_bytes,
+        max_poll_records=chunk_size,
+    )
+    await consumer.start()
+    indexes = get_deferrable_indexes() if defer_indexes else []
+    replayed = skipped = processed_events = transactions = 0
+    started_at = time.perf_counter()
+    try:
+        end_offsets = await seek_partitions(consumer, from_timestamp, from_offset)
+        if indexes:
+            async with database.engine.begin() as connection:
+                await drop_indexes(connection, indexes)
+            logger.info('Indexes dropped till the end of the replay: %s', ', '.join(index.name for index in indexes))
+        async for records in read_chunks(consumer, end_offsets, chunk_size):
+            chunk = ProjectionChunk()
+            for record in records:
+                try:
+                    message = codec.decode(record.value, record.headers)
+                    if message['event_name'] not in replayed_event_names:
+                        continue
+                    if message.get('producer') not in settings.trusted_producers:
+                        schema_registry.validate_event(message['event_name'], message.get('event_version', 1), message)
+                    fold_event(chunk, message)
+                except (ValueError, TypeError, KeyError, struct.error, ValidationError) as error:
+                    logger.warning(
+                        'Message %s:%s@%s is skipped: %r', record.topic, record.partition, record.offset, error,
+                    )
+                    skipped += 1
+            async with database.engine.begin() as connection:
+                result = await write_chunk(connection, chunk)
+            replayed += len(records)
+            processed_events += result.processed_events
+            transactions += result.transactions
+            logger.info('Replayed %s events, %.0f events/s', replayed, replayed / (time.perf_counter() - started_at))
+    finally:
+        await consumer.stop()
+        if indexes:
+            index_started_at = time.perf_counter()
+            async with database.engine.begin() as connection:
+                await create_indexes(connection, indexes)
+            logger.info('Indexes are built in %.1fs', time.perf_counter() - index_started_at)
+    async with database.engine.begin() as connection:
+        await analyze_tables(connection)
+    elapsed = time.perf_counter() - started_at
+    logger.info(
+        'Replayed %s events in %.1fs (%.0f events/s): %s transactions, %s events processed before, %s invalid skipped',
+        replayed, elapsed, replayed / elapsed if elapsed else 0, transactions, processed_events, skipped,
+    )
+    if handover:
+        await hand_over(settings, end_offsets)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    start = parser.add_mutually_exclusive_group()
+    start.add_argument(
+        '--from-timestamp', type=datetime.datetime.fromisoformat,
+        help="Replay the events appended since this time (ISO format), the beginning of the topics by default.",
+    )
+    start.add_argument('--from-offset', type=int, help="Replay every partition from this offset.")
+    parser.add_argument('--chunk-size', type=int, default=10_000, help="Events written by a single transaction.")
+    parser.add_argument('--fetch-max-bytes', type=int, default=64 * 1024 * 1024, help="Data fetched by a request.")
+    parser.add_argument(
+        '--max-partition-fetch-bytes', type=int, default=8 * 1024 * 1024,
+        help="Data fetched from a partition by a request.",
+    )
+    parser.add_argument(
+        '--defer-indexes', action='store_true',
+        help="Drop the non-unique indexes of the projection for the time of the replay and build them at the end.",
+    )
+    parser.add_argument(
+        '--no-handover', dest='handover', action='store_false',
+        help="Leave the offsets of the live group as they are, e.g. when a projection is built aside.",
+    )
+    arguments = parser.parse_args()
+    asyncio.run(main(
+        arguments.from_timestamp,
+        arguments.from_offset,
+        arguments.chunk_size,
+        arguments.fetch_max_bytes,
+        arguments.max_partition_fetch_bytes,
+        arguments.defer_indexes,
+        arguments.handover,
+    ))
@@ -0,0 +1,131 @@
+"""
+Schema migrations of the accounting database.
+
+Every migration is explicit DDL. The baseline is the schema the service used to create out of its models before
+migrations were introduced, so it creates only the missing tables and every later migration is idempotent.
+"""
+from schema_migrations import Migration, create_indexes, execute
+
+migrations = [
+    Migration(1, 'baseline', execute(
+        '''
+        DO $$ BEGIN
+            CREATE TYPE accountrole AS ENUM ('admin', 'worker', 'manager');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+        ''',
+        '''
+        DO $$ BEGIN
+            CREATE TYPE billingcyclestatus AS ENUM ('open', 'closed');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+        ''',
+        '''
+        DO $$ BEGIN
+            CREATE TYPE paymentstatus AS ENUM ('pending', 'completed', 'failed');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS account (
+            role accountrole,
+            id SERIAL NOT NULL PRIMARY KEY,
+            public_id VARCHAR NOT NULL UNIQUE,
+            email VARCHAR NOT NULL,
+            full_name VARCHAR NOT NULL,
+            balance INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS job_checkpoint (
+            name VARCHAR NOT NULL PRIMARY KEY,
+            started_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            last_account_id INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS task (
+            id SERIAL NOT NULL PRIMARY KEY,
+            public_id VARCHAR NOT NULL UNIQUE,
+            description VARCHAR NOT NULL,
+            assignment_cost INTEGER,
+            closing_cost INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS billing_cycle (
+            status billingcyclestatus,
+            id SERIAL NOT NULL PRIMARY KEY,
+            account_id INTEGER NOT NULL REFERENCES account (id),
+            opened_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            closed_at TIMESTAMP WITHOUT TIME ZONE,
+            debit INTEGER NOT NULL,
+            credit INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS "transaction" (
+            id SERIAL NOT NULL PRIMARY KEY,
+            date TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            billing_cycle_id INTEGER NOT NULL REFERENCES billing_cycle (id),
+            debit INTEGER NOT NULL,
+            credit INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS payment (
+            status paymentstatus,
+            id SERIAL NOT NULL PRIMARY KEY,
+            transaction_id INTEGER NOT NULL REFERENCES "transaction" (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS task_assignment (
+            id SERIAL NOT NULL PRIMARY KEY,
+            transaction_id INTEGER NOT NULL REFERENCES "transaction" (id),
+            task_id INTEGER NOT NULL REFERENCES task (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS task_closing (
+            id SERIAL NOT NULL PRIMARY KEY,
+            transaction_id INTEGER NOT NULL REFERENCES "transaction" (id),
+            task_id INTEGER NOT NULL REFERENCES task (id)
+        )
+        ''',
+    )),
+    Migration(2, 'running totals of billing cycles', execute(
+        'ALTER TABLE billing_cycle ADD COLUMN IF NOT EXISTS debit INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE billing_cycle ADD COLUMN IF NOT EXISTS credit INTEGER NOT NULL DEFAULT 0',
+        '''
+        UPDATE billing_cycle SET debit = totals.debit, credit = totals.credit
+        FROM (
+            SELECT billing_cycle_id, sum(debit) AS debit, sum(credit) AS credit
+            FROM "transaction" GROUP BY billing_cycle_id
+        ) AS totals
+        WHERE totals.billing_cycle_id = billing_cycle.id
+        ''',
+    )),
+    Migration(3, 'indexes of hot query paths', create_indexes(
+        'CREATE INDEX ix_account_role ON account (role)',
+        'CREATE INDEX ix_billing_cycle_account_id_status ON billing_cycle (account_id, status)',
+        # Fails if an account already has several open cycles, they have to be merged by hand first
+        "CREATE UNIQUE INDEX uq_billing_cycle_open_account_id ON billing_cycle (account_id) WHERE status = 'open'",
+        'CREATE INDEX ix_transaction_billing_cycle_id ON "transaction" (billing_cycle_id)',
+        "CREATE INDEX ix_payment_pending_id ON payment (id) WHERE status = 'pending'",
+    ), transactional=False),
+    Migration(4, 'processed events', execute(
+        '''
+        CREATE TABLE IF NOT EXISTS processed_event (
+            event_id VARCHAR NOT NULL PRIMARY KEY,
+            processed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        )
+        ''',
+    )),
+    Migration(5, 'failed accounts of job checkpoints', execute(
+        "ALTER TABLE job_checkpoint ADD COLUMN IF NOT EXISTS failed_accounts VARCHAR[] NOT NULL DEFAULT '{}'",
+    )),
+    Migration(6, 'processed events retention', create_indexes(
+        'CREATE INDEX ix_processed_event_processed_at ON processed_event (processed_at)',
+    ), transactional=False),
+]
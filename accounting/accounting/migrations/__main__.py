@@ -0,0 +1,14 @@
+import asyncio
+import logging
+
+from schema_migrations import SchemaMode
+from accounting import database
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    await database.setup(database.Settings(schema_mode=SchemaMode.migrate))
+    await database.engine.dispose()
+
+asyncio.run(main())
@@ -1,7 +1,10 @@
 import enum
 import datetime
 import random
+from typing import List
 
+from sqlalchemy import Index, String, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlmodel import Field, Column, SQLModel, Enum, UniqueConstraint
 
 
@@ -16,7 +19,7 @@ class Account(SQLModel, table=True):
     public_id: str = Field(sa_column_kwargs={'unique': True})
     email: str = Field(default='')
     full_name: str = Field(default='')
-    role: AccountRole | None = Field(sa_column=Column('role', Enum(AccountRole)))
+    role: AccountRole | None = Field(sa_column=Column('role', Enum(AccountRole), index=True))
     balance: int = Field(default=0)
 
 
@@ -49,13 +52,27 @@ class BillingCycleStatus(enum.Enum):
     closed = 'closed'
 
 
+# Predicate of the unique index of open cycles, a statement inferring the index states it literally
+open_billing_cycle_predicate = text("status = 'open'")
+
+
 class BillingCycle(SQLModel, table=True):
     __tablename__ = 'billing_cycle'
+    __table_args__ = (
+        Index('ix_billing_cycle_account_id_status', 'account_id', 'status'),
+        # An account has a single open billing cycle at a time
+        Index(
+            'uq_billing_cycle_open_account_id', 'account_id',
+            unique=True, postgresql_where=open_billing_cycle_predicate,
+        ),
+    )
     id: int | None = Field(primary_key=True)
     status = Field(default=BillingCycleStatus.open, sa_column=Column('status', Enum(BillingCycleStatus)))
     account_id: int = Field(foreign_key='account.id')
     opened_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
     closed_at: datetime.datetime | None
+    debit: int = Field(default=0, description="Running total of debit of the cycle transactions in cents.")
+    credit: int = Field(default=0, description="Running total of credit of the cycle transactions in cents.")
 
     def close(self):
         self.status = BillingCycleStatus.closed
@@ -65,7 +82,7 @@ class BillingCycle(SQLModel, table=True):
 class Transaction(SQLModel, table=True):
     id: int | None = Field(primary_key=True)
     date: datetime.datetime = Field(default_factory=datetime.datetime.now)
-    billing_cycle_id: int = Field(foreign_key='billing_cycle.id')
+    billing_cycle_id: int = Field(foreign_key='billing_cycle.id', index=True)
     debit: int
     credit: int
 
@@ -91,6 +108,28 @@ class PaymentStatus(enum.Enum):
 
 
 class Payment(SQLModel, table=True):
+    __table_args__ = (
+        Index('ix_payment_pending_id', 'id', postgresql_where=text("status = 'pending'")),
+    )
     id: int | None = Field(primary_key=True)
     transaction_id: int = Field(foreign_key='transaction.id')
     status: PaymentStatus = Field(default=PaymentStatus.pending, sa_column=Column('status', Enum(PaymentStatus)))
+
+
+class JobCheckpoint(SQLModel, table=True):
+    __tablename__ = 'job_checkpoint'
+    name: str = Field(primary_key=True)
+    started_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    last_account_id: int = Field(default=0)
+    # Accounts whose billing cycle failed to close, they are retried at the end of the run
+    failed_accounts: List[str] = Field(
+        default_factory=list,
+        sa_column=Column('failed_accounts', ARRAY(String), nullable=False, server_default='{}'),
+    )
+
+
+class ProcessedEvent(SQLModel, table=True):
+    __tablename__ = 'processed_event'
+    event_id: str = Field(primary_key=True)
+    # Events can't be redelivered once the topic retention has passed, their IDs are pruned by processed_at
+    processed_at: datetime.datetime = Field(default_factory=datetime.datetime.now, index=True)
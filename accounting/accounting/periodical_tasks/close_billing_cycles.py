@@ -1,24 +1,134 @@
+import argparse
 import asyncio
+import datetime
 import logging
+import statistics
+import time
+from typing import List, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import and_, asc, select
 
 from accounting import database
-from accounting.models import Account
+from accounting.models import Account, BillingCycle, BillingCycleStatus, JobCheckpoint
 from accounting.transactions.billing import close_current_billing_cycle
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+job_name = 'close_billing_cycles'
 
-async def main():
-    await database.setup(database.Settings())
+
+async def start_checkpoint(restart: bool) -> JobCheckpoint:
+    async with database.create_session() as session:
+        checkpoint: JobCheckpoint | None = await session.get(JobCheckpoint, job_name)
+        if checkpoint and checkpoint.started_at.date() != datetime.date.today():
+            # Cycles opened since the stale run started would be taken for cycles opened by this run
+            logger.warning('Discarding the checkpoint of the unfinished run started at %s', checkpoint.started_at)
+            restart = True
+        if checkpoint and not restart:
+            logger.info('Resuming the run started at %s after account %s', checkpoint.started_at, checkpoint.last_account_id)
+            return checkpoint
+        if checkpoint:
+            await session.delete(checkpoint)
+            await session.flush()
+        checkpoint = JobCheckpoint(name=job_name)
+        session.add(checkpoint)
+        await session.commit()
+    return checkpoint
+
+
+async def save_checkpoint(checkpoint: JobCheckpoint):
+    async with database.create_session() as session:
+        await session.merge(checkpoint)
+        await session.commit()
+
+
+async def finish_checkpoint(checkpoint: JobCheckpoint):
+    async with database.create_session() as session:
+        await session.delete(await session.merge(checkpoint))
+        await session.commit()
+
+
+async def fetch_accounts_chunk(last_account_id: int, chunk_size: int) -> List[Tuple[int, str]]:
     async with database.create_session() as session:
-        accounts = (await session.execute(select(Account))).scalars().all()
-    for account in accounts:
-        logger.info('Closing billing cycle for %s', account)
-        await close_current_billing_cycle(account.public_id)
+        return (await session.execute(
+            select(Account.id, Account.public_id).join(
+                BillingCycle,
+                and_(BillingCycle.account_id == Account.id, BillingCycle.status == BillingCycleStatus.open),
+            ).where(
+                Account.id > last_account_id,
+            ).order_by(asc(Account.id)).limit(chunk_size)
+        )).all()
+
+
+async def main(concurrency: int, chunk_size: int, verify: bool, restart: bool):
+    await database.setup(database.Settings(pool_size=concurrency, max_overflow=0))
+    checkpoint = await start_checkpoint(restart)
+    slots = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    skipped = 0
+
+    async def close_billing_cycle(account_public_id: str) -> bool:
+        nonlocal skipped
+        async with slots:
+            started_at = time.perf_counter()
+            try:
+                # Cycles opened by this run (e.g. before a crash) are not closed again
+                closed = await close_current_billing_cycle(
+                    account_public_id, verify=verify, opened_before=checkpoint.started_at,
+                )
+            except Exception:
+                logger.exception('Closing billing cycle for %s failed', account_public_id)
+                return False
+            latencies.append(time.perf_counter() - started_at)
+            skipped += not closed
+            return True
+
+    async def close_billing_cycles(account_public_ids: List[str]) -> List[str]:
+        results = await asyncio.gather(*(close_billing_cycle(public_id) for public_id in account_public_ids))
+        return [public_id for public_id, succeeded in zip(account_public_ids, results) if not succeeded]
+
+    started_at = time.perf_counter()
+    while accounts := await fetch_accounts_chunk(checkpoint.last_account_id, chunk_size):
+        failed_accounts = await close_billing_cycles([public_id for _, public_id in accounts])
+        checkpoint.last_account_id = accounts[-1][0]
+        # Failed accounts are kept with the checkpoint, so they are not lost if the run crashes before retrying them
+        checkpoint.failed_accounts = [*checkpoint.failed_accounts, *failed_accounts]
+        await save_checkpoint(checkpoint)
+        logger.info('Billing cycles are closed up to account %s', checkpoint.last_account_id)
+    if checkpoint.failed_accounts:
+        logger.info('Retrying %s failed accounts', len(checkpoint.failed_accounts))
+        checkpoint.failed_accounts = await close_billing_cycles(checkpoint.failed_accounts)
+    elapsed = time.perf_counter() - started_at
+    failed_accounts = checkpoint.failed_accounts
+    if failed_accounts:
+        # The run is not finished, running the job again today retries the failed accounts only
+        await save_checkpoint(checkpoint)
+    else:
+        await finish_checkpoint(checkpoint)
+
+    logger.info(
+        'Closed %s billing cycles in %.1fs (%.1f accounts/s), %s skipped, %s failed',
+        len(latencies) - skipped, elapsed, len(latencies) / elapsed if elapsed else 0, skipped, len(failed_accounts),
+    )
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        logger.info(
+            'Per-account latency: p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms',
+            quantiles[49] * 1000, quantiles[94] * 1000, quantiles[98] * 1000, max(latencies) * 1000,
+        )
+    if failed_accounts:
+        logger.error('Billing cycles of these accounts are not closed: %s', ', '.join(failed_accounts))
 
 
 if __name__ == '__main__':
-    asyncio.run(main(), debug=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=8, help="Billing cycles closed at the same time.")
+    parser.add_argument('--chunk-size', type=int, default=500, help="Accounts fetched and checkpointed at once.")
+    parser.add_argument(
+        '--verify', action='store_true',
+        help="Recompute billing cycle totals from transactions to detect drift of the running totals.",
+    )
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an unfinished run.")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.concurrency, arguments.chunk_size, arguments.verify, arguments.restart))
@@ -1,53 +1,23 @@
+import argparse
 import asyncio
 import logging
 
-from sqlalchemy import select
-
 from accounting import database
-from accounting.models import Account, Payment, PaymentStatus, Transaction, BillingCycle
+from accounting.transactions.payouts import LoggingPayoutBackend, pay_pending_payments
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 
-async def main():
-    await database.setup(database.Settings())
-    async with database.create_session() as session:
-        pending_payment_ids = (await session.execute(
-            select(Payment.id).where(Payment.status == PaymentStatus.pending)
-        )).scalars().all()
-    for payment_id in pending_payment_ids:
-        async with database.create_session() as session:
-            payment, transaction, billing_cycle, account = (await session.execute(
-                select(
-                    Payment,
-                    Transaction,
-                    BillingCycle,
-                    Account,
-                ).join(
-                    Transaction, onclause=Transaction.id == Payment.transaction_id,
-                ).join(
-                    BillingCycle, onclause=BillingCycle.id == Transaction.billing_cycle_id,
-                ).join(
-                    Account, onclause=Account.id == BillingCycle.account_id,
-                ).where(
-                    Payment.id == payment_id,
-                    Payment.status == PaymentStatus.pending,
-                ).with_for_update(
-                    of=Payment,
-                )
-            )).one()
-        logger.info(
-            'Pay %s$ to %s for %s - %s',
-            (transaction.credit - transaction.debit) / 100,
-            account.full_name,
-            billing_cycle.opened_at,
-            billing_cycle.closed_at,
-        )
-        payment.status = PaymentStatus.completed
-        session.add(payment)
-        await session.commit()
+async def main(batch_size: int, workers: int):
+    await database.setup(database.Settings(pool_size=workers, max_overflow=0))
+    processed = await pay_pending_payments(LoggingPayoutBackend(), batch_size, workers)
+    logger.info('%s payments processed', processed)
 
 
 if __name__ == '__main__':
-    asyncio.run(main(), debug=True)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=100, help="Payments claimed by a worker at once.")
+    parser.add_argument('--workers', type=int, default=4, help="Batches processed at the same time.")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.batch_size, arguments.workers))
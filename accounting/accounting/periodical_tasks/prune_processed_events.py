@@ -0,0 +1,49 @@
+import argparse
+import asyncio
+import datetime
+import logging
+
+from sqlalchemy import delete, select
+
+from accounting import database
+from accounting.models import ProcessedEvent
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+async def prune_batch(processed_before: datetime.datetime, batch_size: int) -> int:
+    async with database.create_session() as session:
+        # Rows are deleted by batches, so every transaction locks a few of them only
+        result = await session.execute(
+            delete(ProcessedEvent).where(
+                ProcessedEvent.event_id.in_(
+                    select(ProcessedEvent.event_id).where(
+                        ProcessedEvent.processed_at < processed_before,
+                    ).limit(batch_size).scalar_subquery()
+                ),
+            ).execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    return result.rowcount
+
+
+async def main(retention_days: float, batch_size: int):
+    await database.setup(database.Settings())
+    # IDs of events older than the topic retention are not needed, such events can't be redelivered anymore
+    processed_before = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    pruned = 0
+    while batch_pruned := await prune_batch(processed_before, batch_size):
+        pruned += batch_pruned
+    logger.info('%s processed events before %s are pruned', pruned, processed_before)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--retention-days', type=float, default=7,
+        help="Retention of the consumed topics, IDs of events processed earlier are deleted.",
+    )
+    parser.add_argument('--batch-size', type=int, default=10000, help="Rows deleted by a transaction.")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.retention_days, arguments.batch_size))
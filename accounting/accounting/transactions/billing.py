@@ -1,26 +1,51 @@
 from contextlib import asynccontextmanager
 import dataclasses
-from typing import AsyncContextManager, Iterable
+import datetime
+import logging
+from typing import AsyncContextManager, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from upserts import upsert
 
 from accounting import database
-from accounting.models import Account, BillingCycle, BillingCycleStatus, Transaction, Payment
-from accounting.transactions.utils import get_or_create
+from accounting.cache import hot_rows
+from accounting.models import (
+    Account, BillingCycle, BillingCycleStatus, Transaction, Payment, open_billing_cycle_predicate,
+)
+
+logger = logging.getLogger(__name__)
 
 
 async def initialize_account(account_public_id: str):
+    account_id = hot_rows.account_ids.get(account_public_id)
+    if account_id is not None and hot_rows.open_billing_cycle_ids.get(account_id) is not None:
+        return
     async with database.create_session() as init_session:
-        account, account_created = await get_or_create(init_session, Account, public_id=account_public_id)
-        if account_created:
-            await init_session.commit()
-            await init_session.refresh(account)
-        billing_cycle, billing_cycle_created = (
-            await get_or_create(init_session, BillingCycle, account_id=account.id, status=BillingCycleStatus.open)
+        account, _account_created = await upsert(init_session, Account, {'public_id': account_public_id})
+        # A cycle opened concurrently by another handler is kept, the unique index of open cycles settles the race
+        await init_session.execute(
+            insert(BillingCycle).values(
+                account_id=account.id,
+                status=BillingCycleStatus.open,
+                opened_at=datetime.datetime.now(),
+                debit=0,
+                credit=0,
+            ).on_conflict_do_nothing(
+                index_elements=[BillingCycle.account_id],
+                index_where=open_billing_cycle_predicate,
+            )
         )
-        if billing_cycle_created:
-            await init_session.commit()
-            await init_session.refresh(billing_cycle)
+        billing_cycle_id = (await init_session.execute(
+            select(BillingCycle.id).where(
+                BillingCycle.account_id == account.id,
+                BillingCycle.status == BillingCycleStatus.open,
+            )
+        )).scalar_one()
+        await init_session.commit()
+    hot_rows.account_ids.set(account_public_id, account.id)
+    hot_rows.open_billing_cycle_ids.set(account.id, billing_cycle_id)
 
 
 @dataclasses.dataclass
@@ -36,45 +61,79 @@ class BillingTransactionContext:
             credit=credit,
         )
         self.session.add(transaction)
-        await self.session.flush([transaction])
+        # The billing cycle row is locked by billing_transaction(), so its totals can be updated in place
+        self.billing_cycle.debit += debit
+        self.billing_cycle.credit += credit
+        await self.session.flush([transaction, self.billing_cycle])
         await self.session.refresh(transaction)
         return transaction
 
 
 @asynccontextmanager
 async def billing_transaction(account_public_id: str) -> AsyncContextManager[BillingTransactionContext]:
+    query = select(BillingCycle, Account).join(Account).where(BillingCycle.status == BillingCycleStatus.open)
+    account_id = hot_rows.account_ids.get(account_public_id)
+    billing_cycle_id = hot_rows.open_billing_cycle_ids.get(account_id) if account_id is not None else None
     async with database.create_session() as session:
-        billing_cycle, account = (await session.execute(
-            select(
-                BillingCycle,
-                Account,
-            ).join(Account).where(
-                BillingCycle.status == BillingCycleStatus.open,
-                Account.public_id == account_public_id,
-            ).with_for_update()
-        )).one()
+        row = None
+        if billing_cycle_id is not None:
+            row = (await session.execute(
+                query.where(BillingCycle.id == billing_cycle_id).with_for_update()
+            )).one_or_none()
+            if row is None:  # the cached cycle has been closed since then
+                hot_rows.open_billing_cycle_ids.pop(account_id)
+        if row is None:
+            row = (await session.execute(
+                query.where(Account.public_id == account_public_id).with_for_update()
+            )).one()
+        billing_cycle, account = row
+        hot_rows.account_ids.set(account_public_id, account.id)
+        hot_rows.open_billing_cycle_ids.set(account.id, billing_cycle.id)
         yield BillingTransactionContext(session, account, billing_cycle)
 
 
-async def close_current_billing_cycle(account_public_id: str):
+async def compute_billing_cycle_totals(session: database.AsyncSession, billing_cycle_id: int) -> Tuple[int, int]:
+    debit, credit = (await session.execute(
+        select(
+            func.coalesce(func.sum(Transaction.debit), 0),
+            func.coalesce(func.sum(Transaction.credit), 0),
+        ).where(
+            Transaction.billing_cycle_id == billing_cycle_id,
+        )
+    )).one()
+    return debit, credit
+
+
+async def verify_billing_cycle_totals(billing_context: BillingTransactionContext):
+    billing_cycle = billing_context.billing_cycle
+    debit, credit = await compute_billing_cycle_totals(billing_context.session, billing_cycle.id)
+    if (debit, credit) != (billing_cycle.debit, billing_cycle.credit):
+        logger.error(
+            'Totals of billing cycle %s drifted: debit %s != %s, credit %s != %s, the computed ones are used',
+            billing_cycle.id, billing_cycle.debit, debit, billing_cycle.credit, credit,
+        )
+        billing_cycle.debit, billing_cycle.credit = debit, credit
+
+
+async def close_current_billing_cycle(
+    account_public_id: str,
+    verify: bool = False,
+    opened_before: datetime.datetime | None = None,
+) -> bool:
     async with billing_transaction(account_public_id) as billing_context:
+        if opened_before and billing_context.billing_cycle.opened_at >= opened_before:
+            return False
+        if verify:
+            await verify_billing_cycle_totals(billing_context)
         billing_context.billing_cycle.close()
-        billing_context.session.add(BillingCycle(account_id=billing_context.account.id))
-        billing_cycle_transactions: Iterable[Transaction] = (
-            await billing_context.session.execute(
-                select(Transaction).where(
-                    Transaction.billing_cycle_id == billing_context.billing_cycle.id,
-                )
-            )
-        ).scalars().all()
-        debit, credit = 0, 0
-        for billing_cycle_transaction in billing_cycle_transactions:
-            debit += billing_cycle_transaction.debit
-            credit += billing_cycle_transaction.credit
-        billing_cycle_delta = debit - credit
+        next_billing_cycle = BillingCycle(account_id=billing_context.account.id)
+        billing_context.session.add(next_billing_cycle)
+        billing_cycle_delta = billing_context.billing_cycle.debit - billing_context.billing_cycle.credit
         billing_context.account.balance += billing_cycle_delta
         if billing_context.account.balance > 0:
             payment_transaction = await billing_context.create_transaction(0, billing_context.account.balance)
             billing_context.session.add(Payment(transaction_id=payment_transaction.id))
             billing_context.account.balance = 0
         await billing_context.session.commit()
+    hot_rows.open_billing_cycle_ids.set(billing_context.account.id, next_billing_cycle.id)
+    return True
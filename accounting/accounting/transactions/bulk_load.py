@@ -0,0 +1,270 @@
+"""
+Bulk write path of the projection, used to rebuild it out of replayed events.
+
+Events are folded in memory into a ProjectionChunk, so every row is written once per chunk, and the chunk is written
+by a single transaction: its rows are copied into temporary tables with COPY and merged into the projection by a few
+set-based statements. Only PostgreSQL (asyncpg) is supported. The live consumer must not write at the same time,
+as the rows missing from the projection are inserted without locking.
+"""
+from collections import defaultdict
+import dataclasses
+import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Sequence, Set, Tuple
+
+from sqlalchemy import Index, bindparam, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from accounting.cache import TaskPrice
+from accounting.models import (
+    Account, AccountRole, BillingCycle, BillingCycleStatus, ProcessedEvent, Task, TaskAssignment, TaskClosing,
+    Transaction,
+)
+from accounting.transactions.tasks import TaskEvent, select_claimed_events
+
+# Tables written by the bulk load, their non-unique indexes may be dropped for its time
+bulk_loaded_tables = [
+    model.__table__ for model in (Account, Task, BillingCycle, Transaction, TaskAssignment, TaskClosing, ProcessedEvent)
+]
+
+
+@dataclasses.dataclass
+class ProjectionChunk:
+    """
+    Effects of a chunk of events on the projection: the latest values of accounts and tasks, accounts given
+    the worker role, and charges.
+    """
+    accounts: Dict[str, Dict[str, Any]] = dataclasses.field(default_factory=dict)
+    new_workers: Set[str] = dataclasses.field(default_factory=set)
+    tasks: Dict[str, Dict[str, Any]] = dataclasses.field(default_factory=dict)
+    task_events: List[TaskEvent] = dataclasses.field(default_factory=list)
+
+    def update_account(self, public_id: str, values: Mapping[str, Any]):
+        # Null values are taken as missing ones, the account columns are not nullable
+        self.accounts.setdefault(public_id, {}).update(
+            (field, value) for field, value in values.items() if value is not None and field != 'public_id'
+        )
+
+    def change_role(self, public_id: str, role: AccountRole):
+        self.update_account(public_id, {'role': role})
+        # The live handler opens a cycle once the role is changed to worker, the role given by AccountCreated doesn't
+        if role == AccountRole.worker:
+            self.new_workers.add(public_id)
+
+    def update_task(self, public_id: str, values: Mapping[str, Any]):
+        self.tasks.setdefault(public_id, {}).update(values)
+
+    def price_task(self, public_id: str):
+        # Prices of a task never change once they are set, the stored ones are kept by write_chunk() as well
+        task_values = self.tasks.setdefault(public_id, {})
+        if 'assignment_cost' not in task_values:
+            task = Task(public_id=public_id)
+            task.price()
+            task_values.update(assignment_cost=task.assignment_cost, closing_cost=task.closing_cost)
+
+    def add_task_event(self, event: TaskEvent):
+        self.price_task(event.task_public_id)
+        self.update_account(event.account_public_id, {})
+        self.task_events.append(event)
+
+
+@dataclasses.dataclass
+class ChunkResult:
+    transactions: int = 0
+    # Task events applied before, by the live consumer or by an interrupted replay
+    processed_events: int = 0
+
+
+async def _copy_records(connection: AsyncConnection, table_name: str, columns: Sequence[str], records: List[tuple]):
+    driver_connection = (await connection.get_raw_connection()).driver_connection
+    await driver_connection.copy_records_to_table(table_name, records=records, columns=list(columns))
+
+
+async def _stage(connection: AsyncConnection, name: str, columns: Mapping[str, str], records: Iterable[tuple]):
+    # Staged rows live in a temporary table until the end of the transaction
+    column_definitions = ', '.join(f'{column} {column_type}' for column, column_type in columns.items())
+    await connection.execute(text(f'CREATE TEMPORARY TABLE {name} ({column_definitions}) ON COMMIT DROP'))
+    await _copy_records(connection, name, list(columns), list(records))
+
+
+async def _merge_accounts(connection: AsyncConnection, accounts: Mapping[str, Mapping[str, Any]]) -> Dict[str, int]:
+    if not accounts:
+        return {}
+    role_type = Account.__table__.c.role.type.name
+    await _stage(
+        connection,
+        'staged_account',
+        {'public_id': 'text', 'email': 'text', 'full_name': 'text', 'role': 'text'},
+        (
+            (public_id, values.get('email'), values.get('full_name'), values['role'].name if 'role' in values else None)
+            for public_id, values in accounts.items()
+        ),
+    )
+    await connection.execute(text(f'''
+        UPDATE account SET
+            email = coalesce(staged.email, account.email),
+            full_name = coalesce(staged.full_name, account.full_name),
+            role = coalesce(staged.role::{role_type}, account.role)
+        FROM staged_account AS staged
+        WHERE account.public_id = staged.public_id
+    '''))
+    await connection.execute(text(f'''
+        INSERT INTO account (public_id, email, full_name, role, balance)
+        SELECT public_id, coalesce(email, ''), coalesce(full_name, ''), role::{role_type}, 0 FROM staged_account
+        ON CONFLICT (public_id) DO NOTHING
+    '''))
+    return dict((await connection.execute(text(
+        'SELECT public_id, account.id FROM account JOIN staged_account USING (public_id)'
+    ))).all())
+
+
+async def _merge_tasks(connection: AsyncConnection, tasks: Mapping[str, Mapping[str, Any]]) -> Dict[str, TaskPrice]:
+    if not tasks:
+        return {}
+    await _stage(
+        connection,
+        'staged_task',
+        {'public_id': 'text', 'description': 'text', 'assignment_cost': 'integer', 'closing_cost': 'integer'},
+        (
+            (public_id, values.get('description'), values.get('assignment_cost'), values.get('closing_cost'))
+            for public_id, values in tasks.items()
+        ),
+    )
+    await connection.execute(text('''
+        UPDATE task SET
+            description = coalesce(staged.description, task.description),
+            assignment_cost = coalesce(task.assignment_cost, staged.assignment_cost),
+            closing_cost = coalesce(task.closing_cost, staged.closing_cost)
+        FROM staged_task AS staged
+        WHERE task.public_id = staged.public_id
+    '''))
+    await connection.execute(text('''
+        INSERT INTO task (public_id, description, assignment_cost, closing_cost)
+        SELECT public_id, coalesce(description, ''), assignment_cost, closing_cost FROM staged_task
+        ON CONFLICT (public_id) DO NOTHING
+    '''))
+    return {
+        public_id: TaskPrice(id, assignment_cost, closing_cost)
+        for public_id, id, assignment_cost, closing_cost in (await connection.execute(text('''
+            SELECT public_id, task.id, task.assignment_cost, task.closing_cost
+            FROM task JOIN staged_task USING (public_id)
+        '''))).all()
+    }
+
+
+async def _claim_events(connection: AsyncConnection, event_ids: Set[str]) -> Set[str]:
+    if not event_ids:
+        return set()
+    await _stage(connection, 'staged_event', {'event_id': 'text'}, ((event_id,) for event_id in event_ids))
+    return set((await connection.execute(text('''
+        INSERT INTO processed_event (event_id, processed_at) SELECT event_id, now() FROM staged_event
+        ON CONFLICT (event_id) DO NOTHING
+        RETURNING event_id
+    '''))).scalars().all())
+
+
+async def _open_billing_cycle_ids(connection: AsyncConnection, account_ids: Set[int]) -> Dict[int, int]:
+    if not account_ids:
+        return {}
+    status_type = BillingCycle.__table__.c.status.type.name
+    account_ids = sorted(account_ids)
+    # Accounts without an open cycle get one, it's the cycle the replayed charges go to
+    await connection.execute(text(f'''
+        INSERT INTO billing_cycle (account_id, status, opened_at, debit, credit)
+        SELECT account_id, '{BillingCycleStatus.open.name}'::{status_type}, now(), 0, 0
+        FROM unnest(CAST(:account_ids AS integer[])) AS account_id
+        ON CONFLICT (account_id) WHERE status = '{BillingCycleStatus.open.name}' DO NOTHING
+    '''), {'account_ids': account_ids})
+    return dict((await connection.execute(text(f'''
+        SELECT account_id, id FROM billing_cycle
+        WHERE status = '{BillingCycleStatus.open.name}' AND account_id = ANY(CAST(:account_ids AS integer[]))
+    '''), {'account_ids': account_ids})).all())
+
+
+async def _allocate_transaction_ids(connection: AsyncConnection, count: int) -> List[int]:
+    # IDs are taken from the sequence beforehand, so the transactions and their links are copied at once
+    return (await connection.execute(text(
+        "SELECT nextval(pg_get_serial_sequence('\"transaction\"', 'id')) FROM generate_series(1, :count)"
+    ), {'count': count})).scalars().all()
+
+
+async def write_chunk(connection: AsyncConnection, chunk: ProjectionChunk) -> ChunkResult:
+    """Writes the chunk within the transaction of the connection, the caller commits it."""
+    # A crash loses the latest chunks at worst, they are replayed again as their offsets are not committed yet
+    await connection.execute(text('SET LOCAL synchronous_commit = off'))
+    account_ids = await _merge_accounts(connection, chunk.accounts)
+    task_prices = await _merge_tasks(connection, chunk.tasks)
+    claimed_event_ids = await _claim_events(
+        connection, {event.event_id for event in chunk.task_events if event.event_id},
+    )
+    events = select_claimed_events(chunk.task_events, claimed_event_ids)
+    result = ChunkResult(processed_events=len(chunk.task_events) - len(events))
+
+    # Workers get an open billing cycle when they are given the role, as the live handler does
+    billing_cycle_ids = await _open_billing_cycle_ids(
+        connection,
+        {account_ids[event.account_public_id] for event in events} | {
+            account_ids[public_id] for public_id in chunk.new_workers
+        },
+    )
+    if not events:
+        return result
+    transaction_ids = await _allocate_transaction_ids(connection, len(events))
+    transaction_date = datetime.datetime.now()
+    transactions, task_assignments, task_closings = [], [], []
+    billing_cycle_totals: Dict[int, Tuple[int, int]] = defaultdict(lambda: (0, 0))
+    for transaction_id, event in zip(transaction_ids, events):
+        task_price = task_prices[event.task_public_id]
+        billing_cycle_id = billing_cycle_ids[account_ids[event.account_public_id]]
+        if event.name == 'TaskAssigned':
+            debit, credit, links = 0, task_price.assignment_cost, task_assignments
+        elif event.name == 'TaskClosed':
+            debit, credit, links = task_price.closing_cost, 0, task_closings
+        else:
+            raise ValueError(f'Unsupported task event: {event.name}')
+        transactions.append((transaction_id, transaction_date, billing_cycle_id, debit, credit))
+        links.append((transaction_id, task_price.id))
+        billing_cycle_debit, billing_cycle_credit = billing_cycle_totals[billing_cycle_id]
+        billing_cycle_totals[billing_cycle_id] = billing_cycle_debit + debit, billing_cycle_credit + credit
+    await _copy_records(
+        connection, Transaction.__tablename__, ['id', 'date', 'billing_cycle_id', 'debit', 'credit'], transactions,
+    )
+    for link_model, link_records in ((TaskAssignment, task_assignments), (TaskClosing, task_closings)):
+        if link_records:
+            await _copy_records(connection, link_model.__tablename__, ['transaction_id', 'task_id'], link_records)
+    billing_cycle_table = BillingCycle.__table__
+    await connection.execute(
+        billing_cycle_table.update().where(
+            billing_cycle_table.c.id == bindparam('billing_cycle_id'),
+        ).values(
+            debit=billing_cycle_table.c.debit + bindparam('debit_delta'),
+            credit=billing_cycle_table.c.credit + bindparam('credit_delta'),
+        ),
+        [
+            {'billing_cycle_id': billing_cycle_id, 'debit_delta': debit, 'credit_delta': credit}
+            for billing_cycle_id, (debit, credit) in billing_cycle_totals.items()
+        ],
+    )
+    result.transactions = len(transactions)
+    return result
+
+
+def get_deferrable_indexes() -> List[Index]:
+    # Unique indexes are kept, the merge statements rely on them
+    return [index for table in bulk_loaded_tables for index in table.indexes if not index.unique]
+
+
+async def drop_indexes(connection: AsyncConnection, indexes: Sequence[Index]):
+    preparer = connection.dialect.identifier_preparer
+    for index in indexes:
+        await connection.execute(text(f'DROP INDEX IF EXISTS {preparer.quote(index.name)}'))
+
+
+async def create_indexes(connection: AsyncConnection, indexes: Sequence[Index]):
+    for index in indexes:
+        await connection.run_sync(index.create, checkfirst=True)
+
+
+async def analyze_tables(connection: AsyncConnection):
+    # Statistics are stale after a bulk load, the planner would keep choosing plans for the empty tables
+    preparer = connection.dialect.identifier_preparer
+    await connection.execute(text(f'ANALYZE {", ".join(preparer.format_table(table) for table in bulk_loaded_tables)}'))
@@ -0,0 +1,119 @@
+import abc
+import asyncio
+import dataclasses
+import datetime
+import logging
+from typing import Collection, List, Set
+
+from sqlalchemy import asc, select, update
+
+from accounting import database
+from accounting.models import Account, BillingCycle, Payment, PaymentStatus, Transaction
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Payout:
+    payment_id: int
+    amount: int
+    account_public_id: str
+    account_full_name: str
+    billing_cycle_opened_at: datetime.datetime
+    billing_cycle_closed_at: datetime.datetime | None
+
+
+class PayoutBackend(abc.ABC):
+    @abc.abstractmethod
+    async def pay(self, payouts: List[Payout]) -> Set[int]:
+        """Returns IDs of the payments that have been paid, the rest ones are considered as failed."""
+
+
+class LoggingPayoutBackend(PayoutBackend):
+    async def pay(self, payouts: List[Payout]) -> Set[int]:
+        for payout in payouts:
+            logger.info(
+                'Pay %s$ to %s for %s - %s',
+                payout.amount / 100,
+                payout.account_full_name,
+                payout.billing_cycle_opened_at,
+                payout.billing_cycle_closed_at,
+            )
+        return {payout.payment_id for payout in payouts}
+
+
+class FakePayoutBackend(PayoutBackend):
+    def __init__(self, failing_payment_ids: Collection[int] = ()):
+        self.failing_payment_ids = set(failing_payment_ids)
+        self.payouts: List[Payout] = []
+
+    async def pay(self, payouts: List[Payout]) -> Set[int]:
+        paid = [payout for payout in payouts if payout.payment_id not in self.failing_payment_ids]
+        self.payouts.extend(paid)
+        return {payout.payment_id for payout in paid}
+
+
+async def pay_batch(backend: PayoutBackend, batch_size: int) -> int:
+    async with database.create_session() as session:
+        # Payments locked by other workers are skipped, so workers do not wait for each other
+        payouts = [Payout(*row) for row in (await session.execute(
+            select(
+                Payment.id,
+                Transaction.credit - Transaction.debit,
+                Account.public_id,
+                Account.full_name,
+                BillingCycle.opened_at,
+                BillingCycle.closed_at,
+            ).join(
+                Transaction, onclause=Transaction.id == Payment.transaction_id,
+            ).join(
+                BillingCycle, onclause=BillingCycle.id == Transaction.billing_cycle_id,
+            ).join(
+                Account, onclause=Account.id == BillingCycle.account_id,
+            ).where(
+                Payment.status == PaymentStatus.pending,
+            ).order_by(
+                asc(Payment.id),
+            ).limit(
+                batch_size,
+            ).with_for_update(
+                of=Payment, skip_locked=True,
+            )
+        )).all()]
+        if not payouts:
+            return 0
+        paid_payment_ids = await backend.pay(payouts)
+        failed_payment_ids = {payout.payment_id for payout in payouts} - paid_payment_ids
+        for payment_ids, payment_status in (
+            (paid_payment_ids, PaymentStatus.completed),
+            (failed_payment_ids, PaymentStatus.failed),
+        ):
+            if payment_ids:
+                await session.execute(
+                    update(Payment).where(
+                        Payment.id.in_(payment_ids),
+                    ).values(
+                        status=payment_status,
+                    ).execution_options(synchronize_session=False)
+                )
+        await session.commit()
+    if failed_payment_ids:
+        logger.error('Payments %s failed', ', '.join(map(str, sorted(failed_payment_ids))))
+    return len(payouts)
+
+
+async def pay_pending_payments(backend: PayoutBackend, batch_size: int, workers: int) -> int:
+    async def worker() -> int:
+        processed = 0
+        while batch_processed := await pay_batch(backend, batch_size):
+            processed += batch_processed
+        return processed
+
+    # A failed worker doesn't interrupt the others in the middle of paying their batches, its own batch is rolled back
+    results = await asyncio.gather(*(worker() for _ in range(workers)), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors:
+        logger.error('Payout worker failed', exc_info=error)
+    if errors:
+        raise errors[0]
+    return sum(results)
@@ -1,37 +1,200 @@
-from contextlib import asynccontextmanager
+from collections import defaultdict
+import dataclasses
+import datetime
+from typing import Dict, List, Sequence, Set, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import asc, bindparam, literal, or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from upserts import MergePolicy, bulk_upsert, upsert
 
 from accounting import database
-from accounting.models import TaskAssignment, Task, TaskClosing
-from accounting.transactions.billing import billing_transaction
-from accounting.transactions.utils import get_or_create
+from accounting.cache import TaskPrice, hot_rows
+from accounting.models import (
+    Account, BillingCycle, BillingCycleStatus, Task, TaskAssignment, TaskClosing, Transaction,
+    open_billing_cycle_predicate,
+)
+from accounting.transactions.utils import claim_events
+
+
+def _cache_task_price(task: Task) -> TaskPrice:
+    task_price = TaskPrice(task.id, task.assignment_cost, task.closing_cost)
+    if not task.is_not_priced:
+        hot_rows.task_prices.set(task.public_id, task_price)
+    return task_price
+
+
+def _priced_task_values(task_public_id: str) -> dict:
+    task = Task(public_id=task_public_id)
+    task.price()
+    return task.dict(include={'public_id', 'assignment_cost', 'closing_cost'})
 
 
 async def price_task(task_public_id: str):
+    # Prices of a task never change once they are set
+    if hot_rows.task_prices.get(task_public_id):
+        return
     async with database.create_session() as session:
-        task, _created = await get_or_create(session, Task, public_id=task_public_id)
-        task.price()
+        task, _created = await upsert(session, Task, _priced_task_values(task_public_id), MergePolicy.fill)
         await session.commit()
+    _cache_task_price(task)
+
+
+@dataclasses.dataclass(frozen=True)
+class TaskEvent:
+    name: str
+    task_public_id: str
+    account_public_id: str
+    event_id: str | None = None
+
+
+def select_claimed_events(events: Sequence[TaskEvent], claimed_event_ids: Set[str]) -> List[TaskEvent]:
+    # Events without IDs can't be told apart, so they are always applied, duplicates within the batch are dropped
+    claimed_event_ids = set(claimed_event_ids)
+    claimed_events = []
+    for event in events:
+        if event.event_id:
+            if event.event_id not in claimed_event_ids:
+                continue
+            claimed_event_ids.remove(event.event_id)
+        claimed_events.append(event)
+    return claimed_events
 
 
-@asynccontextmanager
-async def _task_billing_transaction(task_public_id: str, account_public_id: str):
-    task_query = select(Task).where(Task.public_id == task_public_id)
-    async with billing_transaction(account_public_id) as billing_context:
-        task: Task = (await billing_context.session.execute(task_query)).scalar_one()
-        yield task, billing_context
+async def _upsert_task_prices(session: database.AsyncSession, task_public_ids: Set[str]) -> Dict[str, TaskPrice]:
+    task_prices = {public_id: hot_rows.task_prices.get(public_id) for public_id in task_public_ids}
+    unknown_public_ids = sorted(public_id for public_id, task_price in task_prices.items() if task_price is None)
+    # Prices of an existing task are kept, they are only set if TaskAdded hasn't been handled yet
+    for task, _created in await bulk_upsert(
+        session, Task, [_priced_task_values(public_id) for public_id in unknown_public_ids], MergePolicy.fill,
+    ):
+        task_prices[task.public_id] = TaskPrice(task.id, task.assignment_cost, task.closing_cost)
+    return task_prices
 
 
-async def charge_fee_for_task_assignment(task_public_id: str, account_public_id: str):
-    async with _task_billing_transaction(task_public_id, account_public_id) as (task, billing_context):
-        transaction = await billing_context.create_transaction(debit=0, credit=task.assignment_cost)
-        billing_context.session.add(TaskAssignment(transaction_id=transaction.id, task_id=task.id))
-        await billing_context.session.commit()
+async def _upsert_account_ids(session: database.AsyncSession, account_public_ids: Set[str]) -> Dict[str, int]:
+    account_ids = {public_id: hot_rows.account_ids.get(public_id) for public_id in account_public_ids}
+    unknown_public_ids = sorted(public_id for public_id, account_id in account_ids.items() if account_id is None)
+    for account, _created in await bulk_upsert(
+        session, Account, [{'public_id': public_id} for public_id in unknown_public_ids],
+    ):
+        account_ids[account.public_id] = account.id
+    return account_ids
+
+
+async def _select_open_billing_cycle_ids(session: database.AsyncSession, criterion) -> Dict[int, int]:
+    # Cycles are locked in the order of accounts to avoid deadlocks between concurrent batches
+    return dict((await session.execute(
+        select(BillingCycle.account_id, BillingCycle.id).where(
+            criterion,
+            BillingCycle.status == BillingCycleStatus.open,
+        ).order_by(asc(BillingCycle.account_id)).with_for_update()
+    )).all())
+
+
+async def _lock_open_billing_cycle_ids(session: database.AsyncSession, account_ids: Set[int]) -> Dict[int, int]:
+    cached_billing_cycle_ids = {}
+    for account_id in account_ids:
+        billing_cycle_id = hot_rows.open_billing_cycle_ids.get(account_id)
+        if billing_cycle_id is not None:
+            cached_billing_cycle_ids[account_id] = billing_cycle_id
+    # Cached cycles are locked by their IDs, the cycles of the other accounts are looked up by the same statement
+    billing_cycle_ids = await _select_open_billing_cycle_ids(session, or_(
+        BillingCycle.id.in_(cached_billing_cycle_ids.values()),
+        BillingCycle.account_id.in_(account_ids - set(cached_billing_cycle_ids)),
+    ))
+    closed_account_ids = set(cached_billing_cycle_ids) - set(billing_cycle_ids)
+    if closed_account_ids:  # the cached cycles have been closed since then
+        for account_id in closed_account_ids:
+            hot_rows.open_billing_cycle_ids.pop(account_id)
+        billing_cycle_ids.update(await _select_open_billing_cycle_ids(
+            session, BillingCycle.account_id.in_(closed_account_ids),
+        ))
+    accounts_without_cycle = sorted(account_ids - set(billing_cycle_ids))
+    if accounts_without_cycle:
+        opened_at = datetime.datetime.now()
+        billing_cycle_ids.update((await session.execute(
+            insert(BillingCycle).values([
+                {
+                    'account_id': account_id,
+                    'status': BillingCycleStatus.open,
+                    'opened_at': opened_at,
+                    'debit': 0,
+                    'credit': 0,
+                }
+                for account_id in accounts_without_cycle
+            ]).on_conflict_do_nothing(
+                index_elements=[BillingCycle.account_id],
+                index_where=open_billing_cycle_predicate,
+            ).returning(BillingCycle.account_id, BillingCycle.id)
+        )).all())
+    # Cycles opened concurrently by another transaction are locked once it has committed them
+    accounts_without_cycle = account_ids - set(billing_cycle_ids)
+    if accounts_without_cycle:
+        billing_cycle_ids.update(await _select_open_billing_cycle_ids(
+            session, BillingCycle.account_id.in_(accounts_without_cycle),
+        ))
+    return billing_cycle_ids
+
+
+async def apply_task_events(events: Sequence[TaskEvent]):
+    if not events:
+        return
+    async with database.create_session() as session:
+        # A redelivered event must not charge the account twice, so events already processed are dropped
+        claimed_event_ids = await claim_events(session, [event.event_id for event in events if event.event_id])
+        events = select_claimed_events(events, claimed_event_ids)
+        if not events:
+            return
+        task_prices = await _upsert_task_prices(session, {event.task_public_id for event in events})
+        account_ids = await _upsert_account_ids(session, {event.account_public_id for event in events})
+        billing_cycle_ids = await _lock_open_billing_cycle_ids(session, set(account_ids.values()))
+        billing_cycle_totals: Dict[int, Tuple[int, int]] = defaultdict(lambda: (0, 0))
+        transaction_date = datetime.datetime.now()
+        for event in events:
+            task_price = task_prices[event.task_public_id]
+            billing_cycle_id = billing_cycle_ids[account_ids[event.account_public_id]]
+            if event.name == 'TaskAssigned':
+                debit, credit, link_model = 0, task_price.assignment_cost, TaskAssignment
+            elif event.name == 'TaskClosed':
+                debit, credit, link_model = task_price.closing_cost, 0, TaskClosing
+            else:
+                raise ValueError(f'Unsupported task event: {event.name}')
+            # The transaction and its link to the task are inserted by a single statement
+            transaction_ids = insert(Transaction).values(
+                date=transaction_date,
+                billing_cycle_id=billing_cycle_id,
+                debit=debit,
+                credit=credit,
+            ).returning(Transaction.id).cte('transaction_ids')
+            await session.execute(
+                insert(link_model).from_select(
+                    ['transaction_id', 'task_id'],
+                    select(transaction_ids.c.id, literal(task_price.id)),
+                )
+            )
+            billing_cycle_debit, billing_cycle_credit = billing_cycle_totals[billing_cycle_id]
+            billing_cycle_totals[billing_cycle_id] = billing_cycle_debit + debit, billing_cycle_credit + credit
+        billing_cycle_table = BillingCycle.__table__
+        await session.execute(
+            billing_cycle_table.update().where(
+                billing_cycle_table.c.id == bindparam('billing_cycle_id'),
+            ).values(
+                debit=billing_cycle_table.c.debit + bindparam('debit_delta'),
+                credit=billing_cycle_table.c.credit + bindparam('credit_delta'),
+            ),
+            [
+                {'billing_cycle_id': billing_cycle_id, 'debit_delta': debit, 'credit_delta': credit}
+                for billing_cycle_id, (debit, credit) in billing_cycle_totals.items()
+            ],
+        )
+        await session.commit()
+    for public_id, task_price in task_prices.items():
+        hot_rows.task_prices.set(public_id, task_price)
+    for public_id, account_id in account_ids.items():
+        hot_rows.account_ids.set(public_id, account_id)
+        hot_rows.open_billing_cycle_ids.set(account_id, billing_cycle_ids[account_id])
 
 
-async def assess_amount_for_task_closing(task_public_id, account_public_id):
-    async with _task_billing_transaction(task_public_id, account_public_id) as (task, billing_context):
-        transaction = await billing_context.create_transaction(debit=task.closing_cost, credit=0)
-        billing_context.session.add(TaskClosing(transaction_id=transaction.id, task_id=task.id))
-        await billing_context.session.commit()
+async def apply_task_event(event: TaskEvent):
+    await apply_task_events([event])
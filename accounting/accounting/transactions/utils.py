@@ -1,24 +1,25 @@
-from typing import Any, Mapping, Type, TypeVar
+from typing import Collection, Set
 
-from sqlalchemy import select
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 
-from accounting.models import SQLModel
+from accounting.models import ProcessedEvent
 
-ModelT = TypeVar('ModelT', bound=SQLModel)
 
-
-async def get_or_create(
-    session,
-    model: Type[ModelT],
-    defaults: Mapping[str, Any] | None = None,
-    **filter_kwargs: Any,
-) -> (ModelT, bool):
-    query_result = await session.execute(select(model).filter_by(**filter_kwargs))
-    instance: model | None = query_result.scalar_one_or_none()
-    created = False
-    if not instance:
-        instance_kwargs = defaults | filter_kwargs if defaults else filter_kwargs
-        instance = model(**instance_kwargs)
-        session.add(instance)
-        created = True
-    return instance, created
+async def claim_events(session, event_ids: Collection[str]) -> Set[str]:
+    """
+    Records events as processed within the transaction of their effects, returns IDs of the events that have not
+    been processed before. Claims of a rolled back transaction are rolled back as well.
+    """
+    if not event_ids:
+        return set()
+    claimed_event_ids = (await session.execute(
+        insert(ProcessedEvent).values([
+            {'event_id': event_id, 'processed_at': func.now()} for event_id in set(event_ids)
+        ]).on_conflict_do_nothing(
+            index_elements=['event_id'],
+        ).returning(
+            ProcessedEvent.event_id,
+        )
+    )).scalars().all()
+    return set(claimed_event_ids)
@@ -0,0 +1,31 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from accounting import database
+from accounting.cache import LRUCache, hot_rows
+
+
+@pytest.fixture
+def database_settings(monkeypatch) -> database.Settings:
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+
+    async def drop_tables():
+        engine = create_async_engine(url)
+        async with engine.begin() as connection:
+            await connection.execute(text('DROP SCHEMA public CASCADE'))
+            await connection.execute(text('CREATE SCHEMA public'))
+        await engine.dispose()
+
+    asyncio.run(drop_tables())
+    # Periodical tasks read the settings from the environment
+    monkeypatch.setenv('DATABASE_URL', url)
+    # Cached ids refer to rows of the dropped tables
+    for name in ('account_ids', 'task_prices', 'open_billing_cycle_ids'):
+        monkeypatch.setattr(hot_rows, name, LRUCache(max_size=1000))
+    return database.Settings(url=url)
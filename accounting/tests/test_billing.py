@@ -0,0 +1,42 @@
+import asyncio
+
+from sqlalchemy import event, select
+
+from accounting import database
+from accounting.models import BillingCycle, BillingCycleStatus
+from accounting.transactions.billing import initialize_account
+
+
+def test_concurrently_initialized_account_gets_single_open_billing_cycle(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        await asyncio.gather(*(initialize_account('worker') for _ in range(5)))
+        async with database.create_session() as session:
+            billing_cycles = (await session.execute(select(BillingCycle))).scalars().all()
+        await database.engine.dispose()
+        return billing_cycles
+
+    billing_cycles = asyncio.run(scenario())
+    assert [billing_cycle.status for billing_cycle in billing_cycles] == [BillingCycleStatus.open]
+
+
+def test_billing_cycles_are_opened_by_generic_plan(database_settings):
+    def force_generic_plan(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('SET plan_cache_mode = force_generic_plan')
+        cursor.close()
+
+    async def scenario():
+        await database.setup(database_settings)
+        # Prepared statements may be planned generically from their sixth execution, without their parameters
+        event.listen(database.engine.sync_engine, 'connect', force_generic_plan)
+        await database.engine.dispose()
+        for n in range(10):
+            await initialize_account(f'worker-{n}')
+        async with database.create_session() as session:
+            billing_cycles = (await session.execute(select(BillingCycle))).scalars().all()
+        await database.engine.dispose()
+        return billing_cycles
+
+    billing_cycles = asyncio.run(scenario())
+    assert [billing_cycle.status for billing_cycle in billing_cycles] == [BillingCycleStatus.open] * 10
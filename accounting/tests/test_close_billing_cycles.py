@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+from typing import Dict, List
+
+from sqlalchemy import func, select
+
+from accounting import database
+from accounting.models import Account, BillingCycle, BillingCycleStatus, JobCheckpoint
+from accounting.periodical_tasks import close_billing_cycles
+
+yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+
+
+async def create_accounts(count: int) -> List[int]:
+    async with database.create_session() as session:
+        accounts = [Account(public_id=f'worker-{n}') for n in range(count)]
+        session.add_all(accounts)
+        await session.flush()
+        session.add_all(BillingCycle(account_id=account.id, opened_at=yesterday) for account in accounts)
+        await session.commit()
+        return [account.id for account in accounts]
+
+
+async def count_closed_cycles() -> Dict[str, int]:
+    async with database.create_session() as session:
+        return dict((await session.execute(
+            select(Account.public_id, func.count(BillingCycle.id)).join(BillingCycle).where(
+                BillingCycle.status == BillingCycleStatus.closed,
+            ).group_by(Account.public_id)
+        )).all())
+
+
+async def get_checkpoint() -> JobCheckpoint | None:
+    async with database.create_session() as session:
+        return await session.get(JobCheckpoint, close_billing_cycles.job_name)
+
+
+def fail_account(monkeypatch, account_public_id: str, failures: int):
+    close_current_billing_cycle = close_billing_cycles.close_current_billing_cycle
+
+    async def close_or_fail(public_id: str, **kwargs) -> bool:
+        nonlocal failures
+        if public_id == account_public_id and failures:
+            failures -= 1
+            raise RuntimeError('closing failed')
+        return await close_current_billing_cycle(public_id, **kwargs)
+
+    monkeypatch.setattr(close_billing_cycles, 'close_current_billing_cycle', close_or_fail)
+
+
+async def run_job():
+    await close_billing_cycles.main(concurrency=2, chunk_size=2, verify=True, restart=False)
+    await database.engine.dispose()
+
+
+def test_failed_account_is_retried_at_the_end_of_run(database_settings, monkeypatch):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_accounts(5)
+        await database.engine.dispose()
+        fail_account(monkeypatch, 'worker-1', failures=1)
+        await run_job()
+        await database.setup(database_settings)
+        return await count_closed_cycles(), await get_checkpoint()
+
+    closed_cycles, checkpoint = asyncio.run(scenario())
+    assert closed_cycles == {f'worker-{n}': 1 for n in range(5)}
+    assert checkpoint is None
+
+
+def test_account_failed_twice_is_kept_for_the_next_run(database_settings, monkeypatch):
+    async def scenario():
+        await database.setup(database_settings)
+        account_ids = await create_accounts(5)
+        await database.engine.dispose()
+        fail_account(monkeypatch, 'worker-1', failures=2)
+        await run_job()
+        await database.setup(database_settings)
+        checkpoint = await get_checkpoint()
+        await database.engine.dispose()
+        # The next run retries the failed account only
+        await run_job()
+        await database.setup(database_settings)
+        return account_ids, checkpoint, await count_closed_cycles(), await get_checkpoint()
+
+    account_ids, checkpoint, closed_cycles, last_checkpoint = asyncio.run(scenario())
+    assert checkpoint.failed_accounts == ['worker-1']
+    assert checkpoint.last_account_id == account_ids[-1]
+    assert closed_cycles == {f'worker-{n}': 1 for n in range(5)}
+    assert last_checkpoint is None
+
+
+def test_checkpoint_of_previous_day_is_discarded(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        account_ids = await create_accounts(3)
+        async with database.create_session() as session:
+            session.add(JobCheckpoint(
+                name=close_billing_cycles.job_name, started_at=yesterday, last_account_id=account_ids[-1],
+            ))
+            await session.commit()
+        await database.engine.dispose()
+        await run_job()
+        await database.setup(database_settings)
+        return await count_closed_cycles()
+
+    closed_cycles = asyncio.run(scenario())
+    assert closed_cycles == {f'worker-{n}': 1 for n in range(3)}
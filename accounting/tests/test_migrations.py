@@ -0,0 +1,33 @@
+import asyncio
+
+from sqlalchemy import inspect
+from sqlmodel import SQLModel
+
+from accounting import database, models  # noqa
+
+
+def inspect_schema(connection) -> dict:
+    inspector = inspect(connection)
+    return {
+        table_name: {
+            'columns': {column['name']: column['nullable'] for column in inspector.get_columns(table_name)},
+            'indexes': {index['name'] for index in inspector.get_indexes(table_name)},
+        }
+        for table_name in inspector.get_table_names()
+    }
+
+
+def test_migrated_schema_matches_models(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        # Migrations are applied once
+        await database.setup(database_settings)
+        async with database.engine.connect() as connection:
+            schema = await connection.run_sync(inspect_schema)
+        await database.engine.dispose()
+        return schema
+
+    schema = asyncio.run(scenario())
+    for table in SQLModel.metadata.sorted_tables:
+        assert schema[table.name]['columns'] == {column.name: column.nullable for column in table.columns}, table.name
+        assert {index.name for index in table.indexes} <= schema[table.name]['indexes'], table.name
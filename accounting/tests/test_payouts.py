@@ -0,0 +1,83 @@
+import asyncio
+from typing import List, Set
+
+import pytest
+from sqlalchemy import select
+
+from accounting import database
+from accounting.models import Account, BillingCycle, BillingCycleStatus, Payment, PaymentStatus, Transaction
+from accounting.transactions.payouts import FakePayoutBackend, Payout, pay_pending_payments
+
+
+async def create_payments(count: int) -> List[int]:
+    async with database.create_session() as session:
+        account = Account(public_id='worker', full_name='Worker')
+        session.add(account)
+        await session.flush()
+        billing_cycle = BillingCycle(account_id=account.id, status=BillingCycleStatus.closed)
+        session.add(billing_cycle)
+        await session.flush()
+        transactions = [
+            Transaction(billing_cycle_id=billing_cycle.id, debit=0, credit=100 * n) for n in range(1, count + 1)
+        ]
+        session.add_all(transactions)
+        await session.flush()
+        payments = [Payment(transaction_id=transaction.id) for transaction in transactions]
+        session.add_all(payments)
+        await session.commit()
+        return [payment.id for payment in payments]
+
+
+async def get_statuses() -> List[PaymentStatus]:
+    async with database.create_session() as session:
+        return (await session.execute(select(Payment.status).order_by(Payment.id))).scalars().all()
+
+
+class UnavailablePayoutBackend(FakePayoutBackend):
+    """Fails once to pay a batch with the given payment, the other batches take a while."""
+
+    def __init__(self, unavailable_payment_id: int):
+        super().__init__()
+        self.unavailable_payment_id = unavailable_payment_id
+
+    async def pay(self, payouts: List[Payout]) -> Set[int]:
+        if any(payout.payment_id == self.unavailable_payment_id for payout in payouts):
+            self.unavailable_payment_id = None
+            raise ConnectionError('payout service is unavailable')
+        await asyncio.sleep(0.05)
+        return await super().pay(payouts)
+
+
+def test_pending_payments_are_paid(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        payment_ids = await create_payments(5)
+        backend = FakePayoutBackend(failing_payment_ids={payment_ids[1]})
+        processed = await pay_pending_payments(backend, batch_size=2, workers=2)
+        statuses = await get_statuses()
+        await database.engine.dispose()
+        return backend, processed, statuses
+
+    backend, processed, statuses = asyncio.run(scenario())
+    assert processed == 5
+    assert sorted(payout.amount for payout in backend.payouts) == [100, 300, 400, 500]
+    assert statuses == [
+        PaymentStatus.completed, PaymentStatus.failed, PaymentStatus.completed, PaymentStatus.completed,
+        PaymentStatus.completed,
+    ]
+
+
+def test_failed_worker_does_not_interrupt_the_others(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        payment_ids = await create_payments(4)
+        backend = UnavailablePayoutBackend(unavailable_payment_id=payment_ids[0])
+        with pytest.raises(ConnectionError):
+            await pay_pending_payments(backend, batch_size=1, workers=2)
+        statuses = await get_statuses()
+        await database.engine.dispose()
+        return statuses
+
+    statuses = asyncio.run(scenario())
+    # The failed batch is rolled back and paid by the other worker, which has finished its work
+    assert statuses == [PaymentStatus.completed] * 4
@@ -0,0 +1,30 @@
+import asyncio
+import datetime
+
+from sqlalchemy import select
+
+from accounting import database
+from accounting.models import ProcessedEvent
+from accounting.periodical_tasks import prune_processed_events
+
+
+def test_events_older_than_retention_are_pruned(database_settings):
+    now = datetime.datetime.now()
+
+    async def scenario():
+        await database.setup(database_settings)
+        async with database.create_session() as session:
+            session.add_all(
+                ProcessedEvent(event_id=f'event-{days}', processed_at=now - datetime.timedelta(days=days, hours=1))
+                for days in range(10)
+            )
+            await session.commit()
+        await database.engine.dispose()
+        await prune_processed_events.main(retention_days=7, batch_size=2)
+        async with database.create_session() as session:
+            event_ids = (await session.execute(select(ProcessedEvent.event_id))).scalars().all()
+        await database.engine.dispose()
+        return event_ids
+
+    event_ids = asyncio.run(scenario())
+    assert sorted(event_ids) == [f'event-{days}' for days in range(7)]
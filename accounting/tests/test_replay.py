@@ -0,0 +1,116 @@
+import asyncio
+from typing import List
+
+from sqlalchemy import text
+
+import event_streaming
+from accounting import database
+from accounting.event_streaming import handlers  # noqa: F401, the handlers are registered by the import
+from accounting.event_streaming.replay import fold_event
+from accounting.transactions.bulk_load import ProjectionChunk, write_chunk
+
+
+def create_message(event_id: str, event_name: str, data: dict, event_version: int = 1) -> dict:
+    return {'event_id': event_id, 'event_name': event_name, 'event_version': event_version, 'data': data}
+
+
+# Accounts given the worker role by AccountCreated get an open billing cycle only once they are charged
+events = [
+    create_message('1', 'AccountCreated', {'public_id': 'manager', 'email': 'manager@example.com', 'role': 'manager'}),
+    create_message('2', 'AccountCreated', {'public_id': 'created-worker', 'email': 'cw@example.com', 'role': 'worker'}),
+    create_message('3', 'AccountCreated', {'public_id': 'idle-worker', 'email': 'iw@example.com', 'role': 'worker'}),
+    create_message('4', 'AccountCreated', {'public_id': 'promoted', 'email': 'promoted@example.com'}),
+    create_message('5', 'AccountRoleChanged', {'public_id': 'promoted', 'role': 'worker'}),
+    create_message('6', 'AccountUpdated', {'public_id': 'promoted', 'email': 'p@example.com', 'full_name': 'P'}),
+    create_message('7', 'AccountRoleChanged', {'public_id': 'demoted', 'role': 'worker'}),
+    create_message('8', 'AccountRoleChanged', {'public_id': 'demoted', 'role': 'manager'}),
+    create_message(
+        '9', 'TaskCreated', {'public_id': 'task-1', 'title': 'Task', 'description': '', 'jira_id': 'J-1'}, 2,
+    ),
+    create_message('10', 'TaskAdded', {'task': 'task-1'}),
+    create_message('11', 'TaskAssigned', {'task': 'task-1', 'assignee': 'created-worker'}),
+    create_message('12', 'TaskAssigned', {'task': 'task-2', 'assignee': 'promoted'}),
+    create_message('13', 'TaskClosed', {'task': 'task-2', 'assignee': 'promoted'}),
+    # A redelivered event charges the account once
+    create_message('13', 'TaskClosed', {'task': 'task-2', 'assignee': 'promoted'}),
+]
+
+
+async def handle_live(messages: List[dict]):
+    for message in messages:
+        event_streaming.current_event_id.set(message['event_id'])
+        event_name, event_version = message['event_name'], message['event_version']
+        for handler in event_streaming.on_event.registry[event_name, None]:
+            await handler(event_name, event_version, message['data'])
+
+
+async def replay(messages: List[dict], chunk_size: int):
+    for start in range(0, len(messages), chunk_size):
+        chunk = ProjectionChunk()
+        for message in messages[start:start + chunk_size]:
+            fold_event(chunk, message)
+        async with database.engine.begin() as connection:
+            await write_chunk(connection, chunk)
+
+
+async def get_projection() -> dict:
+    # Prices of the tasks are random, so charges are compared with the prices rather than by their amounts
+    queries = {
+        'accounts': 'SELECT public_id, email, full_name, role FROM account',
+        'tasks': 'SELECT public_id, description, assignment_cost IS NOT NULL FROM task',
+        'billing_cycles': '''
+            SELECT account.public_id, billing_cycle.status FROM billing_cycle JOIN account ON account.id = account_id
+        ''',
+        'transactions': '''
+            SELECT account.public_id, task.public_id, assignment.task_id IS NOT NULL,
+                transaction.credit = CASE WHEN assignment.task_id IS NULL THEN 0 ELSE task.assignment_cost END,
+                transaction.debit = CASE WHEN closing.task_id IS NULL THEN 0 ELSE task.closing_cost END
+            FROM transaction
+            JOIN billing_cycle ON billing_cycle.id = transaction.billing_cycle_id
+            JOIN account ON account.id = billing_cycle.account_id
+            LEFT JOIN task_assignment AS assignment ON assignment.transaction_id = transaction.id
+            LEFT JOIN task_closing AS closing ON closing.transaction_id = transaction.id
+            JOIN task ON task.id = coalesce(assignment.task_id, closing.task_id)
+        ''',
+        'billing_cycle_totals': '''
+            SELECT billing_cycle.id FROM billing_cycle
+            LEFT JOIN transaction ON transaction.billing_cycle_id = billing_cycle.id
+            GROUP BY billing_cycle.id
+            HAVING billing_cycle.debit != coalesce(sum(transaction.debit), 0)
+                OR billing_cycle.credit != coalesce(sum(transaction.credit), 0)
+        ''',
+    }
+    async with database.engine.connect() as connection:
+        return {
+            name: sorted(tuple(row) for row in (await connection.execute(text(query))).all())
+            for name, query in queries.items()
+        }
+
+
+async def clear_projection():
+    async with database.engine.begin() as connection:
+        await connection.execute(text('''
+            TRUNCATE account, task, billing_cycle, transaction, task_assignment, task_closing, processed_event
+            RESTART IDENTITY CASCADE
+        '''))
+
+
+def test_replay_builds_the_projection_of_live_handlers(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        await handle_live(events)
+        live_projection = await get_projection()
+        await clear_projection()
+        await replay(events, chunk_size=4)
+        replayed_projection = await get_projection()
+        await database.engine.dispose()
+        return live_projection, replayed_projection
+
+    live_projection, replayed_projection = asyncio.run(scenario())
+    assert replayed_projection == live_projection
+    assert live_projection['billing_cycles'] == [
+        ('created-worker', 'open'), ('demoted', 'open'), ('promoted', 'open'),
+    ]
+    assert len(live_projection['transactions']) == 3
+    assert all(credit and debit for *_, credit, debit in live_projection['transactions'])
+    assert not live_projection['billing_cycle_totals']
@@ -0,0 +1,79 @@
+import asyncio
+from typing import Dict
+
+from sqlalchemy import func, select, update
+
+from accounting import database
+from accounting.cache import hot_rows
+from accounting.models import Account, BillingCycle, BillingCycleStatus, Transaction
+from accounting.transactions.tasks import TaskEvent, apply_task_events, select_claimed_events
+
+
+async def get_cycle_transactions() -> Dict[BillingCycleStatus, int]:
+    async with database.create_session() as session:
+        return dict((await session.execute(
+            select(BillingCycle.status, func.count(Transaction.id)).join(Transaction).group_by(BillingCycle.status)
+        )).all())
+
+
+def test_events_are_applied_to_cached_open_billing_cycle(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        await apply_task_events([TaskEvent('TaskAssigned', 'task-1', 'worker', 'event-1')])
+        account_id = hot_rows.account_ids.get('worker')
+        billing_cycle_id = hot_rows.open_billing_cycle_ids.get(account_id)
+        await apply_task_events([TaskEvent('TaskClosed', 'task-1', 'worker', 'event-2')])
+        cycle_transactions = await get_cycle_transactions()
+        await database.engine.dispose()
+        return billing_cycle_id, hot_rows.open_billing_cycle_ids.get(account_id), cycle_transactions
+
+    billing_cycle_id, cached_billing_cycle_id, cycle_transactions = asyncio.run(scenario())
+    assert cached_billing_cycle_id == billing_cycle_id
+    assert cycle_transactions == {BillingCycleStatus.open: 2}
+
+
+def test_events_fall_back_to_open_billing_cycle_if_cached_one_is_closed(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        await apply_task_events([TaskEvent('TaskAssigned', 'task-1', 'worker', 'event-1')])
+        account_id = hot_rows.account_ids.get('worker')
+        closed_billing_cycle_id = hot_rows.open_billing_cycle_ids.get(account_id)
+        # The cycle is closed by another process, the cache of this one still refers to it
+        async with database.create_session() as session:
+            await session.execute(update(BillingCycle).values(status=BillingCycleStatus.closed))
+            session.add(BillingCycle(account_id=account_id))
+            await session.commit()
+        await apply_task_events([TaskEvent('TaskClosed', 'task-1', 'worker', 'event-2')])
+        async with database.create_session() as session:
+            open_billing_cycle_id = (await session.execute(
+                select(BillingCycle.id).join(Account).where(BillingCycle.status == BillingCycleStatus.open)
+            )).scalar_one()
+        cached_billing_cycle_id = hot_rows.open_billing_cycle_ids.get(account_id)
+        cycle_transactions = await get_cycle_transactions()
+        await database.engine.dispose()
+        return closed_billing_cycle_id, open_billing_cycle_id, cached_billing_cycle_id, cycle_transactions
+
+    closed_billing_cycle_id, open_billing_cycle_id, cached_billing_cycle_id, cycle_transactions = asyncio.run(
+        scenario(),
+    )
+    assert open_billing_cycle_id != closed_billing_cycle_id
+    assert cached_billing_cycle_id == open_billing_cycle_id
+    assert cycle_transactions == {BillingCycleStatus.open: 1, BillingCycleStatus.closed: 1}
+
+
+def test_events_claimed_by_another_consumer_are_dropped():
+    events = [
+        TaskEvent('TaskAssigned', 'task-1', 'worker', 'event-1'),
+        TaskEvent('TaskClosed', 'task-1', 'worker', 'event-2'),
+    ]
+    assert select_claimed_events(events, {'event-2'}) == events[1:]
+
+
+def test_duplicate_events_of_batch_are_applied_once():
+    events = [TaskEvent('TaskAssigned', 'task-1', 'worker', 'event-1')] * 2
+    assert select_claimed_events(events, {'event-1'}) == events[:1]
+
+
+def test_events_without_id_are_always_applied():
+    events = [TaskEvent('TaskAssigned', 'task-1', 'worker', None)] * 2
+    assert select_claimed_events(events, set()) == events
@@ -0,0 +1,97 @@
+"""
+Load test of auth.Client.fetch_account against a local stub of the auth service,
+comparing a new HTTP client per call with the pooled keep-alive client.
+
+    PYTHONPATH=common:task-tracker python benchmarks/auth_client.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import httpx
+import uvicorn
+
+stub_host = '127.0.0.1'
+account = {'public_id': 'e6c1b0e8-5f6a-4bb3-9c1d-9cbbf8e8f7c0', 'email': 'worker@example.com', 'role': 'worker'}
+
+
+async def stub_auth_app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(account).encode()})
+
+
+async def fresh_client_fetch_account(client, token: str) -> dict:
+    # The way auth.Client used to work: a new connection for every call
+    async with httpx.AsyncClient() as http_client:
+        response = await http_client.get(
+            client._compose_internal_url('accounts/current'),
+            headers={'authorization': f'Bearer {token}'},
+        )
+    return response.json()
+
+
+async def measure(fetch_account, requests: int, concurrency: int) -> dict:
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def timed_request(request_number: int):
+        async with slots:
+            started_at = time.perf_counter()
+            await fetch_account(f'token-{request_number}')
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(timed_request(request_number) for request_number in range(requests)))
+    elapsed = time.perf_counter() - started_at
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests/s': requests / elapsed,
+        'p50 ms': quantiles[49] * 1000,
+        'p99 ms': quantiles[98] * 1000,
+    }
+
+
+async def main(arguments):
+    os.environ.update({
+        'AUTH_OAUTH_CLIENT_ID': 'benchmark',
+        'AUTH_OAUTH_CLIENT_SECRET': 'benchmark',
+        'AUTH_URL': f'http://{stub_host}:{arguments.port}',
+        'AUTH_INTERNAL_URL': f'http://{stub_host}:{arguments.port}',
+        'AUTH_POOL_MAX_CONNECTIONS': str(arguments.concurrency),
+        'AUTH_POOL_MAX_KEEPALIVE_CONNECTIONS': str(arguments.concurrency),
+    })
+    from task_tracker import auth
+
+    server = uvicorn.Server(uvicorn.Config(stub_auth_app, host=stub_host, port=arguments.port, log_level='warning'))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    client = auth.Client()
+    await client.start()
+    try:
+        results = {
+            'fresh client': await measure(
+                lambda token: fresh_client_fetch_account(client, token), arguments.requests, arguments.concurrency,
+            ),
+            'pooled client': await measure(client.fetch_account, arguments.requests, arguments.concurrency),
+        }
+    finally:
+        await client.stop()
+        server.should_exit = True
+        await server_task
+    for name, result in results.items():
+        print(f'{name:>14}: ' + ', '.join(f'{metric} {value:9.1f}' for metric, value in result.items()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""
+Compares size and encode/decode throughput of JSON and binary (msgpack + headers) event encodings.
+
+    PYTHONPATH=common python benchmarks/event_encoding.py --schemas-directory schemas
+"""
+import argparse
+import gzip
+import time
+import uuid
+
+from event_streaming import Producer
+from event_streaming.encoding import EventCodec, EventEncoding, Headers
+
+
+def sample_data() -> dict:
+    return {
+        'TaskAssigned': (1, {'task': str(uuid.uuid4()), 'assignee': str(uuid.uuid4())}),
+        'TaskCreated': (2, {
+            'public_id': str(uuid.uuid4()),
+            'title': 'Feed the parrots',
+            'jira_id': 'POPUG-1042',
+            'description': 'Two spoons of seeds for every parrot of the second floor.',
+        }),
+        'AccountUpdated': (1, {'public_id': str(uuid.uuid4()), 'full_name': 'Popug Popugaev'}),
+    }
+
+
+def get_record_size(value: bytes, headers: Headers) -> int:
+    # Kafka stores header keys and values along with the record value
+    return len(value) + sum(len(name) + len(header_value) for name, header_value in headers)
+
+
+def measure(function, iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return iterations / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schemas-directory', default='schemas')
+    parser.add_argument('--iterations', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=1000, help="Events compressed together, as in a batch.")
+    arguments = parser.parse_args()
+
+    producer = Producer('benchmark')
+    producer._schema_registry.load_schemas(arguments.schemas_directory)
+    codec = EventCodec(producer._schema_registry)
+
+    print(f'{"event":>16} {"encoding":>8} {"bytes":>6} {"gzip/event":>10} {"encode/s":>10} {"decode/s":>10}')
+    for event_name, (event_version, data) in sample_data().items():
+        message = producer.build_event(event_name, event_version, data)
+        for encoding in EventEncoding:
+            value, headers = codec.encode(message, encoding)
+            assert codec.decode(value, headers) == message
+            # Every event of the batch has its own IDs, as the real ones do
+            batch = b''.join(
+                batch_value + b''.join(name.encode() + header_value for name, header_value in batch_headers)
+                for batch_value, batch_headers in (
+                    codec.encode(producer.build_event(event_name, *sample_data()[event_name]), encoding)
+                    for _ in range(arguments.batch_size)
+                )
+            )
+            compressed_size = len(gzip.compress(batch)) / arguments.batch_size
+            encode_rate = measure(lambda: codec.encode(message, encoding), arguments.iterations)
+            decode_rate = measure(lambda: codec.decode(value, headers), arguments.iterations)
+            print(
+                f'{event_name:>16} {encoding.value:>8} {get_record_size(value, headers):6d} '
+                f'{compressed_size:10.1f} {encode_rate:10.0f} {decode_rate:10.0f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
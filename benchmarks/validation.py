@@ -0,0 +1,61 @@
+"""
+Compares event validation throughput of generic jsonschema validators and the compiled SchemaRegistry.
+
+    PYTHONPATH=common python benchmarks/validation.py --schemas-directory schemas
+"""
+import argparse
+import datetime
+import json
+from pathlib import Path
+import time
+import uuid
+
+import jsonschema
+
+from event_streaming.schema_registry import SchemaRegistry
+
+
+def sample_event() -> dict:
+    return {
+        'event_id': str(uuid.uuid4()),
+        'event_name': 'TaskAssigned',
+        'event_time': datetime.datetime.now().isoformat(),
+        'event_version': 1,
+        'producer': 'task-tracker',
+        'data': {'task': str(uuid.uuid4()), 'assignee': str(uuid.uuid4())},
+    }
+
+
+def measure(validate, event: dict, iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        validate(event)
+    return iterations / (time.perf_counter() - started_at)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--schemas-directory', default='schemas')
+    parser.add_argument('--iterations', type=int, default=100_000)
+    arguments = parser.parse_args()
+
+    event = sample_event()
+    with (Path(arguments.schemas_directory) / 'TaskAssigned' / '1.json').open() as json_stream:
+        schema = json.load(json_stream)
+    generic_validator = jsonschema.validators.validator_for(schema)(schema)
+    schema_registry = SchemaRegistry()
+    schema_registry.load_schemas(arguments.schemas_directory)
+
+    results = {
+        'jsonschema': measure(generic_validator.validate, event, arguments.iterations),
+        'compiled': measure(
+            lambda data: schema_registry.validate_event('TaskAssigned', 1, data), event, arguments.iterations,
+        ),
+    }
+    for name, events_per_second in results.items():
+        print(f'{name:>12}: {events_per_second:12.0f} events/s')
+    print(f'{"speedup":>12}: {results["compiled"] / results["jsonschema"]:12.1f}x')
+
+
+if __name__ == '__main__':
+    main()
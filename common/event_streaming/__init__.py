@@ -1,37 +1,100 @@
+import asyncio
 from collections import defaultdict
+from contextvars import ContextVar
 import datetime
-import json
+import logging
+import random
+import struct
+import time
+from typing import Any, Callable, Mapping, Set, Tuple
 import uuid
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaProducer, ConsumerRecord
+from prometheus_client import start_http_server
 from pydantic import BaseSettings
 
-from event_streaming.schema_registry import SchemaRegistry
+from event_streaming import metrics
+from event_streaming.consumer import BatchConsumer, RecordHandler
+from event_streaming.deduplication import RecentEventIds
+from event_streaming.encoding import EventCodec, EventEncoding
+from event_streaming.retries import FailureRouter, PoisonMessageError, get_remaining_delay, retry_in_place
+from event_streaming.schema_registry import SchemaRegistry, ValidationError
+from metrics import span
+
+logger = logging.getLogger(__name__)
 
 
 class Settings(BaseSettings):
     bootstrap_servers: str
     schemas_directory: str
+    consumer_batch_size: int = 500
+    consumer_max_in_flight_partitions: int = 8
+    consumer_linger_ms: int = 100
+    producer_linger_ms: int = 5
+    producer_max_batch_size: int = 64 * 1024
+    producer_compression_type: str | None = 'gzip'
+    # Consumers read both encodings, but consumers of older releases read JSON only, so producers are switched to
+    # binary by a separate config change once every consumer has been upgraded
+    producer_encoding: EventEncoding = EventEncoding.json
+    validate_produced_events: bool = True
+    # Events of these producers are consumed without schema validation
+    trusted_producers: Set[str] = set()
+    # Redelivered events seen by this process recently are skipped before reaching the handlers
+    recent_event_ids_size: int = 100_000
+    # Failed messages are retried in place first, so they are not overtaken by later events of the same entity
+    consumer_in_place_retries: int = 2
+    consumer_in_place_retry_backoff: float = 0.2
+    # Then they are retried through delayed topics, the delay doubles with every attempt
+    consumer_max_retries: int = 3
+    consumer_retry_backoff: float = 5
+    # Consumers serve their metrics on this port if it's set
+    metrics_port: int | None = None
+    # Share of the consumed events logged along with their data, for debugging only
+    event_log_sample_rate: float = 0
 
     class Config:
         env_prefix = 'event_streaming_'
 
 
+# Events about the same entity are sent to the same partition to keep their order
+partition_key_fields = 'task', 'public_id'
+
+
+def get_partition_key(data: Mapping[str, Any]) -> bytes | None:
+    for field in partition_key_fields:
+        if data.get(field):
+            return str(data[field]).encode()
+    return None
+
+
 class Producer:
     def __init__(self, name: str):
         self._name = name
         self._schema_registry = SchemaRegistry()
+        self._codec = EventCodec(self._schema_registry)
         self._producer: AIOKafkaProducer | None = None
+        self._validate_events = True
+        self._encoding = EventEncoding.json
 
     async def start(self, settings: Settings):
         self._schema_registry.load_schemas(settings.schemas_directory)
-        self._producer = AIOKafkaProducer(bootstrap_servers=settings.bootstrap_servers)
+        self._validate_events = settings.validate_produced_events
+        self._encoding = settings.producer_encoding
+        self._producer = AIOKafkaProducer(
+            bootstrap_servers=settings.bootstrap_servers,
+            linger_ms=settings.producer_linger_ms,
+            max_batch_size=settings.producer_max_batch_size,
+            compression_type=settings.producer_compression_type,
+        )
         await self._producer.start()
 
     async def stop(self):
         await self._producer.stop()
 
-    async def send(self, topic_name: str, event_name: str, event_version: int, data: dict):
+    async def flush(self):
+        await self._producer.flush()
+
+    def build_event(self, event_name: str, event_version: int, data: dict) -> dict:
         message = {
             'event_id': str(uuid.uuid4()),
             'event_name': event_name,
@@ -40,8 +103,32 @@ class Producer:
             'producer': self._name,
             'data': data,
         }
-        self._schema_registry.validate_event(event_name, event_version, message)
-        await self._producer.send_and_wait(topic_name, json.dumps(message).encode())
+        if self._validate_events:
+            self._schema_registry.validate_event(event_name, event_version, message)
+        return message
+
+    async def send_event(self, topic_name: str, message: dict) -> asyncio.Future:
+        with span('kafka_produce', topic=topic_name):
+            value, headers = self._codec.encode(message, self._encoding)
+            delivery = await self._producer.send(
+                topic_name,
+                value,
+                key=get_partition_key(message['data']),
+                headers=headers or None,
+            )
+        delivery.add_done_callback(self._log_delivery_error)
+        return delivery
+
+    async def send(self, topic_name: str, event_name: str, event_version: int, data: dict) -> asyncio.Future:
+        return await self.send_event(topic_name, self.build_event(event_name, event_version, data))
+
+    async def send_and_wait(self, topic_name: str, event_name: str, event_version: int, data: dict):
+        return await (await self.send(topic_name, event_name, event_version, data))
+
+    @staticmethod
+    def _log_delivery_error(delivery: asyncio.Future):
+        if not delivery.cancelled() and delivery.exception():
+            logger.error('Event delivery failed: %s', delivery.exception())
 
 
 def on_event(event_name: str, event_version: int | None = None):
@@ -54,24 +141,111 @@ def on_event(event_name: str, event_version: int | None = None):
 
 on_event.registry = defaultdict(set)
 
+# ID of the event being handled, handlers store it along with their effects to skip redeliveries durably
+current_event_id: ContextVar[str | None] = ContextVar('current_event_id', default=None)
+
 
 async def consume(settings: Settings, topics, group):
     schema_registry = SchemaRegistry()
     schema_registry.load_schemas(settings.schemas_directory)
-    consumer = AIOKafkaConsumer(
-        *topics,
-        bootstrap_servers=settings.bootstrap_servers,
-        group_id=group,
-    )
-    await consumer.start()
-    try:
-        async for message in consumer:
-            message = json.loads(message.value)
+    codec = EventCodec(schema_registry)
+
+    recent_event_ids = RecentEventIds(settings.recent_event_ids_size)
+
+    def parse_message(record: ConsumerRecord) -> Tuple[dict, Set[Callable]]:
+        started_at = time.perf_counter()
+        try:
+            message = codec.decode(record.value, record.headers)
             event_name = message['event_name']
             event_version = message.get('event_version', 1)
             handlers = on_event.registry[event_name, None] | on_event.registry[event_name, event_version]
-            for handler in handlers:
+            if handlers and message.get('producer') not in settings.trusted_producers:
                 schema_registry.validate_event(event_name, event_version, message)
-                await handler(message['event_name'], event_version, message['data'])
+        except (ValueError, TypeError, KeyError, struct.error, ValidationError) as error:
+            raise PoisonMessageError(f'{type(error).__name__}: {error}') from error
+        metrics.validation_duration.labels(event_name=event_name).observe(time.perf_counter() - started_at)
+        return message, handlers
+
+    async def handle_message(record: ConsumerRecord):
+        message, handlers = parse_message(record)
+        event_id = message.get('event_id')
+        if event_id and event_id in recent_event_ids:
+            recent_event_ids.skipped += 1
+            metrics.duplicates.inc()
+            logger.debug('Event %s has been handled already, skipped', event_id)
+            return
+        event_name = message['event_name']
+        # Payloads are formatted for a sample only, formatting every one of them costs more than handling some
+        if settings.event_log_sample_rate and random.random() < settings.event_log_sample_rate:
+            logger.info('%s %s: %s', event_name, event_id, message['data'])
+        # Partitions are handled by separate asyncio tasks, so each of them sees the ID of its own record
+        current_event_id.set(event_id)
+        for handler in handlers:
+            handler_name = handler.__qualname__
+            try:
+                with metrics.handler_duration.labels(handler=handler_name, event_name=event_name).time():
+                    await handler(event_name, message.get('event_version', 1), message['data'])
+            except Exception:
+                metrics.handler_errors.labels(handler=handler_name, event_name=event_name).inc()
+                raise
+        metrics.events.labels(event_name=event_name).inc()
+        if event_id:
+            recent_event_ids.add(event_id)
+
+    def create_consumer(consumer_topics, consumer_group, handle_record: RecordHandler, get_delay=None) -> BatchConsumer:
+        return BatchConsumer(
+            settings.bootstrap_servers,
+            consumer_topics,
+            consumer_group,
+            handle_record,
+            batch_size=settings.consumer_batch_size,
+            max_in_flight_partitions=settings.consumer_max_in_flight_partitions,
+            linger_ms=settings.consumer_linger_ms,
+            get_delay=get_delay,
+        )
+
+    metrics_server, _ = start_http_server(settings.metrics_port) if settings.metrics_port else (None, None)
+    try:
+        if group is None:
+            # Without a group there are no retry topics, so a failed message is skipped
+            async def handle_record_once(record: ConsumerRecord):
+                try:
+                    await handle_message(record)
+                except Exception:
+                    metrics.failures.labels(topic=record.topic, outcome='skipped').inc()
+                    logger.exception('Message %s:%s@%s failed, skipped', record.topic, record.partition, record.offset)
+
+            await create_consumer(topics, None, handle_record_once).run()
+            return
+
+        producer = AIOKafkaProducer(bootstrap_servers=settings.bootstrap_servers)
+        await producer.start()
+        failures = FailureRouter(producer, group, settings.consumer_max_retries, settings.consumer_retry_backoff)
+
+        async def handle_record(record: ConsumerRecord):
+            try:
+                await retry_in_place(
+                    handle_message, record,
+                    settings.consumer_in_place_retries, settings.consumer_in_place_retry_backoff,
+                )
+            except Exception as error:
+                # A message still failing is moved aside, so the rest of its partition and the other partitions go on
+                await failures.handle_failure(record, error)
+
+        # Every retry topic is read by its own consumer, so waiting for a delayed message doesn't hold back the others
+        consumers = [create_consumer(topics, group, handle_record)] + [
+            create_consumer([retry_topic], retry_topic, handle_record, get_delay=get_remaining_delay)
+            for retry_topic in failures.retry_topics
+        ]
+        consumer_tasks = [asyncio.create_task(consumer.run()) for consumer in consumers]
+        try:
+            await asyncio.gather(*consumer_tasks)
+        finally:
+            for consumer_task in consumer_tasks:
+                consumer_task.cancel()
+            await producer.stop()
     finally:
-        await consumer.stop()
+        if metrics_server:
+            # The server thread stops after its current poll, the event loop is not blocked meanwhile
+            await asyncio.to_thread(metrics_server.shutdown)
+            metrics_server.server_close()
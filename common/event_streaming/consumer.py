@@ -0,0 +1,155 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+from aiokafka import AIOKafkaConsumer, ConsumerRebalanceListener, ConsumerRecord, TopicPartition
+
+from event_streaming import metrics
+
+RecordHandler = Callable[[ConsumerRecord], Awaitable[None]]
+# Seconds left until a record is due, records of a delayed topic are handled once they are due
+RecordDelay = Callable[[ConsumerRecord], float]
+
+
+class _RevocationListener(ConsumerRebalanceListener):
+    def __init__(self, batch_consumer: 'BatchConsumer'):
+        self._batch_consumer = batch_consumer
+
+    async def on_partitions_revoked(self, revoked):
+        # Records of revoked partitions not committed yet are redelivered to their new consumer
+        await self._batch_consumer.stop_workers(revoked)
+
+    async def on_partitions_assigned(self, assigned):
+        pass
+
+
+class BatchConsumer:
+    """
+    Fetches records by batches and hands the batch of every partition to the task of the partition, so a slow
+    partition holds back neither the fetching nor the other partitions. A partition is committed by its task once
+    its batch is handled, and it's not fetched while its task has a batch waiting.
+    """
+
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        topics: Iterable[str],
+        group: str | None,
+        handle_record: RecordHandler,
+        batch_size: int,
+        max_in_flight_partitions: int,
+        linger_ms: int,
+        get_delay: RecordDelay | None = None,
+    ):
+        self._bootstrap_servers = bootstrap_servers
+        self._topics = tuple(topics)
+        self._group = group
+        self._handle_record = handle_record
+        self._batch_size = batch_size
+        self._linger_ms = linger_ms
+        self._get_delay = get_delay
+        self._partition_slots = asyncio.Semaphore(max_in_flight_partitions)
+        self._consumer: AIOKafkaConsumer | None = None
+        self._queues: Dict[TopicPartition, asyncio.Queue] = {}
+        self._workers: Dict[TopicPartition, asyncio.Task] = {}
+        self._failure: BaseException | None = None
+
+    def create_kafka_consumer(self) -> AIOKafkaConsumer:
+        return AIOKafkaConsumer(
+            bootstrap_servers=self._bootstrap_servers,
+            group_id=self._group,
+            enable_auto_commit=False,
+            fetch_max_wait_ms=self._linger_ms,
+            max_poll_records=self._batch_size,
+        )
+
+    async def run(self):
+        self._consumer = consumer = self.create_kafka_consumer()
+        consumer.subscribe(self._topics, listener=_RevocationListener(self))
+        await consumer.start()
+        try:
+            # A failed partition stops the consumer, its records are redelivered after a restart
+            while self._failure is None:
+                batch: Dict[TopicPartition, List[ConsumerRecord]] = await consumer.getmany(
+                    timeout_ms=self._linger_ms,
+                    max_records=self._batch_size,
+                )
+                for topic_partition, records in batch.items():
+                    self._dispatch(topic_partition, records)
+                await self._record_metrics(consumer, batch)
+            raise self._failure
+        finally:
+            await self.stop_workers(list(self._workers))
+            await consumer.stop()
+
+    async def stop_workers(self, partitions: Iterable[TopicPartition]):
+        workers = []
+        for topic_partition in partitions:
+            self._queues.pop(topic_partition, None)
+            worker = self._workers.pop(topic_partition, None)
+            if worker is not None:
+                worker.cancel()
+                workers.append(worker)
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def _dispatch(self, topic_partition: TopicPartition, records: List[ConsumerRecord]):
+        queue = self._queues.get(topic_partition)
+        if queue is None:
+            queue = self._queues[topic_partition] = asyncio.Queue()
+            worker = self._workers[topic_partition] = asyncio.create_task(
+                self._process_partition(topic_partition, queue),
+            )
+            worker.add_done_callback(self._on_worker_done)
+        queue.put_nowait(records)
+        # The partition is fetched again once its task takes the batch, so at most one batch of it is waiting
+        self._pause(topic_partition)
+
+    def _on_worker_done(self, worker: asyncio.Task):
+        if not worker.cancelled() and worker.exception() is not None and self._failure is None:
+            self._failure = worker.exception()
+
+    def _pause(self, topic_partition: TopicPartition):
+        if topic_partition in self._consumer.assignment():
+            self._consumer.pause(topic_partition)
+
+    def _resume(self, topic_partition: TopicPartition, queue: asyncio.Queue):
+        if queue.empty() and topic_partition in self._consumer.assignment():
+            self._consumer.resume(topic_partition)
+
+    async def _process_partition(self, topic_partition: TopicPartition, queue: asyncio.Queue):
+        # Records of a partition are handled sequentially to keep the order of events with the same key
+        while True:
+            records: List[ConsumerRecord] = await queue.get()
+            self._resume(topic_partition, queue)
+            await self._handle_records(topic_partition, queue, records)
+            if self._group is not None:
+                await self._consumer.commit({topic_partition: records[-1].offset + 1})
+
+    def _is_due(self, record: ConsumerRecord) -> bool:
+        return self._get_delay is None or self._get_delay(record) <= 0
+
+    async def _handle_records(
+        self, topic_partition: TopicPartition, queue: asyncio.Queue, records: List[ConsumerRecord],
+    ):
+        position = 0
+        while position < len(records):
+            if not self._is_due(records[position]):
+                # A delayed record waits without taking a slot, its partition is not fetched meanwhile
+                self._pause(topic_partition)
+                await asyncio.sleep(self._get_delay(records[position]))
+                self._resume(topic_partition, queue)
+            async with self._partition_slots:
+                while position < len(records) and self._is_due(records[position]):
+                    await self._handle_record(records[position])
+                    position += 1
+
+    async def _record_metrics(self, consumer: AIOKafkaConsumer, batch: Dict[TopicPartition, List[ConsumerRecord]]):
+        group = self._group or ''
+        for topic_partition, records in batch.items():
+            metrics.records.labels(group=group, topic=topic_partition.topic).inc(len(records))
+        # Paused partitions and the ones without new records are measured as well, their lag would be stale otherwise
+        for topic_partition in consumer.assignment():
+            highwater = consumer.highwater(topic_partition)
+            if highwater is not None:
+                metrics.consumer_lag.labels(
+                    group=group, topic=topic_partition.topic, partition=topic_partition.partition,
+                ).set(highwater - await consumer.position(topic_partition))
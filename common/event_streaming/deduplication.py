@@ -0,0 +1,25 @@
+from collections import OrderedDict
+
+
+class RecentEventIds:
+    """Bounded set of IDs of the recently handled events, the least recently seen ones are forgotten first."""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._event_ids: OrderedDict[str, None] = OrderedDict()
+        self.skipped = 0
+
+    def __contains__(self, event_id: str) -> bool:
+        if event_id in self._event_ids:
+            self._event_ids.move_to_end(event_id)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._event_ids)
+
+    def add(self, event_id: str):
+        self._event_ids[event_id] = None
+        self._event_ids.move_to_end(event_id)
+        while len(self._event_ids) > self._max_size:
+            self._event_ids.popitem(last=False)
@@ -0,0 +1,93 @@
+"""
+Wire formats of events.
+
+JSON records carry the whole message as text. Binary records carry only the event data packed with msgpack as an
+array of values in the order of the fields of the event schema, while the envelope goes to record headers:
+
+    ev-schema    4 bytes, ID of the (event name, version) schema, see schema_registry.get_schema_id()
+    ev-id        16 bytes of the event UUID
+    ev-time      8 bytes, microseconds since 1970-01-01 of the naive event time
+    ev-producer  name of the producer
+
+A record is decoded as binary if it has the ev-schema header, so JSON records are still read during the migration.
+"""
+import datetime
+import enum
+import json
+import struct
+from typing import List, Sequence, Tuple
+
+import msgpack
+
+from event_streaming.schema_registry import SchemaRegistry
+
+schema_header = 'ev-schema'
+event_id_header = 'ev-id'
+event_time_header = 'ev-time'
+producer_header = 'ev-producer'
+
+Headers = List[Tuple[str, bytes]]
+
+_epoch = datetime.datetime(1970, 1, 1)
+_microsecond = datetime.timedelta(microseconds=1)
+# Marks a field missing from the data, unlike a field set to null
+_missing = msgpack.ExtType(0, b'')
+_schema_id = struct.Struct('>I')
+_event_time = struct.Struct('>q')
+
+
+def _format_uuid(uuid_bytes: bytes) -> str:
+    # Formatting by hand is several times faster than str(uuid.UUID(bytes=...))
+    digits = uuid_bytes.hex()
+    return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+
+
+class EventEncoding(enum.Enum):
+    json = 'json'
+    binary = 'binary'
+
+
+class EventCodec:
+    def __init__(self, schema_registry: SchemaRegistry):
+        self._schema_registry = schema_registry
+
+    def encode(self, message: dict, encoding: EventEncoding) -> Tuple[bytes, Headers]:
+        if encoding == EventEncoding.json:
+            return json.dumps(message).encode(), []
+        event_name, event_version = message['event_name'], message['event_version']
+        fields = self._schema_registry.get_data_fields(event_name, event_version)
+        data = message['data']
+        values = [data.get(field, _missing) for field in fields]
+        extra_fields = {field: value for field, value in data.items() if field not in fields}
+        if extra_fields:
+            values.append(extra_fields)
+        event_time = datetime.datetime.fromisoformat(message['event_time'])
+        if event_time.tzinfo is not None:
+            raise ValueError('Only naive event times are supported by the binary encoding')
+        headers = [
+            (schema_header, _schema_id.pack(self._schema_registry.get_schema_id(event_name, event_version))),
+            (event_id_header, bytes.fromhex(message['event_id'].replace('-', ''))),
+            (event_time_header, _event_time.pack((event_time - _epoch) // _microsecond)),
+            (producer_header, message['producer'].encode()),
+        ]
+        return msgpack.packb(values), headers
+
+    def decode(self, value: bytes, headers: Sequence[Tuple[str, bytes]] | None) -> dict:
+        envelope = dict(headers or ())
+        if schema_header not in envelope:
+            return json.loads(value)
+        event_name, event_version = self._schema_registry.get_schema(_schema_id.unpack(envelope[schema_header])[0])
+        fields = self._schema_registry.get_data_fields(event_name, event_version)
+        values = msgpack.unpackb(value)
+        data = {field: field_value for field, field_value in zip(fields, values) if field_value != _missing}
+        if len(values) > len(fields):
+            data.update(values[-1])
+        event_time = _epoch + _event_time.unpack(envelope[event_time_header])[0] * _microsecond
+        return {
+            'event_id': _format_uuid(envelope[event_id_header]),
+            'event_name': event_name,
+            'event_time': event_time.isoformat(),
+            'event_version': event_version,
+            'producer': envelope[producer_header].decode(),
+            'data': data,
+        }
@@ -0,0 +1,37 @@
+"""
+Metrics of event consumers and producers, consumers serve them on Settings.metrics_port.
+
+Events/s of a topic is rate(event_streaming_records_total[1m]), the lag of every assigned partition is taken on every
+poll from the highwater offset of its latest fetch and its position.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Schema validation takes tens of microseconds, handlers take milliseconds
+validation_buckets = (.00001, .000025, .00005, .0001, .00025, .0005, .001, .0025, .005, .01)
+
+records = Counter(
+    'event_streaming_records_total', "Records consumed.", ['group', 'topic'],
+)
+consumer_lag = Gauge(
+    'event_streaming_consumer_lag', "Records of a partition not fetched yet.", ['group', 'topic', 'partition'],
+)
+events = Counter(
+    'event_streaming_events_total', "Events handled.", ['event_name'],
+)
+duplicates = Counter(
+    'event_streaming_duplicate_events_total', "Redelivered events skipped before reaching the handlers.",
+)
+validation_duration = Histogram(
+    'event_streaming_validation_duration_seconds', "Time of decoding and validating an event.", ['event_name'],
+    buckets=validation_buckets,
+)
+handler_duration = Histogram(
+    'event_streaming_handler_duration_seconds', "Time of handling an event by a handler.", ['handler', 'event_name'],
+)
+handler_errors = Counter(
+    'event_streaming_handler_errors_total', "Failures of handlers.", ['handler', 'event_name'],
+)
+failures = Counter(
+    'event_streaming_failures_total', "Messages failed to be handled, by the way they are dealt with.",
+    ['topic', 'outcome'],
+)
@@ -0,0 +1,106 @@
+"""
+Re-drives messages parked on the dead-letter topic of a consumer group through its first retry topic.
+
+    python -m event_streaming.redrive accounting [--limit 100] [--dry-run]
+
+Only the messages parked before the start are re-driven, the ones failing again are parked after them. Progress is
+committed by the `<group>.dlq.redrive` consumer group, so the next run continues from where this one has stopped.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, TopicPartition
+
+from event_streaming import Settings
+from event_streaming.retries import (
+    attempt_header, build_headers, error_header, get_dead_letter_topic, get_header, get_retry_topic,
+    original_topic_header, retry_at_header,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def redrive(settings: Settings, group: str, limit: int | None = None, dry_run: bool = False) -> int:
+    dead_letter_topic = get_dead_letter_topic(group)
+    retry_topic = get_retry_topic(group, 1)
+    consumer = AIOKafkaConsumer(
+        bootstrap_servers=settings.bootstrap_servers,
+        group_id=f'{dead_letter_topic}.redrive',
+        enable_auto_commit=False,
+    )
+    producer = AIOKafkaProducer(bootstrap_servers=settings.bootstrap_servers)
+    await consumer.start()
+    await producer.start()
+    redriven = 0
+    try:
+        await consumer.topics()  # metadata of the dead-letter topic is fetched
+        partitions = [
+            TopicPartition(dead_letter_topic, partition)
+            for partition in consumer.partitions_for_topic(dead_letter_topic) or ()
+        ]
+        if not partitions:
+            logger.info('%s is empty', dead_letter_topic)
+            return 0
+        consumer.assign(partitions)
+        for partition in partitions:
+            committed_offset = await consumer.committed(partition)
+            if committed_offset is None:
+                await consumer.seek_to_beginning(partition)
+            else:
+                consumer.seek(partition, committed_offset)
+        end_offsets = await consumer.end_offsets(partitions)
+        remaining = set()
+        for partition in partitions:
+            if await consumer.position(partition) < end_offsets[partition]:
+                remaining.add(partition)
+        while remaining and (limit is None or redriven < limit):
+            batch = await consumer.getmany(*remaining, timeout_ms=1000)
+            offsets = {}
+            for partition, records in batch.items():
+                for record in records:
+                    if record.offset >= end_offsets[partition] or (limit is not None and redriven >= limit):
+                        remaining.discard(partition)
+                        break
+                    logger.info(
+                        'Re-drive %s:%s@%s from %s, %s attempts, error: %s',
+                        record.topic, record.partition, record.offset, get_header(record, original_topic_header),
+                        get_header(record, attempt_header), get_header(record, error_header),
+                    )
+                    if not dry_run:
+                        # The message goes through all the retries again, it's sent as the first one is
+                        await producer.send_and_wait(
+                            retry_topic,
+                            record.value,
+                            key=record.key,
+                            headers=build_headers(record, {attempt_header: '1', retry_at_header: str(time.time())}),
+                        )
+                    offsets[partition] = record.offset + 1
+                    redriven += 1
+                if offsets.get(partition, 0) >= end_offsets[partition]:
+                    remaining.discard(partition)
+            if offsets and not dry_run:
+                await consumer.commit(offsets)
+    finally:
+        await producer.stop()
+        await consumer.stop()
+    return redriven
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('group', help="Consumer group whose dead-letter topic is re-driven.")
+    parser.add_argument('--limit', type=int, help="Re-drive at most this number of messages.")
+    parser.add_argument('--dry-run', action='store_true', help="Only list the parked messages.")
+    arguments = parser.parse_args()
+    settings = Settings()
+    if settings.consumer_max_retries < 1:
+        parser.error('Retries are disabled, there is no retry topic to re-drive messages through.')
+    redriven = asyncio.run(redrive(settings, arguments.group, arguments.limit, arguments.dry_run))
+    logger.info('%s messages %s', redriven, 'found' if arguments.dry_run else 're-driven')
+
+
+if __name__ == '__main__':
+    main()
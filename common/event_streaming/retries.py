@@ -0,0 +1,150 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Awaitable, Callable, List, Mapping, Tuple
+
+from aiokafka import AIOKafkaProducer, ConsumerRecord
+
+from event_streaming import metrics
+
+logger = logging.getLogger(__name__)
+
+# Failure metadata is carried in headers, the key and the value of a failed message are kept as is
+attempt_header = 'x-attempt'
+retry_at_header = 'x-retry-at'
+error_header = 'x-error'
+failed_at_header = 'x-failed-at'
+original_topic_header = 'x-original-topic'
+original_partition_header = 'x-original-partition'
+original_offset_header = 'x-original-offset'
+
+Headers = List[Tuple[str, bytes]]
+
+
+class PoisonMessageError(Exception):
+    """The message cannot be handled whatever times it's retried (malformed or failing validation)."""
+
+
+def get_retry_topic(group: str, attempt: int) -> str:
+    return f'{group}.retry.{attempt}'
+
+
+def get_dead_letter_topic(group: str) -> str:
+    return f'{group}.dlq'
+
+
+def get_header(record: ConsumerRecord, name: str) -> str | None:
+    for header_name, value in record.headers or ():
+        if header_name == name:
+            return value.decode()
+    return None
+
+
+def get_attempt(record: ConsumerRecord) -> int:
+    return int(get_header(record, attempt_header) or 0)
+
+
+def get_retry_at(record: ConsumerRecord) -> float | None:
+    retry_at = get_header(record, retry_at_header)
+    return float(retry_at) if retry_at else None
+
+
+def get_remaining_delay(record: ConsumerRecord) -> float:
+    retry_at = get_retry_at(record)
+    return retry_at - time.time() if retry_at else 0
+
+
+async def retry_in_place(
+    handle_record: Callable[[ConsumerRecord], Awaitable[None]],
+    record: ConsumerRecord,
+    retries: int,
+    retry_backoff: float,
+):
+    """
+    Retries a failed message right away a few times before it's moved aside, so transient failures don't let later
+    events of the same entity overtake it. A poison message is not retried.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await handle_record(record)
+        except PoisonMessageError:
+            raise
+        except Exception as error:
+            if attempt == retries:
+                raise
+            delay = retry_backoff * 2 ** attempt
+            logger.warning('Message %s:%s@%s failed, retry in place in %ss: %r',
+                           record.topic, record.partition, record.offset, delay, error)
+            metrics.failures.labels(topic=record.topic, outcome='retried_in_place').inc()
+            await asyncio.sleep(delay)
+
+
+def build_headers(record: ConsumerRecord, updates: Mapping[str, str]) -> Headers:
+    headers = {name: value for name, value in record.headers or ()}
+    # Retry time is only valid for the topic the message has been sent to
+    headers.pop(retry_at_header, None)
+    # The origin is recorded by the first failure only, retries keep it
+    headers.setdefault(original_topic_header, record.topic.encode())
+    headers.setdefault(original_partition_header, str(record.partition).encode())
+    headers.setdefault(original_offset_header, str(record.offset).encode())
+    for name, value in updates.items():
+        headers[name] = value.encode()
+    return list(headers.items())
+
+
+class FailureRouter:
+    """Moves failed messages of a consumer group to delayed retry topics and finally to the dead-letter topic."""
+
+    def __init__(self, producer: AIOKafkaProducer, group: str, max_retries: int, retry_backoff: float):
+        self._producer = producer
+        self._group = group
+        self.max_retries = max_retries
+        self._retry_backoff = retry_backoff
+
+    @property
+    def retry_topics(self) -> List[str]:
+        return [get_retry_topic(self._group, attempt) for attempt in range(1, self.max_retries + 1)]
+
+    def get_retry_delay(self, attempt: int) -> float:
+        return self._retry_backoff * 2 ** (attempt - 1)
+
+    async def handle_failure(self, record: ConsumerRecord, error: Exception):
+        attempt = get_attempt(record) + 1
+        if isinstance(error, PoisonMessageError) or attempt > self.max_retries:
+            await self.dead_letter(record, error, attempt)
+        else:
+            await self.retry(record, error, attempt)
+
+    async def retry(self, record: ConsumerRecord, error: Exception, attempt: int):
+        topic = get_retry_topic(self._group, attempt)
+        delay = self.get_retry_delay(attempt)
+        logger.warning('Message %s:%s@%s failed, retry %s in %ss: %r',
+                       record.topic, record.partition, record.offset, attempt, delay, error)
+        metrics.failures.labels(topic=record.topic, outcome='retried').inc()
+        await self._producer.send_and_wait(
+            topic,
+            record.value,
+            key=record.key,
+            headers=build_headers(record, {
+                attempt_header: str(attempt),
+                retry_at_header: str(time.time() + delay),
+                error_header: repr(error),
+            }),
+        )
+
+    async def dead_letter(self, record: ConsumerRecord, error: Exception, attempts: int):
+        topic = get_dead_letter_topic(self._group)
+        logger.error('Message %s:%s@%s failed %s times, parked on %s: %r',
+                     record.topic, record.partition, record.offset, attempts, topic, error)
+        metrics.failures.labels(topic=record.topic, outcome='dead_lettered').inc()
+        await self._producer.send_and_wait(
+            topic,
+            record.value,
+            key=record.key,
+            headers=build_headers(record, {
+                attempt_header: str(attempts),
+                error_header: repr(error),
+                failed_at_header: datetime.datetime.now().isoformat(),
+            }),
+        )
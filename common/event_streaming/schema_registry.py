@@ -1,13 +1,34 @@
 import json
 from pathlib import Path
-from typing import Dict, Tuple, Type
+from typing import Callable, Dict, List, Tuple, Type
+import zlib
 
+import fastjsonschema
 import jsonschema
 
+ValidationError = fastjsonschema.JsonSchemaValueException
+
+
+def get_schema_id(name: str, version: int) -> int:
+    # Every service derives the same ID from the schema name and version, so no ID assignment is shared
+    return zlib.crc32(f'{name}/{version}'.encode())
+
+
+def get_data_fields(schema: dict) -> List[str]:
+    data_schema = schema['properties']['data']
+    if '$ref' in data_schema:
+        for key in data_schema['$ref'].removeprefix('#/').split('/'):
+            schema = schema[key]
+        data_schema = schema
+    return list(data_schema.get('properties', ()))
+
 
 class SchemaRegistry:
     def __init__(self):
-        self._validators: Dict[Tuple[str, int], jsonschema.Validator] = dict()
+        self._validators: Dict[Tuple[str, int], Callable[[dict], dict]] = dict()
+        self._data_fields: Dict[Tuple[str, int], List[str]] = dict()
+        self._schemas_by_id: Dict[int, Tuple[str, int]] = dict()
+        self._schema_ids: Dict[Tuple[str, int], int] = dict()
 
     def load_schemas(self, directory: str):
         directory_path = Path(directory)
@@ -19,7 +40,24 @@ class SchemaRegistry:
                 validator_class.check_schema(schema)
                 event_name = json_file.parent.name
                 event_version = int(json_file.name.split('.json')[0])
-                self._validators[event_name, event_version] = validator_class(schema)
+                # Schemas are compiled to python code once, at load time
+                self._validators[event_name, event_version] = fastjsonschema.compile(schema)
+                self._data_fields[event_name, event_version] = get_data_fields(schema)
+                schema_id = get_schema_id(event_name, event_version)
+                if self._schemas_by_id.get(schema_id, (event_name, event_version)) != (event_name, event_version):
+                    raise ValueError(f'Schemas {self._schemas_by_id[schema_id]} and {event_name, event_version} '
+                                     f'have the same ID {schema_id}')
+                self._schemas_by_id[schema_id] = event_name, event_version
+                self._schema_ids[event_name, event_version] = schema_id
 
     def validate_event(self, name, version, data):
-        self._validators[name, version].validate(data)
+        self._validators[name, version](data)
+
+    def get_data_fields(self, name: str, version: int) -> List[str]:
+        return self._data_fields[name, version]
+
+    def get_schema_id(self, name: str, version: int) -> int:
+        return self._schema_ids[name, version]
+
+    def get_schema(self, schema_id: int) -> Tuple[str, int]:
+        return self._schemas_by_id[schema_id]
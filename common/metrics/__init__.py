@@ -0,0 +1,47 @@
+"""
+Spans of a unit of work (e.g. SQL queries of a web request): their time is summed up by kind in the SpanTimings of
+the unit, and they are exported as OpenTelemetry spans if the process has set up a tracer.
+
+Metrics themselves are prometheus_client ones, registered in its default registry at import time.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+from typing import Any, Dict
+
+
+class SpanTimings:
+    def __init__(self):
+        self.durations: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, duration: float):
+        self.durations[name] += duration
+        self.counts[name] += 1
+
+
+current_span_timings: ContextVar[SpanTimings | None] = ContextVar('current_span_timings', default=None)
+# OpenTelemetry tracer (opentelemetry.trace.Tracer) spans are exported with, optional dependencies are not imported here
+tracer: Any = None
+
+
+def record_span(name: str, duration: float, **attributes):
+    """Records a span that has just finished, e.g. one measured by a pair of event hooks."""
+    span_timings = current_span_timings.get()
+    if span_timings is not None:
+        span_timings.add(name, duration)
+    if tracer is not None:
+        finished_at = time.time_ns()
+        tracer.start_span(
+            name, start_time=finished_at - int(duration * 1e9), attributes=attributes,
+        ).end(end_time=finished_at)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started_at, **attributes)
@@ -0,0 +1,153 @@
+import dataclasses
+import enum
+import logging
+import re
+from typing import Callable, List, Sequence
+import zlib
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+schema_version_table = Table(
+    'schema_version',
+    MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String, nullable=False),
+    Column('applied_at', DateTime, nullable=False, server_default=func.now()),
+)
+
+
+class SchemaMode(enum.Enum):
+    migrate = 'migrate'  # pending migrations are applied on startup
+    check = 'check'  # startup fails if there are pending migrations, no DDL is run
+
+
+class SchemaOutdatedError(Exception):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+    # A non-transactional migration runs in autocommit mode, so it has to be idempotent
+    transactional: bool = True
+
+
+def execute(*statements: str) -> Callable[[Connection], None]:
+    def upgrade(connection: Connection):
+        for statement in statements:
+            connection.execute(text(statement))
+    return upgrade
+
+
+_create_index_regex = re.compile(r'CREATE (UNIQUE )?INDEX (\w+) (ON .+)', re.DOTALL)
+
+
+def create_indexes(*statements: str) -> Callable[[Connection], None]:
+    """
+    Builds indexes given as `CREATE [UNIQUE] INDEX <name> ON ...` statements with CREATE INDEX CONCURRENTLY, so
+    writes to their tables are not blocked meanwhile. It can't run in a transaction, the migration is not
+    transactional.
+    """
+    indexes = []
+    for statement in statements:
+        match = _create_index_regex.fullmatch(statement.strip())
+        if not match:
+            raise ValueError(f'Not a CREATE INDEX statement: {statement}')
+        indexes.append(match.groups())
+
+    def upgrade(connection: Connection):
+        for unique, name, definition in indexes:
+            # An interrupted build leaves an invalid index behind, it is built anew
+            invalid = connection.execute(text(
+                'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'
+            ), {'name': name}).scalar()
+            if invalid:
+                connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+            connection.execute(text(f'CREATE {unique or ""}INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}'))
+    return upgrade
+
+
+def get_applied_version(connection: Connection) -> int:
+    if not inspect(connection).has_table(schema_version_table.name):
+        return 0
+    return connection.execute(select(func.coalesce(func.max(schema_version_table.c.version), 0))).scalar()
+
+
+def get_pending_migrations(connection: Connection, migrations: Sequence[Migration]) -> List[Migration]:
+    applied_version = get_applied_version(connection)
+    return sorted(
+        (migration for migration in migrations if migration.version > applied_version),
+        key=lambda migration: migration.version,
+    )
+
+
+def check(connection: Connection, migrations: Sequence[Migration]):
+    pending_migrations = get_pending_migrations(connection, migrations)
+    if pending_migrations:
+        raise SchemaOutdatedError('Pending schema migrations: ' + ', '.join(
+            f'{migration.version} ({migration.description})' for migration in pending_migrations
+        ))
+
+
+def apply(connection: Connection, migrations: Sequence[Migration]):
+    for migration in migrations:
+        logger.info('Applying schema migration %s: %s', migration.version, migration.description)
+        migration.upgrade(connection)
+        connection.execute(schema_version_table.insert().values(
+            version=migration.version,
+            description=migration.description,
+        ))
+
+
+def get_next_batch(pending_migrations: Sequence[Migration]) -> List[Migration]:
+    # Transactional migrations in a row are applied in a single transaction, the other ones one by one
+    if not pending_migrations[0].transactional:
+        return [pending_migrations[0]]
+    batch = []
+    for migration in pending_migrations:
+        if not migration.transactional:
+            break
+        batch.append(migration)
+    return batch
+
+
+async def migrate(engine: AsyncEngine, migrations: Sequence[Migration]) -> List[Migration]:
+    # Nothing is locked and no DDL is run when the schema is up to date
+    async with engine.connect() as connection:
+        if not await connection.run_sync(get_pending_migrations, migrations):
+            return []
+    applied_migrations = []
+    async with engine.connect() as lock_connection:
+        await lock_connection.execution_options(isolation_level='AUTOCOMMIT')
+        # Services sharing the database may start simultaneously, so migrations are applied by one of them. The
+        # lock is held by the session, it outlives the transactions of the migrations
+        lock_key = zlib.crc32(schema_version_table.name.encode())
+        await lock_connection.execute(text('SELECT pg_advisory_lock(:key)'), {'key': lock_key})
+        try:
+            await lock_connection.run_sync(schema_version_table.create, checkfirst=True)
+            while pending_migrations := await lock_connection.run_sync(get_pending_migrations, migrations):
+                batch = get_next_batch(pending_migrations)
+                if batch[0].transactional:
+                    # A failed migration rolls back its whole batch
+                    async with engine.begin() as connection:
+                        await connection.run_sync(apply, batch)
+                else:
+                    await lock_connection.run_sync(apply, batch)
+                applied_migrations.extend(batch)
+        finally:
+            await lock_connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': lock_key})
+    return applied_migrations
+
+
+async def setup_schema(engine: AsyncEngine, migrations: Sequence[Migration], mode: SchemaMode):
+    if mode == SchemaMode.migrate:
+        await migrate(engine, migrations)
+    else:
+        async with engine.connect() as connection:
+            await connection.run_sync(check, migrations)
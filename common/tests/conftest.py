@@ -0,0 +1,25 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+
+@pytest.fixture
+def engine() -> AsyncEngine:
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+
+    async def drop_tables():
+        engine = create_async_engine(url)
+        async with engine.begin() as connection:
+            await connection.execute(text('DROP SCHEMA public CASCADE'))
+            await connection.execute(text('CREATE SCHEMA public'))
+        await engine.dispose()
+
+    asyncio.run(drop_tables())
+    # Every test runs its own event loop, so connections are not pooled between them
+    return create_async_engine(url, poolclass=NullPool)
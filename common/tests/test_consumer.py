@@ -0,0 +1,224 @@
+import asyncio
+from collections import defaultdict
+import time
+from typing import Dict, List
+
+from aiokafka import ConsumerRecord, TopicPartition
+from prometheus_client import REGISTRY
+import pytest
+
+from event_streaming.consumer import BatchConsumer
+
+first_partition = TopicPartition('events', 0)
+second_partition = TopicPartition('events', 1)
+
+
+def create_record(topic_partition: TopicPartition, offset: int) -> ConsumerRecord:
+    return ConsumerRecord(
+        topic_partition.topic, topic_partition.partition, offset, 0, 0, None, b'', None, 0, 0, [],
+    )
+
+
+class FakeKafkaConsumer:
+    """Serves the given records of every partition, the paused partitions are not fetched."""
+
+    def __init__(self, records: Dict[TopicPartition, List[ConsumerRecord]], batch_size: int):
+        self._records = records
+        self._positions = {topic_partition: 0 for topic_partition in records}
+        self._paused = set()
+        self._batch_size = batch_size
+        self.commits: Dict[TopicPartition, List[int]] = defaultdict(list)
+
+    def subscribe(self, topics, listener=None):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def assignment(self):
+        return set(self._records)
+
+    def pause(self, *partitions):
+        self._paused.update(partitions)
+
+    def resume(self, *partitions):
+        self._paused.difference_update(partitions)
+
+    def highwater(self, topic_partition):
+        return len(self._records[topic_partition])
+
+    async def position(self, topic_partition):
+        return self._positions[topic_partition]
+
+    async def getmany(self, timeout_ms, max_records):
+        batch = {}
+        for topic_partition, records in self._records.items():
+            position = self._positions[topic_partition]
+            if topic_partition not in self._paused and position < len(records):
+                batch[topic_partition] = records[position:position + self._batch_size]
+                self._positions[topic_partition] += len(batch[topic_partition])
+        if not batch:
+            await asyncio.sleep(timeout_ms / 1000)
+        return batch
+
+    async def commit(self, offsets):
+        for topic_partition, offset in offsets.items():
+            self.commits[topic_partition].append(offset)
+
+
+def create_consumer(
+    kafka_consumer: FakeKafkaConsumer, handle_record, group='group', max_in_flight_partitions=8, get_delay=None,
+) -> BatchConsumer:
+    consumer = BatchConsumer(
+        'kafka:9092', ['events'], group, handle_record, 2, max_in_flight_partitions, 10, get_delay=get_delay,
+    )
+    consumer.create_kafka_consumer = lambda: kafka_consumer
+    return consumer
+
+
+def test_slow_partition_does_not_hold_back_others():
+    kafka_consumer = FakeKafkaConsumer({
+        first_partition: [create_record(first_partition, offset) for offset in range(2)],
+        second_partition: [create_record(second_partition, offset) for offset in range(6)],
+    }, batch_size=2)
+    first_partition_released = asyncio.Event()
+    handled = defaultdict(list)
+
+    async def handle_record(record: ConsumerRecord):
+        if record.partition == first_partition.partition:
+            await first_partition_released.wait()
+        handled[record.partition].append(record.offset)
+
+    async def scenario():
+        consumer_task = asyncio.create_task(create_consumer(kafka_consumer, handle_record).run())
+        while kafka_consumer.commits[second_partition][-1:] != [6]:
+            await asyncio.sleep(0.01)
+        # Every batch of the second partition is handled and committed while the first one is still blocked
+        assert handled[second_partition.partition] == list(range(6))
+        assert kafka_consumer.commits[second_partition] == [2, 4, 6]
+        assert not handled[first_partition.partition]
+        first_partition_released.set()
+        while kafka_consumer.commits[first_partition][-1:] != [2]:
+            await asyncio.sleep(0.01)
+        consumer_task.cancel()
+
+    asyncio.run(scenario())
+    assert handled[first_partition.partition] == [0, 1]
+
+
+def test_partition_is_not_fetched_while_its_batch_is_waiting():
+    kafka_consumer = FakeKafkaConsumer({
+        first_partition: [create_record(first_partition, offset) for offset in range(10)],
+    }, batch_size=2)
+    handling_released = asyncio.Event()
+
+    async def handle_record(record: ConsumerRecord):
+        await handling_released.wait()
+
+    async def scenario():
+        consumer_task = asyncio.create_task(create_consumer(kafka_consumer, handle_record).run())
+        await asyncio.sleep(0.1)
+        # A batch is being handled, the next one is waiting and the partition is paused
+        assert kafka_consumer._positions[first_partition] == 4
+        handling_released.set()
+        while kafka_consumer.commits[first_partition][-1:] != [10]:
+            await asyncio.sleep(0.01)
+        consumer_task.cancel()
+
+    asyncio.run(scenario())
+    assert kafka_consumer.commits[first_partition] == [2, 4, 6, 8, 10]
+
+
+def test_failed_partition_stops_consumer_without_committing():
+    kafka_consumer = FakeKafkaConsumer({
+        first_partition: [create_record(first_partition, offset) for offset in range(2)],
+    }, batch_size=2)
+
+    async def handle_record(record: ConsumerRecord):
+        raise RuntimeError('handler failed')
+
+    with pytest.raises(RuntimeError, match='handler failed'):
+        asyncio.run(create_consumer(kafka_consumer, handle_record).run())
+    assert not kafka_consumer.commits
+
+
+def test_consumer_without_group_does_not_commit():
+    kafka_consumer = FakeKafkaConsumer({
+        first_partition: [create_record(first_partition, offset) for offset in range(3)],
+    }, batch_size=2)
+    handled = []
+
+    async def handle_record(record: ConsumerRecord):
+        handled.append(record.offset)
+
+    async def scenario():
+        consumer_task = asyncio.create_task(create_consumer(kafka_consumer, handle_record, group=None).run())
+        while len(handled) < 3:
+            await asyncio.sleep(0.01)
+        consumer_task.cancel()
+
+    asyncio.run(scenario())
+    assert handled == [0, 1, 2]
+    assert not kafka_consumer.commits
+
+
+def test_delayed_record_waits_without_taking_slot():
+    kafka_consumer = FakeKafkaConsumer({
+        first_partition: [create_record(first_partition, offset) for offset in range(2)],
+        second_partition: [create_record(second_partition, offset) for offset in range(2)],
+    }, batch_size=2)
+    due_at = time.time() + 0.2
+    handled = []
+
+    def get_delay(record: ConsumerRecord) -> float:
+        return due_at - time.time() if record.partition == first_partition.partition else 0
+
+    async def handle_record(record: ConsumerRecord):
+        handled.append((record.partition, record.offset, time.time() >= due_at))
+
+    async def scenario():
+        consumer = create_consumer(kafka_consumer, handle_record, max_in_flight_partitions=1, get_delay=get_delay)
+        consumer_task = asyncio.create_task(consumer.run())
+        while kafka_consumer.commits[first_partition][-1:] != [2]:
+            await asyncio.sleep(0.01)
+        consumer_task.cancel()
+
+    asyncio.run(scenario())
+    # The second partition is handled while the records of the first one are waiting, with a single slot
+    assert handled == [(1, 0, False), (1, 1, False), (0, 0, True), (0, 1, True)]
+
+
+def test_lag_of_paused_partition_is_updated():
+    kafka_consumer = FakeKafkaConsumer({
+        first_partition: [create_record(first_partition, offset) for offset in range(10)],
+    }, batch_size=2)
+    handling_released = asyncio.Event()
+
+    async def handle_record(record: ConsumerRecord):
+        await handling_released.wait()
+
+    def get_lag() -> float:
+        return REGISTRY.get_sample_value(
+            'event_streaming_consumer_lag', {'group': 'lag', 'topic': 'events', 'partition': '0'},
+        )
+
+    async def scenario():
+        consumer_task = asyncio.create_task(create_consumer(kafka_consumer, handle_record, group='lag').run())
+        while get_lag() != 6:
+            await asyncio.sleep(0.01)
+        # Records appended meanwhile are not fetched, as the partition is paused, but they are counted as lag
+        kafka_consumer._records[first_partition].extend(
+            create_record(first_partition, offset) for offset in range(10, 15)
+        )
+        while get_lag() != 11:
+            await asyncio.sleep(0.01)
+        handling_released.set()
+        while kafka_consumer.commits[first_partition][-1:] != [15]:
+            await asyncio.sleep(0.01)
+        consumer_task.cancel()
+
+    asyncio.run(asyncio.wait_for(scenario(), 5))
+    assert kafka_consumer._positions[first_partition] == 15
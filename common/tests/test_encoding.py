@@ -0,0 +1,57 @@
+import datetime
+from pathlib import Path
+import uuid
+
+import pytest
+
+from event_streaming import Settings
+from event_streaming.encoding import EventCodec, EventEncoding, schema_header
+from event_streaming.schema_registry import SchemaRegistry
+
+schemas_directory = Path(__file__).parents[2] / 'schemas'
+
+
+@pytest.fixture(scope='module')
+def codec() -> EventCodec:
+    schema_registry = SchemaRegistry()
+    schema_registry.load_schemas(str(schemas_directory))
+    return EventCodec(schema_registry)
+
+
+def build_message(data: dict) -> dict:
+    return {
+        'event_id': str(uuid.uuid4()),
+        'event_name': 'TaskAssigned',
+        'event_time': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456).isoformat(),
+        'event_version': 1,
+        'producer': 'task-tracker',
+        'data': data,
+    }
+
+
+@pytest.mark.parametrize('encoding', list(EventEncoding))
+def test_message_round_trip(codec, encoding):
+    message = build_message({'task': 'task-1', 'assignee': 'worker-1'})
+    value, headers = codec.encode(message, encoding)
+    assert codec.decode(value, headers) == message
+
+
+def test_binary_encoding_keeps_missing_null_and_extra_fields(codec):
+    message = build_message({'task': 'task-1', 'assignee': None, 'comment': 'extra'})
+    value, headers = codec.encode(message, EventEncoding.binary)
+    assert schema_header in dict(headers)
+    assert codec.decode(value, headers) == message
+    message = build_message({'task': 'task-1'})
+    assert codec.decode(*codec.encode(message, EventEncoding.binary)) == message
+
+
+def test_binary_encoding_rejects_aware_event_time(codec):
+    message = build_message({'task': 'task-1', 'assignee': 'worker-1'})
+    message['event_time'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    with pytest.raises(ValueError):
+        codec.encode(message, EventEncoding.binary)
+
+
+def test_producers_send_json_by_default():
+    # Consumers of older releases read JSON only
+    assert Settings(bootstrap_servers='kafka:9092', schemas_directory='schemas').producer_encoding == EventEncoding.json
@@ -0,0 +1,35 @@
+from prometheus_client import generate_latest
+
+import metrics
+from event_streaming import metrics as event_streaming_metrics
+
+
+def test_histogram_exposition():
+    handler_duration = event_streaming_metrics.handler_duration.labels(handler='on_exposed', event_name='Exposed')
+    for duration in (0.003, 0.02, 0.02, 20):
+        handler_duration.observe(duration)
+
+    exposition = generate_latest().decode()
+    labels = 'event_name="Exposed",handler="on_exposed"'
+    # Buckets are cumulative, the last one counts every observation
+    for bucket, count in (('0.005', 1), ('0.01', 1), ('0.025', 3), ('10.0', 3), ('+Inf', 4)):
+        assert f'event_streaming_handler_duration_seconds_bucket{{{labels},le="{bucket}"}} {count}.0' in exposition
+    assert f'event_streaming_handler_duration_seconds_count{{{labels}}} 4.0' in exposition
+    assert f'event_streaming_handler_duration_seconds_sum{{{labels}}} 20.043' in exposition
+    assert '# TYPE event_streaming_handler_duration_seconds histogram' in exposition
+
+
+def test_spans_are_summed_up_by_kind():
+    span_timings = metrics.SpanTimings()
+    token = metrics.current_span_timings.set(span_timings)
+    try:
+        with metrics.span('sql'):
+            pass
+        metrics.record_span('sql', 0.5)
+        metrics.record_span('auth', 0.25)
+    finally:
+        metrics.current_span_timings.reset(token)
+
+    assert span_timings.counts == {'sql': 2, 'auth': 1}
+    assert span_timings.durations['auth'] == 0.25
+    assert 0.5 <= span_timings.durations['sql'] < 1
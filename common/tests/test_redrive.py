@@ -0,0 +1,145 @@
+import logging
+import sys
+from typing import Dict, List
+
+from aiokafka import ConsumerRecord, TopicPartition
+import pytest
+
+from event_streaming import redrive
+from event_streaming.retries import get_header, get_remaining_delay
+
+dead_letter_topic = 'group.dlq'
+
+
+class FakeKafka:
+    """Dead-letter topic of the group along with the offsets committed by the re-drive and the sent messages."""
+
+    def __init__(self, partitions: Dict[int, List[bytes]]):
+        self.records = {
+            TopicPartition(dead_letter_topic, partition): [
+                ConsumerRecord(
+                    dead_letter_topic, partition, offset, 0, 0, value, value, None, 0, 0,
+                    [('x-attempt', b'4'), ('x-original-topic', b'events'), ('x-error', b"RuntimeError('failed')")],
+                )
+                for offset, value in enumerate(values)
+            ]
+            for partition, values in partitions.items()
+        }
+        self.committed: Dict[TopicPartition, int] = {}
+        self.sent: List[ConsumerRecord] = []
+
+
+class FakeConsumer:
+    # Few records are fetched at once, so the re-drive takes several batches
+    batch_size = 2
+
+    def __init__(self, kafka: FakeKafka):
+        self._kafka = kafka
+        self._positions: Dict[TopicPartition, int] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def topics(self):
+        return {dead_letter_topic}
+
+    def partitions_for_topic(self, topic):
+        return {partition.partition for partition in self._kafka.records if partition.topic == topic}
+
+    def assign(self, partitions):
+        self._positions = dict.fromkeys(partitions, 0)
+
+    async def committed(self, partition):
+        return self._kafka.committed.get(partition)
+
+    async def seek_to_beginning(self, *partitions):
+        for partition in partitions:
+            self._positions[partition] = 0
+
+    def seek(self, partition, offset):
+        self._positions[partition] = offset
+
+    async def end_offsets(self, partitions):
+        return {partition: len(self._kafka.records[partition]) for partition in partitions}
+
+    async def position(self, partition):
+        return self._positions[partition]
+
+    async def getmany(self, *partitions, timeout_ms=0):
+        batch = {}
+        for partition in partitions:
+            position = self._positions[partition]
+            records = self._kafka.records[partition][position:position + self.batch_size]
+            if records:
+                batch[partition] = records
+                self._positions[partition] = position + len(records)
+        return batch
+
+    async def commit(self, offsets):
+        self._kafka.committed.update(offsets)
+
+
+class FakeProducer:
+    def __init__(self, kafka: FakeKafka):
+        self._kafka = kafka
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send_and_wait(self, topic, value, key=None, headers=None):
+        # Sent messages are kept as records of their topics, as their consumers would see them
+        self._kafka.sent.append(ConsumerRecord(topic, 0, len(self._kafka.sent), 0, 0, key, value, None, 0, 0, headers))
+
+
+@pytest.fixture
+def kafka(monkeypatch) -> FakeKafka:
+    kafka = FakeKafka({0: [b'first', b'second', b'third'], 1: [b'fourth']})
+    monkeypatch.setattr(redrive, 'AIOKafkaConsumer', lambda **config: FakeConsumer(kafka))
+    monkeypatch.setattr(redrive, 'AIOKafkaProducer', lambda **config: FakeProducer(kafka))
+    monkeypatch.setenv('EVENT_STREAMING_BOOTSTRAP_SERVERS', 'kafka:9092')
+    monkeypatch.setenv('EVENT_STREAMING_SCHEMAS_DIRECTORY', 'schemas')
+    return kafka
+
+
+def run_redrive(monkeypatch, *arguments: str):
+    monkeypatch.setattr(sys, 'argv', ['redrive', 'group', *arguments])
+    redrive.main()
+
+
+def test_parked_messages_go_to_first_retry_topic(kafka, monkeypatch):
+    run_redrive(monkeypatch)
+    assert sorted(record.value for record in kafka.sent) == [b'first', b'fourth', b'second', b'third']
+    for record in kafka.sent:
+        assert record.topic == 'group.retry.1'
+        assert record.key == record.value
+        # The message is consumed as the first retry, at once, and keeps its origin
+        assert get_header(record, 'x-attempt') == '1'
+        assert get_remaining_delay(record) <= 0
+        assert get_header(record, 'x-original-topic') == 'events'
+    assert kafka.committed == {TopicPartition(dead_letter_topic, 0): 3, TopicPartition(dead_letter_topic, 1): 1}
+
+
+def test_next_run_continues_after_limit(kafka, monkeypatch):
+    run_redrive(monkeypatch, '--limit', '2')
+    assert [record.value for record in kafka.sent] == [b'first', b'second']
+    assert kafka.committed == {TopicPartition(dead_letter_topic, 0): 2}
+
+    run_redrive(monkeypatch, '--limit', '1')
+    assert len(kafka.sent) == 3
+    run_redrive(monkeypatch)
+    assert sorted(record.value for record in kafka.sent) == [b'first', b'fourth', b'second', b'third']
+    assert kafka.committed == {TopicPartition(dead_letter_topic, 0): 3, TopicPartition(dead_letter_topic, 1): 1}
+
+
+def test_dry_run_only_lists_parked_messages(kafka, monkeypatch, caplog):
+    with caplog.at_level(logging.INFO, logger=redrive.__name__):
+        run_redrive(monkeypatch, '--dry-run', '--limit', '3')
+    assert not kafka.sent
+    assert not kafka.committed
+    assert '3 messages found' in caplog.messages
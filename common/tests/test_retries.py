@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Dict, List
+
+from aiokafka import ConsumerRecord
+import pytest
+
+from event_streaming.retries import (
+    FailureRouter, PoisonMessageError, get_header, get_remaining_delay, retry_in_place,
+)
+
+
+def create_record(topic: str = 'events', headers: Dict[str, str] | None = None) -> ConsumerRecord:
+    return ConsumerRecord(
+        topic, 1, 42, 0, 0, b'key', b'value', None, 3, 5,
+        [(name, value.encode()) for name, value in (headers or {}).items()],
+    )
+
+
+class FakeProducer:
+    def __init__(self):
+        self.sent: List[ConsumerRecord] = []
+
+    async def send_and_wait(self, topic, value, key=None, headers=None):
+        # Sent messages are kept as records of their topics, as their consumers would see them
+        self.sent.append(ConsumerRecord(topic, 0, len(self.sent), 0, 0, key, value, None, 0, 0, headers))
+
+
+def route_failure(record: ConsumerRecord, error: Exception) -> ConsumerRecord:
+    producer = FakeProducer()
+    asyncio.run(FailureRouter(producer, 'group', max_retries=3, retry_backoff=5).handle_failure(record, error))
+    sent_record, = producer.sent
+    return sent_record
+
+
+def test_retry_topics():
+    router = FailureRouter(FakeProducer(), 'group', max_retries=3, retry_backoff=5)
+    assert router.retry_topics == ['group.retry.1', 'group.retry.2', 'group.retry.3']
+    assert [router.get_retry_delay(attempt) for attempt in (1, 2, 3)] == [5, 10, 20]
+
+
+def test_first_failure_is_retried_with_delay():
+    retried = route_failure(create_record(), RuntimeError('failed'))
+    assert retried.topic == 'group.retry.1'
+    assert (retried.key, retried.value) == (b'key', b'value')
+    assert get_header(retried, 'x-attempt') == '1'
+    assert get_header(retried, 'x-error') == "RuntimeError('failed')"
+    assert (get_header(retried, 'x-original-topic'), get_header(retried, 'x-original-partition')) == ('events', '1')
+    assert get_header(retried, 'x-original-offset') == '42'
+    assert 4 < get_remaining_delay(retried) <= 5
+
+
+def test_retried_message_keeps_its_origin():
+    record = create_record('group.retry.1', {
+        'x-attempt': '1',
+        'x-retry-at': str(time.time()),
+        'x-original-topic': 'events',
+        'x-original-partition': '2',
+        'x-original-offset': '7',
+    })
+    retried = route_failure(record, RuntimeError('failed again'))
+    assert retried.topic == 'group.retry.2'
+    assert get_header(retried, 'x-attempt') == '2'
+    assert (get_header(retried, 'x-original-topic'), get_header(retried, 'x-original-offset')) == ('events', '7')
+    assert 9 < get_remaining_delay(retried) <= 10
+
+
+def test_message_failed_every_retry_is_dead_lettered():
+    record = create_record('group.retry.3', {'x-attempt': '3', 'x-retry-at': str(time.time())})
+    dead_letter = route_failure(record, RuntimeError('failed'))
+    assert dead_letter.topic == 'group.dlq'
+    assert get_header(dead_letter, 'x-attempt') == '4'
+    assert get_header(dead_letter, 'x-retry-at') is None
+    assert get_header(dead_letter, 'x-failed-at')
+
+
+def test_poison_message_is_dead_lettered_at_once():
+    dead_letter = route_failure(create_record(), PoisonMessageError('malformed'))
+    assert dead_letter.topic == 'group.dlq'
+    assert get_header(dead_letter, 'x-attempt') == '1'
+
+
+def test_transient_failure_is_retried_in_place():
+    attempts = []
+
+    async def handle_record(record: ConsumerRecord):
+        attempts.append(record.offset)
+        if len(attempts) < 3:
+            raise ConnectionError('database is unavailable')
+
+    asyncio.run(retry_in_place(handle_record, create_record(), retries=2, retry_backoff=0))
+    assert attempts == [42, 42, 42]
+
+
+def test_in_place_retries_are_bounded():
+    attempts = []
+
+    async def handle_record(record: ConsumerRecord):
+        attempts.append(record.offset)
+        raise ConnectionError('database is unavailable')
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(retry_in_place(handle_record, create_record(), retries=2, retry_backoff=0))
+    assert len(attempts) == 3
+
+
+def test_poison_message_is_not_retried_in_place():
+    attempts = []
+
+    async def handle_record(record: ConsumerRecord):
+        attempts.append(record.offset)
+        raise PoisonMessageError('malformed')
+
+    with pytest.raises(PoisonMessageError):
+        asyncio.run(retry_in_place(handle_record, create_record(), retries=2, retry_backoff=0))
+    assert len(attempts) == 1
@@ -0,0 +1,88 @@
+import asyncio
+from typing import List
+
+import pytest
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from schema_migrations import (
+    Migration, SchemaMode, SchemaOutdatedError, create_indexes, execute, schema_version_table, setup_schema,
+)
+
+migrations = [
+    Migration(1, 'items', execute('CREATE TABLE IF NOT EXISTS item (id INTEGER PRIMARY KEY, name VARCHAR)')),
+    Migration(
+        2, 'item indexes', create_indexes('CREATE UNIQUE INDEX uq_item_name ON item (name)'), transactional=False,
+    ),
+    Migration(3, 'item prices', execute('ALTER TABLE item ADD COLUMN IF NOT EXISTS price INTEGER')),
+]
+
+
+async def get_applied_versions(engine: AsyncEngine) -> List[int]:
+    async with engine.connect() as connection:
+        return (await connection.execute(
+            select(schema_version_table.c.version).order_by(schema_version_table.c.version)
+        )).scalars().all()
+
+
+async def get_indexes(engine: AsyncEngine) -> dict:
+    async with engine.connect() as connection:
+        return dict((await connection.execute(text(
+            "SELECT indexrelid::regclass::text, indisvalid FROM pg_index WHERE indrelid = 'item'::regclass"
+        ))).all())
+
+
+def test_migrations_are_applied_once(engine):
+    async def scenario():
+        await setup_schema(engine, migrations, SchemaMode.migrate)
+        await setup_schema(engine, migrations, SchemaMode.migrate)
+        await setup_schema(engine, migrations, SchemaMode.check)
+        async with engine.connect() as connection:
+            columns = await connection.run_sync(lambda sync: [c['name'] for c in inspect(sync).get_columns('item')])
+        return await get_applied_versions(engine), await get_indexes(engine), columns
+
+    versions, indexes, columns = asyncio.run(scenario())
+    assert versions == [1, 2, 3]
+    assert indexes == {'item_pkey': True, 'uq_item_name': True}
+    assert columns == ['id', 'name', 'price']
+
+
+def test_check_mode_fails_on_pending_migrations(engine):
+    with pytest.raises(SchemaOutdatedError, match='1 \\(items\\)'):
+        asyncio.run(setup_schema(engine, migrations, SchemaMode.check))
+
+
+def test_failed_migration_keeps_applied_batches(engine):
+    failing_migrations = [*migrations[:2], Migration(3, 'broken', execute(
+        'ALTER TABLE item ADD COLUMN price INTEGER',
+        'SELECT missing_column FROM item',
+    ))]
+
+    async def scenario():
+        with pytest.raises(DBAPIError):
+            await setup_schema(engine, failing_migrations, SchemaMode.migrate)
+        # The broken migration is rolled back, the fixed one is applied on the next start
+        await setup_schema(engine, migrations, SchemaMode.migrate)
+        return await get_applied_versions(engine)
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+
+
+def test_invalid_index_left_by_interrupted_build_is_rebuilt(engine):
+    async def scenario():
+        await setup_schema(engine, migrations[:1], SchemaMode.migrate)
+        async with engine.connect() as connection:
+            await connection.execution_options(isolation_level='AUTOCOMMIT')
+            await connection.execute(text("INSERT INTO item VALUES (1, 'duplicate'), (2, 'duplicate')"))
+            # The concurrent build fails on duplicates and leaves an invalid index
+            with pytest.raises(DBAPIError):
+                await connection.execute(text('CREATE UNIQUE INDEX CONCURRENTLY uq_item_name ON item (name)'))
+            await connection.execute(text('DELETE FROM item WHERE id = 2'))
+        invalid_indexes = await get_indexes(engine)
+        await setup_schema(engine, migrations, SchemaMode.migrate)
+        return invalid_indexes, await get_indexes(engine)
+
+    invalid_indexes, indexes = asyncio.run(scenario())
+    assert invalid_indexes['uq_item_name'] is False
+    assert indexes['uq_item_name'] is True
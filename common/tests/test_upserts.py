@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, List, Mapping, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlmodel import Field, SQLModel
+
+from upserts import MergePolicy, bulk_upsert
+
+
+class Item(SQLModel, table=True):
+    __tablename__ = 'upsert_item'
+    id: int | None = Field(default=None, primary_key=True)
+    public_id: str = Field(sa_column_kwargs={'unique': True})
+    name: str | None = None
+    price: int | None = None
+
+
+def upsert_items(
+    engine: AsyncEngine,
+    existing_rows: List[Mapping[str, Any]],
+    rows: List[Mapping[str, Any]],
+    merge_policy: MergePolicy,
+) -> Tuple[List[Tuple[Item, bool]], List[Item]]:
+    async def scenario():
+        async with engine.begin() as connection:
+            await connection.run_sync(Item.__table__.create)
+        async with AsyncSession(engine) as session:
+            session.add_all(Item(**row) for row in existing_rows)
+            await session.commit()
+            upserted = await bulk_upsert(session, Item, rows, merge_policy)
+            await session.commit()
+        async with AsyncSession(engine) as session:
+            stored = (await session.execute(Item.__table__.select().order_by(Item.public_id))).all()
+        return upserted, [Item(**row._mapping) for row in stored]
+
+    return asyncio.run(scenario())
+
+
+def summarize(items: List[Item]) -> List[Tuple[str, str | None, int | None]]:
+    return sorted((item.public_id, item.name, item.price) for item in items)
+
+
+def test_keep_policy_returns_existing_rows_as_is(engine):
+    upserted, stored = upsert_items(
+        engine,
+        [{'public_id': 'a', 'name': 'A', 'price': 1}],
+        [{'public_id': 'a', 'name': 'B', 'price': 2}, {'public_id': 'b', 'name': 'B'}],
+        MergePolicy.keep,
+    )
+    assert sorted((item.public_id, created) for item, created in upserted) == [('a', False), ('b', True)]
+    assert summarize(item for item, _created in upserted) == [('a', 'A', 1), ('b', 'B', None)]
+    assert summarize(stored) == [('a', 'A', 1), ('b', 'B', None)]
+
+
+def test_fill_policy_sets_only_null_fields(engine):
+    upserted, stored = upsert_items(
+        engine,
+        [{'public_id': 'a', 'name': 'A'}],
+        [{'public_id': 'a', 'name': 'B', 'price': 2}],
+        MergePolicy.fill,
+    )
+    assert [(item.public_id, created) for item, created in upserted] == [('a', False)]
+    assert summarize(stored) == [('a', 'A', 2)]
+
+
+def test_overwrite_policy_replaces_given_fields(engine):
+    upserted, stored = upsert_items(
+        engine,
+        [{'public_id': 'a', 'name': 'A', 'price': 1}],
+        [{'public_id': 'a', 'price': 2}],
+        MergePolicy.overwrite,
+    )
+    assert summarize(stored) == [('a', 'A', 2)]
+
+
+def test_fields_missing_from_some_rows_are_not_merged(engine):
+    upserted, stored = upsert_items(
+        engine,
+        [{'public_id': 'a', 'name': 'A', 'price': 1}, {'public_id': 'b', 'name': 'B', 'price': 1}],
+        # The first row doesn't give the price, it must not be reset to the default
+        [{'public_id': 'a', 'name': 'C'}, {'public_id': 'b', 'price': 2}, {'public_id': 'c', 'price': 3}],
+        MergePolicy.overwrite,
+    )
+    assert sorted((item.public_id, created) for item, created in upserted) == [('a', False), ('b', False), ('c', True)]
+    assert summarize(stored) == [('a', 'C', 1), ('b', 'B', 2), ('c', None, 3)]
+
+
+def test_fill_policy_with_rows_giving_different_fields(engine):
+    upserted, stored = upsert_items(
+        engine,
+        [{'public_id': 'a'}, {'public_id': 'b'}],
+        [{'public_id': 'a', 'name': 'A'}, {'public_id': 'b', 'price': 2}],
+        MergePolicy.fill,
+    )
+    assert summarize(stored) == [('a', 'A', None), ('b', None, 2)]
@@ -0,0 +1,94 @@
+from collections import defaultdict
+import enum
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Sequence, Set, Tuple, Type, TypeVar
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import SQLModel
+
+ModelT = TypeVar('ModelT', bound=SQLModel)
+
+
+class MergePolicy(enum.Enum):
+    keep = 'keep'  # an existing row is returned as is
+    fill = 'fill'  # the given values fill only NULL fields of an existing row
+    overwrite = 'overwrite'  # the given values replace the ones of an existing row
+
+
+async def bulk_upsert(
+    session,
+    model: Type[ModelT],
+    rows: Sequence[Mapping[str, Any]],
+    merge_policy: MergePolicy = MergePolicy.keep,
+    index_elements: Iterable[str] = ('public_id',),
+) -> List[Tuple[ModelT, bool]]:
+    """
+    Inserts rows with INSERT ... ON CONFLICT statements, returns the stored rows
+    (in no particular order) along with flags telling whether they have been created.
+    Rows are inserted at once, unless their values are merged and they give different fields.
+    """
+    if not rows:
+        return []
+    table = model.__table__
+    index_elements = list(index_elements)
+    if merge_policy == MergePolicy.keep:
+        return await _upsert_rows(session, model, rows, merge_policy, index_elements, set())
+    # Only the given values are merged, so rows are upserted by groups of rows giving the same fields
+    row_groups: Dict[FrozenSet[str], List[Mapping[str, Any]]] = defaultdict(list)
+    for row in rows:
+        row_groups[frozenset(column for column in row if column in table.columns)].append(row)
+    stored_rows = []
+    for columns, row_group in row_groups.items():
+        stored_rows.extend(await _upsert_rows(
+            session, model, row_group, merge_policy, index_elements, set(columns) - set(index_elements),
+        ))
+    return stored_rows
+
+
+async def _upsert_rows(
+    session,
+    model: Type[ModelT],
+    rows: Sequence[Mapping[str, Any]],
+    merge_policy: MergePolicy,
+    index_elements: List[str],
+    merged_columns: Set[str],
+) -> List[Tuple[ModelT, bool]]:
+    table = model.__table__
+    insert_rows = []
+    for row in rows:
+        # Model instances are built to get values of the fields that are not given
+        insert_row = model(**row).dict(include=set(table.columns.keys()))
+        if insert_row.get('id') is None:
+            insert_row.pop('id', None)
+        insert_rows.append(insert_row)
+    insert_query = insert(model).values(insert_rows)
+    if merge_policy == MergePolicy.keep or not merged_columns:
+        # A no-op update makes RETURNING yield an already existing row as well
+        set_ = {index_elements[0]: insert_query.excluded[index_elements[0]]}
+    elif merge_policy == MergePolicy.fill:
+        set_ = {column: func.coalesce(table.c[column], insert_query.excluded[column]) for column in merged_columns}
+    else:
+        set_ = {column: insert_query.excluded[column] for column in merged_columns}
+    upsert_query = insert_query.on_conflict_do_update(
+        index_elements=index_elements,
+        set_=set_,
+    ).returning(
+        *table.columns,
+        literal_column('xmax = 0').label('created'),
+    )
+    result = await session.execute(upsert_query)
+    return [
+        (model(**{column: stored_row[column] for column in table.columns.keys()}), stored_row['created'])
+        for stored_row in result.mappings().all()
+    ]
+
+
+async def upsert(
+    session,
+    model: Type[ModelT],
+    values: Mapping[str, Any],
+    merge_policy: MergePolicy = MergePolicy.keep,
+    index_elements: Iterable[str] = ('public_id',),
+) -> Tuple[ModelT, bool]:
+    (instance, created), = await bulk_upsert(session, model, [values], merge_policy, index_elements)
+    return instance, created
@@ -1,3 +1,4 @@
+import asyncio
 from urllib.parse import urljoin, urlparse
 
 import httpx
@@ -9,6 +10,15 @@ class Settings(BaseSettings):
     oauth_client_secret: str
     internal_url: str
     url: str
+    token_cache_size: int = 10_000
+    token_cache_ttl: float = 300
+    pool_max_connections: int = 100
+    pool_max_keepalive_connections: int = 20
+    http2: bool = False
+    timeout: float = 5
+    connect_timeout: float = 2
+    retries: int = 2
+    retry_backoff: float = 0.1
 
     class Config:
         env_prefix = 'auth_'
@@ -21,6 +31,35 @@ class OAuthError(Exception):
 class Client:
     def __init__(self):
         self.settings = Settings()
+        self._http_client: httpx.AsyncClient | None = None
+
+    async def start(self):
+        self._http_client = httpx.AsyncClient(
+            http2=self.settings.http2,
+            limits=httpx.Limits(
+                max_connections=self.settings.pool_max_connections,
+                max_keepalive_connections=self.settings.pool_max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(self.settings.timeout, connect=self.settings.connect_timeout),
+        )
+
+    async def stop(self):
+        await self._http_client.aclose()
+
+    async def _request(self, method: str, url: str, idempotent: bool, **kwargs) -> httpx.Response:
+        # Requests that are not idempotent are repeated only if they could not reach the server
+        retriable_errors = httpx.TransportError if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+        for attempt in range(self.settings.retries + 1):
+            is_last_attempt = attempt == self.settings.retries
+            try:
+                response = await self._http_client.request(method, url, **kwargs)
+            except retriable_errors:
+                if is_last_attempt:
+                    raise
+            else:
+                if not idempotent or response.status_code < httpx.codes.INTERNAL_SERVER_ERROR or is_last_attempt:
+                    return response
+            await asyncio.sleep(self.settings.retry_backoff * 2 ** attempt)
 
     @property
     def oauth_authorization_url(self):
@@ -50,8 +89,7 @@ class Client:
             'redirect_uri': redirect_uri,
         }
         token_url = self._compose_internal_url('oauth/token')
-        async with httpx.AsyncClient() as client:
-            response = await client.post(token_url, headers=headers, data=payload)
+        response = await self._request('POST', token_url, idempotent=False, headers=headers, data=payload)
         if response.status_code == httpx.codes.OK:
             return response.json()
         else:
@@ -64,8 +102,7 @@ class Client:
             'authorization': f'Bearer {token}',
         }
         current_account_url = self._compose_internal_url('accounts/current')
-        async with httpx.AsyncClient() as client:
-            response = await client.get(current_account_url, headers=headers)
+        response = await self._request('GET', current_account_url, idempotent=True, headers=headers)
         if response.status_code == httpx.codes.OK:
             return response.json()
         else:
@@ -1,25 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
 from pydantic import BaseSettings
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.orm import sessionmaker
-from sqlmodel import SQLModel
+
+from schema_migrations import SchemaMode, setup_schema
+
+logger = logging.getLogger(__name__)
 
 engine: AsyncEngine | None = None
+session_factory = sessionmaker(class_=AsyncSession)
 
 
 class Settings(BaseSettings):
     url: str
+    replica_urls: List[str] = []
+    replica_retry_interval: float = 30
+    read_your_writes_window: float = 5
+    echo: bool = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_pre_ping: bool = True
+    pool_recycle: int = 1800
+    query_cache_size: int = 500
+    prepared_statement_cache_size: int = 256
+    schema_mode: SchemaMode = SchemaMode.migrate
 
     class Config:
         env_prefix = 'database_'
 
 
+class Replicas:
+    """Read-only engines taken in turns, a replica failing to connect is skipped for the retry interval."""
+
+    def __init__(self, engines: List[AsyncEngine], retry_interval: float):
+        self.engines = engines
+        self._retry_interval = retry_interval
+        self._next = 0
+        self._unavailable_until: Dict[int, float] = {}
+
+    def get_candidates(self) -> List[AsyncEngine]:
+        if not self.engines:
+            return []
+        now = time.monotonic()
+        first = self._next
+        self._next = (first + 1) % len(self.engines)
+        indexes = [(first + offset) % len(self.engines) for offset in range(len(self.engines))]
+        return [self.engines[index] for index in indexes if self._unavailable_until.get(index, 0) <= now]
+
+    def mark_unavailable(self, replica_engine: AsyncEngine):
+        self._unavailable_until[self.engines.index(replica_engine)] = time.monotonic() + self._retry_interval
+
+
+replicas = Replicas([], 0)
+# Seconds replicas are given to catch up with a write, reads of its writer go to the primary meanwhile
+read_your_writes_window: float = 0
+
+
 def create_session() -> AsyncSession:
-    return sessionmaker(engine, AsyncSession)()
+    return session_factory()
+
+
+async def create_read_session(written_at: float | None = None) -> AsyncSession:
+    """Reads of a client that has written at the given time (Unix time) go to the primary within the window."""
+    if written_at is not None and time.time() - written_at < read_your_writes_window:
+        return create_session()
+    for replica_engine in replicas.get_candidates():
+        session = session_factory(bind=replica_engine)
+        try:
+            await session.connection()
+        except (OSError, asyncio.TimeoutError, DBAPIError) as error:
+            await session.close()
+            replicas.mark_unavailable(replica_engine)
+            logger.warning('Replica %s is unavailable: %s', replica_engine.url, error)
+            continue
+        return session
+    return create_session()
+
+
+def create_engine(settings: Settings, url: str | None = None) -> AsyncEngine:
+    url = url or settings.url
+    connect_args = {}
+    if make_url(url).get_driver_name() == 'asyncpg':
+        connect_args['prepared_statement_cache_size'] = settings.prepared_statement_cache_size
+    return create_async_engine(
+        url,
+        echo=settings.echo,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_pre_ping=settings.pool_pre_ping,
+        pool_recycle=settings.pool_recycle,
+        query_cache_size=settings.query_cache_size,
+        connect_args=connect_args,
+    )
 
 
 async def setup(settings: Settings):
-    global engine
-    engine = create_async_engine(settings.url, echo=True)
-    from task_tracker import models  # noqa
-    async with engine.begin() as connection:
-        await connection.run_sync(SQLModel.metadata.create_all)
+    global engine, replicas, read_your_writes_window
+    engine = create_engine(settings)
+    session_factory.configure(bind=engine)
+    replicas = Replicas(
+        [create_engine(settings, url) for url in settings.replica_urls], settings.replica_retry_interval,
+    )
+    read_your_writes_window = settings.read_your_writes_window
+    from task_tracker.migrations import migrations
+    await setup_schema(engine, migrations, settings.schema_mode)
@@ -15,4 +15,4 @@ async def main():
     await database.setup(database.Settings())
     await event_streaming.consume(event_streaming.Settings(), topics, group)
 
-asyncio.run(main(), debug=True)
+asyncio.run(main())
@@ -1,9 +1,10 @@
 import logging
 from typing import Any, Mapping
 
-from sqlalchemy import select
+from sqlalchemy import update
 
 import event_streaming
+from upserts import MergePolicy, upsert
 from task_tracker import database
 from task_tracker.models import Account, AccountRole
 
@@ -13,33 +14,34 @@ logger = logging.getLogger(__name__)
 @event_streaming.on_event('AccountCreated')
 @event_streaming.on_event('AccountUpdated')
 async def on_account_updated(event_name: str, event_handler: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
     if not event_data.get('public_id'):
         logger.warning('Invalid data, public_id is required!')
         return
+    account_data = {field: value for field, value in event_data.items() if field in Account.__fields__}
     async with database.create_session() as session:
-        query_result = await session.execute(
-            select(Account).where(Account.public_id == event_data['public_id'])
-        )
-        account: Account | None = query_result.scalars().first()
-        if account:
-            for field in account.dict():
-                if field in event_data:
-                    setattr(account, field, event_data[field])
-        else:
-            account = Account(**event_data)
-        session.add(account)
+        updated = False
+        if event_name == 'AccountUpdated':
+            # The event may carry only some of the fields, so an existing account is updated in place
+            updated = (await session.execute(
+                update(Account).where(
+                    Account.public_id == account_data['public_id'],
+                ).values(
+                    **account_data,
+                ).execution_options(synchronize_session=False)
+            )).rowcount
+        if not updated:
+            await upsert(session, Account, account_data, MergePolicy.overwrite)
         await session.commit()
 
 
 @event_streaming.on_event('AccountRoleChanged')
 async def on_account_role_changed(event_name: str, event_handler: int, event_data: Mapping[str, Any]):
-    logger.info('%s: %s', event_name, event_data)
     async with database.create_session() as session:
-        query_result = await session.execute(
-            select(Account).where(Account.public_id == event_data['public_id'])
+        await session.execute(
+            update(Account).where(
+                Account.public_id == event_data['public_id'],
+            ).values(
+                role=AccountRole(event_data['role']),
+            ).execution_options(synchronize_session=False)
         )
-        account: Account | None = query_result.scalars().first()
-        if account:
-            account.role = AccountRole(event_data['role'])
-            await session.commit()
+        await session.commit()
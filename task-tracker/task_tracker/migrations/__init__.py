@@ -0,0 +1,77 @@
+"""
+Schema migrations of the task tracker database.
+
+Every migration is explicit DDL. The baseline is the schema the service used to create out of its models before
+migrations were introduced, so it creates only the missing tables and every later migration is idempotent.
+"""
+from schema_migrations import Migration, create_indexes, execute
+
+migrations = [
+    Migration(1, 'baseline', execute(
+        '''
+        DO $$ BEGIN
+            CREATE TYPE accountrole AS ENUM ('admin', 'worker', 'manager');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+        ''',
+        '''
+        DO $$ BEGIN
+            CREATE TYPE taskstatus AS ENUM ('open', 'closed');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS account (
+            role accountrole,
+            id SERIAL NOT NULL PRIMARY KEY,
+            public_id VARCHAR NOT NULL UNIQUE,
+            email VARCHAR NOT NULL UNIQUE,
+            full_name VARCHAR NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS outbox_event (
+            message JSON NOT NULL,
+            id SERIAL NOT NULL PRIMARY KEY,
+            topic VARCHAR NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS task (
+            status taskstatus,
+            id SERIAL NOT NULL PRIMARY KEY,
+            public_id VARCHAR NOT NULL UNIQUE,
+            title VARCHAR(50) NOT NULL UNIQUE,
+            jira_id VARCHAR UNIQUE,
+            description VARCHAR NOT NULL,
+            reporter_id INTEGER NOT NULL REFERENCES account (id),
+            assignee_id INTEGER NOT NULL REFERENCES account (id)
+        )
+        ''',
+    )),
+    Migration(2, 'indexes of hot query paths', create_indexes(
+        'CREATE INDEX ix_account_role ON account (role)',
+        'CREATE INDEX ix_task_status ON task (status)',
+        'CREATE INDEX ix_task_assignee_id_status ON task (assignee_id, status)',
+    ), transactional=False),
+    Migration(3, 'shuffle jobs', execute(
+        '''
+        DO $$ BEGIN
+            CREATE TYPE shufflejobstatus AS ENUM ('pending', 'running', 'completed', 'failed', 'cancelled');
+        EXCEPTION WHEN duplicate_object THEN NULL;
+        END $$
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shuffle_job (
+            id VARCHAR NOT NULL PRIMARY KEY,
+            status shufflejobstatus NOT NULL,
+            total INTEGER NOT NULL,
+            processed INTEGER NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            finished_at TIMESTAMP WITHOUT TIME ZONE,
+            error VARCHAR
+        )
+        ''',
+    )),
+]
@@ -1,8 +1,10 @@
+import datetime
 import enum
 from typing import List
 import uuid
 
-from sqlmodel import Field, Column, SQLModel, Enum, Relationship
+from sqlalchemy import Index
+from sqlmodel import Field, Column, SQLModel, Enum, JSON, Relationship
 
 
 class AccountRole(enum.Enum):
@@ -16,9 +18,14 @@ class Account(SQLModel, table=True):
     public_id: str = Field(sa_column_kwargs={'unique': True})
     email: str = Field(sa_column_kwargs={'unique': True})
     full_name: str
-    role: AccountRole | None = Field(sa_column=Column('role', Enum(AccountRole)))
-    reported_tasks: List['Task'] = Relationship(back_populates='reporter')
-    assigned_tasks: List['Task'] = Relationship(back_populates='assignee')
+    role: AccountRole | None = Field(sa_column=Column('role', Enum(AccountRole), index=True))
+    # Tasks refer to accounts twice, so every relationship names its foreign key
+    reported_tasks: List['Task'] = Relationship(
+        back_populates='reporter', sa_relationship_kwargs={'foreign_keys': '[Task.reporter_id]'},
+    )
+    assigned_tasks: List['Task'] = Relationship(
+        back_populates='assignee', sa_relationship_kwargs={'foreign_keys': '[Task.assignee_id]'},
+    )
 
 
 class TaskStatus(enum.Enum):
@@ -27,16 +34,23 @@ class TaskStatus(enum.Enum):
 
 
 class Task(SQLModel, table=True):
+    __table_args__ = (
+        Index('ix_task_assignee_id_status', 'assignee_id', 'status'),
+    )
     id: int | None = Field(default=None, primary_key=True)
     public_id: str = Field(default_factory=lambda: str(uuid.uuid4()), sa_column_kwargs={'unique': True})
-    status: TaskStatus = Field(default=TaskStatus.open, sa_column=Column('status', Enum(TaskStatus)))
+    status: TaskStatus = Field(default=TaskStatus.open, sa_column=Column('status', Enum(TaskStatus), index=True))
     title: str = Field(max_length=50, sa_column_kwargs={'unique': True})
     jira_id: str | None = Field(description='Jira ID', sa_column_kwargs={'unique': True}, nullable=True)
     description: str = Field(default='')
     reporter_id: int = Field(foreign_key='account.id')
-    reporter: Account = Relationship(back_populates='reported_tasks')
+    reporter: Account = Relationship(
+        back_populates='reported_tasks', sa_relationship_kwargs={'foreign_keys': '[Task.reporter_id]'},
+    )
     assignee_id: int = Field(foreign_key='account.id')
-    assignee: Account = Relationship(back_populates='assigned_tasks')
+    assignee: Account = Relationship(
+        back_populates='assigned_tasks', sa_relationship_kwargs={'foreign_keys': '[Task.assignee_id]'},
+    )
 
     def close(self):
         self.status = TaskStatus.closed
@@ -51,3 +65,33 @@ class Task(SQLModel, table=True):
         assert not self.is_closed(), 'Closed task cannot be assigned.'
         assert account.role == AccountRole.worker, 'Task can be assigned to a worker only.'
         self.assignee_id = account.id
+
+
+class OutboxEvent(SQLModel, table=True):
+    __tablename__ = 'outbox_event'
+    id: int | None = Field(default=None, primary_key=True)
+    topic: str
+    message: dict = Field(sa_column=Column('message', JSON, nullable=False))
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class ShuffleJobStatus(enum.Enum):
+    pending = 'pending'
+    running = 'running'
+    completed = 'completed'
+    failed = 'failed'
+    cancelled = 'cancelled'
+
+
+class ShuffleJob(SQLModel, table=True):
+    __tablename__ = 'shuffle_job'
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
+    status: ShuffleJobStatus = Field(
+        default=ShuffleJobStatus.pending,
+        sa_column=Column('status', Enum(ShuffleJobStatus), nullable=False),
+    )
+    total: int = Field(default=0)
+    processed: int = Field(default=0)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    finished_at: datetime.datetime | None = None
+    error: str | None = None
@@ -0,0 +1,40 @@
+import datetime
+from typing import Iterable
+
+from pydantic import BaseSettings
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import event_streaming
+from task_tracker.models import OutboxEvent
+
+
+class Settings(BaseSettings):
+    batch_size: int = 500
+    poll_interval: float = 0.5
+
+    class Config:
+        env_prefix = 'outbox_'
+
+
+class Outbox:
+    def __init__(self, session: AsyncSession, producer: event_streaming.Producer):
+        self._session = session
+        self._producer = producer
+
+    def add(self, topic_name: str, event_name: str, event_version: int, data: dict):
+        message = self._producer.build_event(event_name, event_version, data)
+        self._session.add(OutboxEvent(topic=topic_name, message=message))
+
+    async def add_bulk(self, topic_name: str, event_name: str, event_version: int, data_items: Iterable[dict]):
+        created_at = datetime.datetime.now()
+        rows = [
+            {
+                'topic': topic_name,
+                'message': self._producer.build_event(event_name, event_version, data),
+                'created_at': created_at,
+            }
+            for data in data_items
+        ]
+        if rows:
+            await self._session.execute(insert(OutboxEvent), rows)
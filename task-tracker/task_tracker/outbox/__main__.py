@@ -0,0 +1,22 @@
+import asyncio
+import logging
+
+import event_streaming
+from task_tracker import database
+from task_tracker.outbox import Settings
+from task_tracker.outbox.relay import relay
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    settings = Settings()
+    await database.setup(database.Settings())
+    producer = event_streaming.Producer('task-tracker')
+    await producer.start(event_streaming.Settings())
+    try:
+        await relay(producer, settings.batch_size, settings.poll_interval)
+    finally:
+        await producer.stop()
+
+asyncio.run(main())
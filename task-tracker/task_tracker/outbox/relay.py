@@ -0,0 +1,36 @@
+import asyncio
+import logging
+from typing import List
+
+from sqlalchemy import asc, delete, select
+
+import event_streaming
+from task_tracker import database
+from task_tracker.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+async def relay_batch(producer: event_streaming.Producer, batch_size: int) -> int:
+    async with database.create_session() as session:
+        events: List[OutboxEvent] = (await session.execute(
+            select(OutboxEvent).order_by(asc(OutboxEvent.id)).limit(batch_size).with_for_update(skip_locked=True)
+        )).scalars().all()
+        if not events:
+            return 0
+        deliveries = [await producer.send_event(event.topic, event.message) for event in events]
+        # Rows are deleted only after the broker has acknowledged every event of the batch,
+        # a failure rolls the transaction back and the batch is sent again (at-least-once).
+        await asyncio.gather(*deliveries)
+        await session.execute(delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in events])))
+        await session.commit()
+    return len(events)
+
+
+async def relay(producer: event_streaming.Producer, batch_size: int, poll_interval: float):
+    while True:
+        relayed = await relay_batch(producer, batch_size)
+        if relayed:
+            logger.info('%s events relayed', relayed)
+        if relayed < batch_size:
+            await asyncio.sleep(poll_interval)
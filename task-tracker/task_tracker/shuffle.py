@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import logging
+from typing import Set
+
+from sqlalchemy import Integer, asc, bindparam, cast, delete, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql.elements import Grouping
+
+import event_streaming
+from task_tracker import database
+from task_tracker.models import Account, AccountRole, ShuffleJob, ShuffleJobStatus, Task, TaskStatus
+from task_tracker.outbox import Outbox
+from task_tracker.worker_roster import WorkerRoster
+
+logger = logging.getLogger(__name__)
+
+task_lifecycle_topic = 'task-lifecycle'
+max_kept_jobs = 100
+default_chunk_size = 1000
+
+# Jobs are stored in the database, so any web server process reports them, but run by the process that started them
+_running_jobs: Set[asyncio.Task] = set()
+
+
+async def start_shuffle(
+    producer: event_streaming.Producer,
+    roster: WorkerRoster,
+    chunk_size: int = default_chunk_size,
+) -> ShuffleJob:
+    async with database.create_session() as session:
+        job = ShuffleJob()
+        session.add(job)
+        # Only the latest finished jobs are kept
+        await session.execute(delete(ShuffleJob).where(
+            ShuffleJob.finished_at.is_not(None),
+            ShuffleJob.id.not_in(
+                select(ShuffleJob.id).order_by(ShuffleJob.created_at.desc()).limit(max_kept_jobs).scalar_subquery()
+            ),
+        ).execution_options(synchronize_session=False))
+        await session.commit()
+        await session.refresh(job)
+    job_task = asyncio.create_task(shuffle_tasks(job.id, producer, roster, chunk_size))
+    _running_jobs.add(job_task)
+    job_task.add_done_callback(_running_jobs.discard)
+    return job
+
+
+async def cancel_running_jobs():
+    job_tasks = list(_running_jobs)
+    for job_task in job_tasks:
+        job_task.cancel()
+    await asyncio.gather(*job_tasks, return_exceptions=True)
+
+
+async def _finish_job(job_id: str, status: ShuffleJobStatus, error: str | None):
+    try:
+        async with database.create_session() as session:
+            await session.execute(update(ShuffleJob).where(ShuffleJob.id == job_id).values(
+                status=status,
+                error=error,
+                finished_at=datetime.datetime.now(),
+            ))
+            await session.commit()
+    except Exception:
+        logger.exception('Status %s of shuffle job %s is not saved', status.value, job_id)
+
+
+async def shuffle_tasks(job_id: str, producer: event_streaming.Producer, roster: WorkerRoster, chunk_size: int):
+    status, error = ShuffleJobStatus.failed, None
+    try:
+        async with database.create_session() as session:
+            workers = dict((await session.execute(
+                select(Account.id, Account.public_id).where(Account.role == AccountRole.worker)
+            )).all())
+            total = (await session.execute(
+                select(func.count()).select_from(Task).where(Task.status == TaskStatus.open)
+            )).scalar_one()
+            await session.execute(update(ShuffleJob).where(ShuffleJob.id == job_id).values(
+                status=ShuffleJobStatus.running,
+                total=total,
+            ))
+            await session.commit()
+        if not workers:
+            raise RuntimeError("There is no any worker, the action cannot be performed.")
+        # A worker is picked on the database side for every row of the chunk
+        # The array is cast explicitly and parenthesized, PostgreSQL can't subscript a parameter of an unknown type
+        worker_ids = Grouping(cast(bindparam('worker_ids', list(workers), type_=ARRAY(Integer)), ARRAY(Integer)))
+        random_worker_id = worker_ids[cast(func.floor(func.random() * len(workers)), Integer) + 1]
+        last_task_id = 0
+        while True:
+            async with database.create_session() as session:
+                task_ids = (await session.execute(select(Task.id).where(
+                    Task.status == TaskStatus.open,
+                    Task.id > last_task_id,
+                ).order_by(asc(Task.id)).limit(chunk_size))).scalars().all()
+                if not task_ids:
+                    break
+                assignments = (await session.execute(
+                    update(Task).where(
+                        Task.id.in_(task_ids),
+                        # A task closed since the chunk was picked is left as it is, the status is checked anew
+                        # once the lock of the closing transaction is released
+                        Task.status == TaskStatus.open,
+                    ).values(
+                        assignee_id=random_worker_id,
+                    ).returning(
+                        Task.id, Task.public_id, Task.assignee_id,
+                    ).execution_options(synchronize_session=False)
+                )).all()
+                await Outbox(session, producer).add_bulk(
+                    task_lifecycle_topic,
+                    'TaskAssigned', 1,
+                    (
+                        {'task': public_id, 'assignee': workers[assignee_id]}
+                        for _, public_id, assignee_id in assignments
+                    ),
+                )
+                # Progress is committed along with the chunk
+                await session.execute(update(ShuffleJob).where(ShuffleJob.id == job_id).values(
+                    processed=ShuffleJob.processed + len(assignments),
+                ))
+                await session.commit()
+            last_task_id = task_ids[-1]
+        # Open tasks of every worker have changed, so the roster loads them anew
+        async with database.create_session() as session:
+            await roster.load(session)
+        status = ShuffleJobStatus.completed
+    except asyncio.CancelledError:
+        # E.g. on shutdown, chunks committed so far stay reassigned
+        status, error = ShuffleJobStatus.cancelled, "The job has been cancelled."
+        raise
+    except Exception as exception:
+        logger.exception('Shuffle job %s failed', job_id)
+        error = str(exception)
+    finally:
+        # The status is saved even if the job task is cancelled once more meanwhile
+        await asyncio.shield(_finish_job(job_id, status, error))
@@ -1,15 +1,22 @@
 from functools import cache
+import math
+import time
+from typing import Any, Mapping
 
-from fastapi import Depends, HTTPException
+from fastapi import Cookie, Depends, HTTPException, Response
 from fastapi.security.oauth2 import OAuth2AuthorizationCodeBearer
 from starlette import status
-from sqlalchemy import select
+from sqlalchemy import event, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import event_streaming
+from metrics import span
 from task_tracker import auth
 from task_tracker import database
-from task_tracker.models import Account
+from task_tracker import worker_roster
+from task_tracker.models import Account, AccountRole
+from task_tracker.outbox import Outbox
+from task_tracker.web_server.token_cache import TokenCache
 
 
 async def get_session():
@@ -31,26 +38,83 @@ oauth2_scheme = OAuth2AuthorizationCodeBearer(
 )
 
 
+@cache
+def get_token_cache() -> TokenCache:
+    settings = get_auth_client().settings
+    return TokenCache(settings.token_cache_size, settings.token_cache_ttl)
+
+
 async def get_current_account(
     token: str = Depends(oauth2_scheme),
     auth_client: auth.Client = Depends(get_auth_client),
+    token_cache: TokenCache = Depends(get_token_cache),
     session: AsyncSession = Depends(get_session),
 ) -> Account:
-    try:
-        # TODO: cache a token->public_id map until the token is not expired
-        account_data = await auth_client.fetch_account(token)
-    except auth.OAuthError as error:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(error))
-    public_id = account_data['public_id']
-    result = await session.execute(
-        select(Account).where(Account.public_id == public_id)
-    )
-    account: Account | None = result.scalars().first()
-    if not account:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unknown account")
-    return account
+    async def load_account() -> Account:
+        try:
+            with span('auth'):
+                account_data = await auth_client.fetch_account(token)
+        except auth.OAuthError as error:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(error))
+        public_id = account_data['public_id']
+        result = await session.execute(
+            select(Account).where(Account.public_id == public_id)
+        )
+        account: Account | None = result.scalars().first()
+        if not account:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unknown account")
+        return account
+
+    return await token_cache.get(token, load_account)
+
+
+# Time of the latest write of a client, carried by the client so any web server process routes its reads
+last_write_cookie = 'last_write_at'
+
+
+async def get_read_session(last_write_at: float | None = Cookie(None, alias=last_write_cookie)):
+    # Replicas may lag behind, so a client that has just written reads from the primary (read-your-writes)
+    async with await database.create_read_session(written_at=last_write_at) as session:
+        yield session
+
+
+async def get_write_session(response: Response, session: AsyncSession = Depends(get_session)) -> AsyncSession:
+    def record_write(_session):
+        response.set_cookie(
+            last_write_cookie, str(time.time()), max_age=math.ceil(database.read_your_writes_window), httponly=True,
+        )
+
+    event.listen(session.sync_session, 'after_commit', record_write)
+    return session
+
+
+@event_streaming.on_event('AccountUpdated')
+@event_streaming.on_event('AccountRoleChanged')
+async def invalidate_cached_account(event_name: str, event_version: int, event_data: Mapping[str, Any]):
+    if event_data.get('public_id'):
+        get_token_cache().invalidate_account(event_data['public_id'])
+
+
+@cache
+def get_worker_roster() -> worker_roster.WorkerRoster:
+    return worker_roster.WorkerRoster(worker_roster.Settings().selection_policy)
+
+
+@event_streaming.on_event('AccountRoleChanged')
+async def update_worker_roster(event_name: str, event_version: int, event_data: Mapping[str, Any]):
+    if AccountRole(event_data['role']) == AccountRole.worker:
+        get_worker_roster().add(event_data['public_id'])
+    else:
+        get_worker_roster().remove(event_data['public_id'])
 
 
 @cache
 def get_producer() -> event_streaming.Producer:
     return event_streaming.Producer('task-tracker')
+
+
+def get_outbox(
+    session: AsyncSession = Depends(get_session),
+    producer: event_streaming.Producer = Depends(get_producer),
+) -> Outbox:
+    return Outbox(session, producer)
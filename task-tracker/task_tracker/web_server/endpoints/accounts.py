@@ -2,11 +2,11 @@ from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
 from starlette import status
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from task_tracker.models import Account, AccountRole
-from task_tracker.web_server.dependences import get_session, get_current_account
+from task_tracker.web_server.dependences import get_current_account, get_read_session
+from task_tracker.web_server.listing import Listing, list_rows, listing_responses, projection_of
 
 router = APIRouter(
     prefix='/accounts',
@@ -15,15 +15,15 @@ router = APIRouter(
 )
 
 
-@router.get('/', response_model=List[Account])
+@router.get('/', response_model=List[projection_of(Account)], responses=listing_responses)
 async def list_accounts(
-    session: AsyncSession = Depends(get_session),
+    listing: Listing = Depends(),
+    session: AsyncSession = Depends(get_read_session),
     account: Account = Depends(get_current_account),
 ):
     if account.role not in {AccountRole.manager, AccountRole.admin}:
         raise HTTPException(status.HTTP_403_FORBIDDEN)
-    result = await session.execute(select(Account))
-    return result.scalars().all()
+    return await list_rows(session, Account, listing=listing)
 
 
 @router.get('/current', response_model=Account)
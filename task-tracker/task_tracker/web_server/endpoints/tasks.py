@@ -1,17 +1,23 @@
-import random
 import re
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, constr, validator
 from starlette import status as statuses
-from sqlalchemy import select, asc
+from sqlalchemy import select
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import event_streaming
-from task_tracker.models import Account, AccountRole, Task, TaskStatus
-from task_tracker.web_server.dependences import get_session, get_current_account, get_producer
+from task_tracker.models import Account, AccountRole, ShuffleJob, Task, TaskStatus
+from task_tracker.outbox import Outbox
+from task_tracker.shuffle import start_shuffle
+from task_tracker.worker_roster import WorkerRoster
+from task_tracker.web_server.dependences import (
+    get_current_account, get_outbox, get_producer, get_read_session, get_session, get_worker_roster,
+    get_write_session,
+)
+from task_tracker.web_server.listing import Listing, list_rows, listing_responses, projection_of
 
 router = APIRouter(
     prefix='/tasks',
@@ -37,24 +43,23 @@ class TaskWrite(BaseModel):
         return value
 
 
-@router.get('/', response_model=List[Task])
+@router.get('/', response_model=List[projection_of(Task)], responses=listing_responses)
 async def list_tasks(
         status: TaskStatus | None = None,
-        session: AsyncSession = Depends(get_session),
+        listing: Listing = Depends(),
+        session: AsyncSession = Depends(get_read_session),
         account: Account = Depends(get_current_account),
 ):
     if account.role not in {AccountRole.manager, AccountRole.admin}:
         raise HTTPException(statuses.HTTP_403_FORBIDDEN)
-    query = select(Task)
-    if status:
-        query = query.where(Task.status == status)
-    return (await session.execute(query.order_by(asc(Task.id)))).scalars().all()
+    criteria = [Task.status == status] if status else []
+    return await list_rows(session, Task, *criteria, listing=listing)
 
 
 @router.get('/{task_id}', response_model=Task)
 async def get_task(
         task_id: int,
-        session: AsyncSession = Depends(get_session),
+        session: AsyncSession = Depends(get_read_session),
         account: Account = Depends(get_current_account),
 ):
     if account.role not in {AccountRole.manager, AccountRole.admin}:
@@ -70,9 +75,9 @@ async def get_task(
 async def update_task(
         task_id: int,
         task_write: TaskWrite,
-        session: AsyncSession = Depends(get_session),
+        session: AsyncSession = Depends(get_write_session),
         account: Account = Depends(get_current_account),
-        producer: event_streaming.Producer = Depends(get_producer)
+        outbox: Outbox = Depends(get_outbox),
 ):
     if account.role not in {AccountRole.manager, AccountRole.admin}:
         raise HTTPException(statuses.HTTP_403_FORBIDDEN)
@@ -85,32 +90,33 @@ async def update_task(
     for key, value in task_data.items():
         setattr(task, key, value)
     session.add(task)
-    await session.commit()
-    await session.refresh(task)
-    await producer.send(
+    outbox.add(
         task_stream_topic,
         'TaskUpdated', 2,
         task.dict(include=task_stream_fields),
     )
+    await session.commit()
+    await session.refresh(task)
     return task
 
 
-@router.get('/my/', response_model=List[Task])
+@router.get('/my/', response_model=List[projection_of(Task)], responses=listing_responses)
 async def list_my_tasks(
         status: TaskStatus | None = None,
-        session: AsyncSession = Depends(get_session),
+        listing: Listing = Depends(),
+        session: AsyncSession = Depends(get_read_session),
         account: Account = Depends(get_current_account),
 ):
-    query = select(Task).where(Task.assignee_id == account.id)
+    criteria = [Task.assignee_id == account.id]
     if status:
-        query = query.where(Task.status == status)
-    return (await session.execute(query)).scalars().all()
+        criteria.append(Task.status == status)
+    return await list_rows(session, Task, *criteria, listing=listing)
 
 
 @router.get('/my/{task_id}', response_model=Task)
 async def get_my_task(
         task_id: int,
-        session: AsyncSession = Depends(get_session),
+        session: AsyncSession = Depends(get_read_session),
         account: Account = Depends(get_current_account),
 ):
     result = await session.execute(
@@ -128,9 +134,10 @@ async def get_my_task(
 @router.post('/my/{task_id}/close', response_model=Task)
 async def close_my_task(
         task_id: int,
-        session: AsyncSession = Depends(get_session),
+        session: AsyncSession = Depends(get_write_session),
         account: Account = Depends(get_current_account),
-        producer: event_streaming.Producer = Depends(get_producer),
+        outbox: Outbox = Depends(get_outbox),
+        roster: WorkerRoster = Depends(get_worker_roster),
 ):
     task_result = await session.execute(
         select(Task).where(
@@ -146,23 +153,24 @@ async def close_my_task(
         raise HTTPException(statuses.HTTP_400_BAD_REQUEST, detail="Task already closed.")
     task.close()
     session.add(task)
-    await session.commit()
-    await session.refresh(task)
-    assignee = await session.get(Account, task.assignee_id)
-    await producer.send(
+    outbox.add(
         task_lifecycle_topic,
         'TaskClosed', 1,
-        {'task': task.public_id, 'assignee': assignee.public_id},
+        {'task': task.public_id, 'assignee': account.public_id},
     )
+    await session.commit()
+    roster.change_open_tasks(account.public_id, -1)
+    await session.refresh(task)
     return task
 
 
 @router.post('/my/{task_id}/reopen', response_model=Task)
 async def reopen_my_task(
         task_id: int,
-        session: AsyncSession = Depends(get_session),
+        session: AsyncSession = Depends(get_write_session),
         account: Account = Depends(get_current_account),
-        producer: event_streaming.Producer = Depends(get_producer),
+        outbox: Outbox = Depends(get_outbox),
+        roster: WorkerRoster = Depends(get_worker_roster),
 ):
     task_result = await session.execute(
         select(Task).where(
@@ -178,86 +186,96 @@ async def reopen_my_task(
         raise HTTPException(statuses.HTTP_400_BAD_REQUEST, detail="Task should be closed.")
     task.reopen()
     session.add(task)
-    await session.commit()
-    await session.refresh(task)
-    assignee = await session.get(Account, task.assignee_id)
-    await producer.send(
+    outbox.add(
         task_lifecycle_topic,
         'TaskAssigned', 1,
-        {'task': task.public_id, 'assignee': assignee.public_id},
+        {'task': task.public_id, 'assignee': account.public_id},
     )
+    await session.commit()
+    roster.change_open_tasks(account.public_id, 1)
+    await session.refresh(task)
     return task
 
 
 @router.post('/', response_model=Task)
 async def create_task(
         task_write: TaskWrite,
-        session: AsyncSession = Depends(get_session),
+        session: AsyncSession = Depends(get_write_session),
         account: Account = Depends(get_current_account),
-        producer: event_streaming.Producer = Depends(get_producer),
+        outbox: Outbox = Depends(get_outbox),
+        roster: WorkerRoster = Depends(get_worker_roster),
 ):
-    workers: List[Account] = (await session.execute(
-        select(Account).where(Account.role == AccountRole.worker)
-    )).scalars().all()
-    if not workers:
+    assignee = roster.pick()
+    if not assignee:
         raise HTTPException(
             statuses.HTTP_400_BAD_REQUEST,
             detail="There is no any worker assign the task to.",
         )
-    assignee: Account = random.choice(workers)
+    if assignee.id is None:
+        # The worker has been added by an event, its ID is looked up once by the unique public ID
+        assignee.id = (await session.execute(
+            select(Account.id).where(Account.public_id == assignee.public_id)
+        )).scalar()
+        if assignee.id is None:
+            raise HTTPException(
+                statuses.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The picked worker is not known yet, try again.",
+            )
     task = Task(
         title=task_write.title,
+        jira_id=task_write.jira_id,
         description=task_write.description,
         reporter_id=account.id,
         assignee_id=assignee.id,
     )
     session.add(task)
-    await session.commit()
-    await session.refresh(task)
-    await session.refresh(assignee)
-    await producer.send(
+    outbox.add(
         task_stream_topic,
         'TaskCreated', 2,
         task.dict(include=task_stream_fields),
     )
-    await producer.send(
+    outbox.add(
         task_lifecycle_topic,
         'TaskAdded', 1,
         {'task': task.public_id},
     )
-    await producer.send(
+    outbox.add(
         task_lifecycle_topic,
         'TaskAssigned', 1,
         {'task': task.public_id, 'assignee': assignee.public_id},
     )
+    await session.commit()
+    roster.change_open_tasks(assignee.public_id, 1)
+    await session.refresh(task)
     return task
 
 
-@router.post('/shuffle')
+@router.post('/shuffle', response_model=ShuffleJob, status_code=statuses.HTTP_202_ACCEPTED)
 async def shuffle_tasks(
-        session: AsyncSession = Depends(get_session),
         account: Account = Depends(get_current_account),
         producer: event_streaming.Producer = Depends(get_producer),
+        roster: WorkerRoster = Depends(get_worker_roster),
 ):
     if account.role not in {AccountRole.manager, AccountRole.admin}:
         raise HTTPException(statuses.HTTP_403_FORBIDDEN)
-    workers: List[Account] = (await session.execute(
-        select(Account).where(Account.role == AccountRole.worker)
-    )).scalars().all()
-    if not workers:
+    if not roster:
         raise HTTPException(
             statuses.HTTP_400_BAD_REQUEST,
             detail="There is no any worker, the action cannot be performed.",
         )
-    open_tasks: List[Task] = (await session.execute(
-        select(Task).where(Task.status == TaskStatus.open).order_by(asc(Task.id))
-    )).scalars().all()
-    result = []
-    for task in open_tasks:
-        new_assignee = random.choice(workers)
-        result.append({'task': task.public_id, 'assignee': new_assignee.public_id})
-        task.assign(new_assignee)
-        session.add(task)
-    for result_item in result:
-        await producer.send(task_lifecycle_topic, 'TaskAssigned', 1, result_item)
-    await session.commit()
+    return await start_shuffle(producer, roster)
+
+
+@router.get('/shuffle/{job_id}', response_model=ShuffleJob)
+async def get_shuffle_job(
+        job_id: str,
+        account: Account = Depends(get_current_account),
+        session: AsyncSession = Depends(get_session),
+):
+    if account.role not in {AccountRole.manager, AccountRole.admin}:
+        raise HTTPException(statuses.HTTP_403_FORBIDDEN)
+    # Progress is polled right after the start, so the primary is read rather than a lagging replica
+    job = await session.get(ShuffleJob, job_id)
+    if job is None:
+        raise HTTPException(statuses.HTTP_404_NOT_FOUND)
+    return job
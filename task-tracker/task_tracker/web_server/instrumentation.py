@@ -0,0 +1,134 @@
+"""
+Request-level instrumentation of the web server.
+
+Latency of every route is recorded along with the time a request spends in auth, SQL and Kafka produce spans and
+the number of its SQL queries, to catch N+1 queries. Metrics are served on /metrics, traces are exported to an
+OpenTelemetry collector if TRACING_OTLP_ENDPOINT is set and the OpenTelemetry SDK is installed:
+
+    pip install opentelemetry-sdk opentelemetry-exporter-otlp-proto-http
+"""
+from contextlib import nullcontext
+import logging
+import time
+
+from prometheus_client import Histogram
+from pydantic import BaseSettings
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import metrics
+from metrics import SpanTimings, current_span_timings, record_span
+
+logger = logging.getLogger(__name__)
+
+
+class Settings(BaseSettings):
+    # OTLP/HTTP traces endpoint of the collector, e.g. http://localhost:4318/v1/traces
+    otlp_endpoint: str | None = None
+    service_name: str = 'task-tracker'
+
+    class Config:
+        env_prefix = 'tracing_'
+
+
+span_names = 'auth', 'sql', 'kafka_produce'
+
+request_duration = Histogram(
+    'http_request_duration_seconds', "Time of handling a request.", ['method', 'route', 'status'],
+)
+request_span_duration = Histogram(
+    'http_request_span_duration_seconds', "Time a request spends in the spans of a kind.", ['route', 'span'],
+)
+request_sql_queries = Histogram(
+    'http_request_sql_queries', "SQL queries executed by a request.", ['route'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+
+_tracer_provider = None
+
+
+def _get_route(scope: Scope) -> str:
+    # The route is known once the request has been routed, its path template is used as a label
+    return scope['route'].path if 'route' in scope else 'unmatched'
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        span_timings = SpanTimings()
+        span_timings_token = current_span_timings.set(span_timings)
+        tracing_span = metrics.tracer.start_as_current_span(scope['method']) if metrics.tracer else nullcontext()
+        started_at = time.perf_counter()
+        try:
+            with tracing_span as request_span:
+                try:
+                    await self.app(scope, receive, send_with_status)
+                finally:
+                    if request_span is not None:
+                        request_span.update_name(f"{scope['method']} {_get_route(scope)}")
+                        request_span.set_attribute('http.route', _get_route(scope))
+                        request_span.set_attribute('http.status_code', status_code)
+        finally:
+            current_span_timings.reset(span_timings_token)
+            route = _get_route(scope)
+            request_duration.labels(method=scope['method'], route=route, status=status_code).observe(
+                time.perf_counter() - started_at,
+            )
+            for span_name in span_names:
+                if span_name in span_timings.counts:
+                    request_span_duration.labels(route=route, span=span_name).observe(span_timings.durations[span_name])
+            request_sql_queries.labels(route=route).observe(span_timings.counts.get('sql', 0))
+
+
+def instrument_engine(engine: AsyncEngine):
+    # Statements of a connection are executed one at a time, so the start time is kept on the connection
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        connection.info['query_started_at'] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        started_at = connection.info.pop('query_started_at', None)
+        if started_at is not None:
+            record_span('sql', time.perf_counter() - started_at, statement=statement)
+
+
+def setup_tracing(settings: Settings):
+    global _tracer_provider
+    if not settings.otlp_endpoint:
+        return
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as error:
+        logger.error('Traces are not exported, the OpenTelemetry SDK is not installed: %s', error)
+        return
+    _tracer_provider = TracerProvider(resource=Resource.create({'service.name': settings.service_name}))
+    _tracer_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.otlp_endpoint)))
+    metrics.tracer = _tracer_provider.get_tracer(__name__)
+    logger.info('Traces are exported to %s', settings.otlp_endpoint)
+
+
+def shutdown_tracing():
+    global _tracer_provider
+    if _tracer_provider is not None:
+        # Spans still buffered by the batch processor are exported
+        _tracer_provider.shutdown()
+        _tracer_provider = None
+        metrics.tracer = None
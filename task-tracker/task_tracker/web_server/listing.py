@@ -0,0 +1,101 @@
+import enum
+import functools
+import json
+from typing import Any, AsyncIterator, List, Optional, Type
+
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, create_model
+from starlette import status
+from sqlalchemy import asc, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlmodel import SQLModel
+
+from task_tracker import database
+
+max_page_size = 1000
+stream_chunk_size = 500
+
+
+class ListingFormat(enum.Enum):
+    json = 'json'
+    ndjson = 'ndjson'
+
+
+listing_responses = {
+    status.HTTP_200_OK: {
+        'description': "Rows as a JSON array, or a JSON object per line with `format=ndjson`.",
+        'content': {'application/x-ndjson': {}},
+    },
+}
+
+
+@functools.lru_cache(maxsize=None)
+def projection_of(model: Type[SQLModel]) -> Type[BaseModel]:
+    # Rows carry the requested fields only, so every field of the projection is optional
+    return create_model(
+        f'{model.__name__}Projection',
+        **{
+            name: (Optional[field.outer_type_], Field(None, description=field.field_info.description))
+            for name, field in model.__fields__.items()
+        },
+    )
+
+
+class Listing:
+    def __init__(
+        self,
+        after_id: int | None = Query(None, description="Return rows with ID greater than this one."),
+        limit: int | None = Query(
+            None, ge=1, le=max_page_size,
+            description="Page size, every row is returned if it's not set. Ignored by NDJSON streaming.",
+        ),
+        fields: List[str] | None = Query(None, description="Return only these fields."),
+        format: ListingFormat = ListingFormat.json,
+    ):
+        self.after_id = after_id
+        self.limit = limit
+        self.fields = fields
+        self.format = format
+
+    def get_fields(self, model: Type[SQLModel]) -> List[str]:
+        if not self.fields:
+            return list(model.__fields__)
+        unknown_fields = set(self.fields) - set(model.__fields__)
+        if unknown_fields:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown_fields))}.",
+            )
+        return self.fields
+
+
+async def list_rows(session: AsyncSession, model: Type[SQLModel], *criteria: Any, listing: Listing):
+    fields = listing.get_fields(model)
+    # Rows are selected as plain columns and paginated by ID (keyset pagination)
+    query = select(model.id, *(getattr(model, field) for field in fields)).where(*criteria)
+    if listing.after_id is not None:
+        query = query.where(model.id > listing.after_id)
+    query = query.order_by(asc(model.id))
+    if listing.format == ListingFormat.ndjson:
+        # The connection of the request session is released, the stream reads from the same engine on its own
+        bind = session.bind
+        await session.close()
+        return StreamingResponse(_stream_rows(bind, query, fields), media_type='application/x-ndjson')
+    if listing.limit is not None:
+        query = query.limit(listing.limit)
+    rows = (await session.execute(query)).all()
+    headers = {}
+    if listing.limit is not None and len(rows) == listing.limit:
+        headers['X-Next-After-Id'] = str(rows[-1][0])
+    # Rows are plain columns, so they are encoded directly instead of being validated by the projection
+    return JSONResponse([jsonable_encoder(dict(zip(fields, row[1:]))) for row in rows], headers=headers)
+
+
+async def _stream_rows(bind: AsyncEngine, query, fields: List[str]) -> AsyncIterator[str]:
+    # The stream outlives the request dependencies, so it reads through its own session (server-side cursor)
+    async with database.session_factory(bind=bind) as session:
+        result = await session.stream(query.execution_options(yield_per=stream_chunk_size))
+        async for rows in result.partitions():
+            yield ''.join(json.dumps(jsonable_encoder(dict(zip(fields, row[1:])))) + '\n' for row in rows)
@@ -1,12 +1,21 @@
+import asyncio
+import logging
+
 from fastapi import FastAPI, Form, HTTPException, Depends
+from prometheus_client import make_asgi_app
 
 import event_streaming
 from task_tracker import auth
 from task_tracker import database
-from task_tracker.web_server.dependences import get_auth_client, get_producer
+from task_tracker import shuffle
+from task_tracker import worker_roster
+from task_tracker.web_server import instrumentation
+from task_tracker.web_server.dependences import get_auth_client, get_producer, get_token_cache, get_worker_roster
 from task_tracker.web_server.endpoints import accounts
 from task_tracker.web_server.endpoints import tasks
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Task Tracker",
     swagger_ui_init_oauth={
@@ -21,17 +30,75 @@ app = FastAPI(
 )
 app.include_router(accounts.router)
 app.include_router(tasks.router)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
+
+# Every web server process reads account events on its own (no consumer group) to invalidate its token cache
+# and to keep its worker roster current
+account_topics = 'accounts-stream', 'accounts'
+account_consumer_restart_delay = 5
+background_tasks = set()
+
+
+async def refresh_worker_roster(interval: float):
+    # Open tasks are counted by every web server process on its own, so the counts are resynced periodically
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with database.create_session() as session:
+                await get_worker_roster().load(session)
+        except Exception:
+            # The roster is kept as is until the next refresh
+            logger.exception('Refreshing the worker roster failed')
+
+
+async def consume_account_events(restart_delay: float):
+    # Without the consumer the token cache and the worker roster go stale, so it's restarted whenever it stops
+    while True:
+        try:
+            await event_streaming.consume(event_streaming.Settings(), account_topics, group=None)
+            logger.error('Consuming account events stopped, restarting in %ss', restart_delay)
+        except Exception:
+            logger.exception('Consuming account events failed, restarting in %ss', restart_delay)
+        await asyncio.sleep(restart_delay)
 
 
 @app.on_event('startup')
 async def on_startup():
+    instrumentation.setup_tracing(instrumentation.Settings())
     await database.setup(database.Settings())
+    for engine in [database.engine, *database.replicas.engines]:
+        instrumentation.instrument_engine(engine)
+    await get_auth_client().start()
     await get_producer().start(event_streaming.Settings())
+    async with database.create_session() as session:
+        await get_worker_roster().load(session)
+    background_tasks.add(asyncio.create_task(refresh_worker_roster(worker_roster.Settings().refresh_interval)))
+    background_tasks.add(asyncio.create_task(consume_account_events(account_consumer_restart_delay)))
 
 
 @app.on_event('shutdown')
 async def on_shutdown():
+    for background_task in background_tasks:
+        background_task.cancel()
+    # Running shuffle jobs are stopped while the database is still there to record it
+    await shuffle.cancel_running_jobs()
+    await get_producer().flush()
     await get_producer().stop()
+    await get_auth_client().stop()
+    instrumentation.shutdown_tracing()
+
+
+app.mount('/metrics', make_asgi_app())
+
+
+@app.get('/stats/token-cache', include_in_schema=False)
+async def get_token_cache_stats():
+    return get_token_cache().stats()
+
+
+@app.get('/stats/worker-roster', include_in_schema=False)
+async def get_worker_roster_stats():
+    return get_worker_roster().stats()
 
 
 @app.post('/oauth/token', include_in_schema=False)
@@ -0,0 +1,100 @@
+import asyncio
+import base64
+from collections import OrderedDict, defaultdict
+import json
+import time
+from typing import Awaitable, Callable, Dict, Set, Tuple
+
+from task_tracker.models import Account
+
+AccountLoader = Callable[[], Awaitable[Account]]
+
+
+def get_token_expiration_time(token: str) -> float | None:
+    # Only JWT access tokens carry their expiration time, opaque tokens are cached for the default TTL
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenCache:
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: OrderedDict[str, Tuple[float, Account]] = OrderedDict()
+        self._tokens_by_account: Dict[str, Set[str]] = defaultdict(set)
+        self._loads: Dict[str, asyncio.Task] = dict()
+        # Invalidations are numbered, a load doesn't cache an account invalidated after the load has started
+        self._invalidations = 0
+        self._account_invalidations: Dict[str, int] = dict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, token: str, load_account: AccountLoader) -> Account:
+        entry = self._entries.get(token)
+        if entry:
+            expires_at, account = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return account
+            self._evict(token)
+        load = self._loads.get(token)
+        if load:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            load = self._loads[token] = asyncio.create_task(self._load(token, load_account))
+            load.add_done_callback(lambda _: self._on_load_done(token))
+        # A cancelled request must not cancel the lookup other requests are waiting for
+        return await asyncio.shield(load)
+
+    async def _load(self, token: str, load_account: AccountLoader) -> Account:
+        invalidations = self._invalidations
+        account = await load_account()
+        # A detached copy is cached, the loaded instance belongs to the session of the first request
+        account = Account(**account.dict())
+        if self._account_invalidations.get(account.public_id, 0) > invalidations:
+            # The account may have been loaded before its change, it's returned to the waiting requests only
+            return account
+        expires_at = time.time() + self._ttl
+        token_expiration_time = get_token_expiration_time(token)
+        if token_expiration_time is not None:
+            expires_at = min(expires_at, token_expiration_time)
+        self._entries[token] = expires_at, account
+        self._tokens_by_account[account.public_id].add(token)
+        while len(self._entries) > self._max_size:
+            self._evict(next(iter(self._entries)))
+        return account
+
+    def _on_load_done(self, token: str):
+        self._loads.pop(token, None)
+        # Invalidations are only compared with in-flight loads
+        if not self._loads:
+            self._account_invalidations.clear()
+
+    def _evict(self, token: str):
+        _expires_at, account = self._entries.pop(token)
+        account_tokens = self._tokens_by_account[account.public_id]
+        account_tokens.discard(token)
+        if not account_tokens:
+            del self._tokens_by_account[account.public_id]
+
+    def invalidate_account(self, account_public_id: str):
+        self._invalidations += 1
+        if self._loads:
+            self._account_invalidations[account_public_id] = self._invalidations
+        for token in self._tokens_by_account.pop(account_public_id, set()):
+            self._entries.pop(token, None)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,124 @@
+from collections import defaultdict
+import dataclasses
+import enum
+import random
+from typing import Dict, List, Set
+
+from pydantic import BaseSettings
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from task_tracker.models import Account, AccountRole, Task, TaskStatus
+
+
+class SelectionPolicy(enum.Enum):
+    random = 'random'
+    least_loaded = 'least_loaded'
+
+
+class Settings(BaseSettings):
+    selection_policy: SelectionPolicy = SelectionPolicy.random
+    refresh_interval: float = 300
+
+    class Config:
+        env_prefix = 'worker_roster_'
+
+
+@dataclasses.dataclass
+class Worker:
+    public_id: str
+    id: int | None = None
+    open_tasks: int = 0
+
+
+class WorkerRoster:
+    """
+    Workers the tasks are assigned to, kept in memory of the web server process.
+
+    Workers are picked at random in O(1) or the least loaded one is picked, the load is the number of open tasks.
+    """
+
+    def __init__(self, selection_policy: SelectionPolicy):
+        self.selection_policy = selection_policy
+        self._workers: Dict[str, Worker] = {}
+        # A list is kept next to the mapping for random picks, a removed worker is swapped with the last one
+        self._public_ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._public_ids_by_load: Dict[int, Set[str]] = defaultdict(set)
+        self._min_load = 0
+
+    def __len__(self) -> int:
+        return len(self._workers)
+
+    def add(self, public_id: str, id: int | None = None, open_tasks: int = 0):
+        worker = self._workers.get(public_id)
+        if worker:
+            if id is not None:
+                worker.id = id
+            return
+        self._workers[public_id] = Worker(public_id, id, open_tasks)
+        self._positions[public_id] = len(self._public_ids)
+        self._public_ids.append(public_id)
+        self._add_load(public_id, open_tasks)
+
+    def remove(self, public_id: str):
+        worker = self._workers.pop(public_id, None)
+        if not worker:
+            return
+        position = self._positions.pop(public_id)
+        last_public_id = self._public_ids.pop()
+        if last_public_id != public_id:
+            self._public_ids[position] = last_public_id
+            self._positions[last_public_id] = position
+        self._remove_load(public_id, worker.open_tasks)
+
+    def pick(self) -> Worker | None:
+        if not self._workers:
+            return None
+        if self.selection_policy == SelectionPolicy.least_loaded:
+            return self._workers[next(iter(self._public_ids_by_load[self._min_load]))]
+        return self._workers[random.choice(self._public_ids)]
+
+    def change_open_tasks(self, public_id: str, delta: int):
+        worker = self._workers.get(public_id)
+        if not worker:
+            return
+        self._remove_load(public_id, worker.open_tasks)
+        worker.open_tasks = max(worker.open_tasks + delta, 0)
+        self._add_load(public_id, worker.open_tasks)
+
+    async def load(self, session: AsyncSession):
+        workers = (await session.execute(
+            select(Account.public_id, Account.id).where(Account.role == AccountRole.worker)
+        )).all()
+        open_tasks = dict((await session.execute(
+            select(Task.assignee_id, func.count()).where(
+                Task.status == TaskStatus.open,
+            ).group_by(Task.assignee_id)
+        )).all())
+        self._workers.clear()
+        self._public_ids.clear()
+        self._positions.clear()
+        self._public_ids_by_load.clear()
+        for public_id, id in workers:
+            self.add(public_id, id, open_tasks.get(id, 0))
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self._workers),
+            'min_open_tasks': self._min_load if self._workers else None,
+            'max_open_tasks': max(self._public_ids_by_load) if self._workers else None,
+        }
+
+    def _add_load(self, public_id: str, load: int):
+        if not self._public_ids_by_load or load < self._min_load:
+            self._min_load = load
+        self._public_ids_by_load[load].add(public_id)
+
+    def _remove_load(self, public_id: str, load: int):
+        public_ids = self._public_ids_by_load[load]
+        public_ids.discard(public_id)
+        if not public_ids:
+            del self._public_ids_by_load[load]
+            if load == self._min_load and self._public_ids_by_load:
+                self._min_load = min(self._public_ids_by_load)
@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from task_tracker import database
+
+# The web server reads the auth settings on import, no request reaches the auth service in tests
+for name, value in {
+    'AUTH_OAUTH_CLIENT_ID': 'task-tracker',
+    'AUTH_OAUTH_CLIENT_SECRET': 'secret',
+    'AUTH_INTERNAL_URL': 'http://auth',
+    'AUTH_URL': 'http://auth',
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def database_settings() -> database.Settings:
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+
+    async def drop_tables():
+        engine = create_async_engine(url)
+        async with engine.begin() as connection:
+            await connection.execute(text('DROP SCHEMA public CASCADE'))
+            await connection.execute(text('CREATE SCHEMA public'))
+        await engine.dispose()
+
+    asyncio.run(drop_tables())
+    return database.Settings(url=url)
+
+
+class FakeProducer:
+    """Builds events the way the producer does, without schemas and without a broker."""
+
+    def build_event(self, event_name: str, event_version: int, data: dict) -> dict:
+        return {'event_name': event_name, 'event_version': event_version, 'data': data}
+
+
+@pytest.fixture
+def producer() -> FakeProducer:
+    return FakeProducer()
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from fastapi import Depends, FastAPI
+import httpx
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from task_tracker import database
+from task_tracker.web_server.dependences import get_read_session, get_write_session
+
+pytest.importorskip('aiosqlite')
+
+
+def create_sqlite_engine(path) -> AsyncEngine:
+    # Connections are not pooled, every scenario runs its own event loop
+    return create_async_engine(f'sqlite+aiosqlite:///{path}', poolclass=NullPool)
+
+
+def create_unreachable_engine(tmp_path) -> AsyncEngine:
+    return create_sqlite_engine(tmp_path / 'missing' / 'replica.db')
+
+
+@pytest.fixture
+def engines(tmp_path, monkeypatch):
+    """SQLite stand-ins of the primary and two replicas, the replicas are returned along with the primary."""
+    primary, *replica_engines = [
+        create_sqlite_engine(tmp_path / f'{name}.db') for name in ('primary', 'first', 'second')
+    ]
+    monkeypatch.setattr(database, 'replicas', database.Replicas(replica_engines, retry_interval=60))
+    monkeypatch.setattr(database, 'read_your_writes_window', 5)
+    database.session_factory.configure(bind=primary)
+    return primary, replica_engines
+
+
+async def get_read_bind(written_at: float | None = None):
+    async with await database.create_read_session(written_at) as session:
+        return session.bind
+
+
+def test_replicas_are_taken_in_turns(engines):
+    _, (first, second) = engines
+    replicas = database.replicas
+    assert replicas.get_candidates() == [first, second]
+    assert replicas.get_candidates() == [second, first]
+    assert replicas.get_candidates() == [first, second]
+
+
+def test_unavailable_replica_is_skipped_for_retry_interval(engines, monkeypatch):
+    _, (first, second) = engines
+    replicas = database.replicas
+    replicas.mark_unavailable(first)
+    assert replicas.get_candidates() == [second]
+    assert replicas.get_candidates() == [second]
+    retried_at = time.monotonic() + 61
+    monkeypatch.setattr(time, 'monotonic', lambda: retried_at)
+    assert replicas.get_candidates() == [first, second]
+
+
+def test_unreachable_replica_is_marked_unavailable(engines, tmp_path, monkeypatch):
+    _, (first, _second) = engines
+    unreachable = create_unreachable_engine(tmp_path)
+    monkeypatch.setattr(database, 'replicas', database.Replicas([unreachable, first], retry_interval=60))
+
+    assert asyncio.run(get_read_bind()) is first
+    assert database.replicas.get_candidates() == [first]
+
+
+def test_reads_fall_back_to_primary(engines, tmp_path, monkeypatch):
+    primary, _ = engines
+
+    async def scenario():
+        binds = []
+        for replica_engines in ([create_unreachable_engine(tmp_path)], []):
+            monkeypatch.setattr(database, 'replicas', database.Replicas(replica_engines, retry_interval=60))
+            binds.append(await get_read_bind())
+        # The thread of the failed connection reports to the loop once more before it stops
+        await asyncio.sleep(0.1)
+        return binds
+
+    assert asyncio.run(scenario()) == [primary, primary]
+
+
+def test_writer_reads_from_primary_within_window(engines):
+    primary, (first, second) = engines
+    assert asyncio.run(get_read_bind(written_at=time.time() - 1)) is primary
+    assert asyncio.run(get_read_bind(written_at=time.time() - 6)) in (first, second)
+
+
+def test_write_time_is_carried_by_client(engines):
+    primary, replica_engines = engines
+    app = FastAPI()
+
+    @app.post('/write')
+    async def write(session: AsyncSession = Depends(get_write_session)):
+        await session.commit()
+
+    @app.get('/read')
+    async def read(session: AsyncSession = Depends(get_read_session)):
+        return session.bind is primary
+
+    async def scenario():
+        # The cookie is all the processes share, whichever of them serves the next request
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            read_before_write = (await client.get('/read')).json()
+            await client.post('/write')
+            last_write_at = client.cookies['last_write_at']
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url='http://test', cookies={'last_write_at': last_write_at},
+        ) as client:
+            read_after_write = (await client.get('/read')).json()
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url='http://test',
+            cookies={'last_write_at': str(float(last_write_at) - 6)},
+        ) as client:
+            read_after_window = (await client.get('/read')).json()
+        return read_before_write, read_after_write, read_after_window
+
+    assert asyncio.run(scenario()) == (False, True, False)
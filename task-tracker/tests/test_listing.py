@@ -0,0 +1,45 @@
+import asyncio
+import json
+
+from task_tracker import database
+from task_tracker.models import Account, AccountRole, Task
+from task_tracker.web_server import app
+from task_tracker.web_server.listing import Listing, ListingFormat, list_rows
+
+
+def test_listing_schema_describes_projected_rows():
+    schema = app.openapi()
+    response = schema['paths']['/tasks/']['get']['responses']['200']
+    assert set(response['content']) == {'application/json', 'application/x-ndjson'}
+    assert response['content']['application/json']['schema']['items']['$ref'].endswith('/TaskProjection')
+    projection = schema['components']['schemas']['TaskProjection']
+    assert 'required' not in projection
+    assert set(projection['properties']) == set(Task.__fields__)
+
+
+def test_listing_without_limit_returns_every_row(database_settings):
+    async def scenario():
+        await database.setup(database_settings)
+        async with database.create_session() as session:
+            account = Account(public_id='manager', email='manager@example.com', full_name='', role=AccountRole.manager)
+            session.add(account)
+            await session.flush()
+            session.add_all(
+                Task(title=f'Task {n}', reporter_id=account.id, assignee_id=account.id) for n in range(150)
+            )
+            await session.commit()
+        async with database.create_session() as session:
+            listing = Listing(after_id=None, limit=None, fields=['title'], format=ListingFormat.json)
+            every_row = await list_rows(session, Task, listing=listing)
+            listing = Listing(after_id=None, limit=100, fields=['title'], format=ListingFormat.json)
+            page = await list_rows(session, Task, listing=listing)
+        await database.engine.dispose()
+        return every_row, page
+
+    every_row, page = asyncio.run(scenario())
+    assert len(json.loads(every_row.body)) == 150
+    assert 'X-Next-After-Id' not in every_row.headers
+    rows = json.loads(page.body)
+    assert len(rows) == 100
+    assert rows[0] == {'title': 'Task 0'}
+    assert page.headers['X-Next-After-Id']
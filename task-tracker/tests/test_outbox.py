@@ -0,0 +1,131 @@
+import asyncio
+from typing import List
+
+import pytest
+from sqlalchemy import asc, select
+
+from task_tracker import database
+from task_tracker.models import Account, AccountRole, OutboxEvent, Task
+from task_tracker.outbox import Outbox
+from task_tracker.outbox.relay import relay_batch
+
+
+class Broker:
+    """Producer side of the relay, deliveries are acknowledged once the test lets them."""
+
+    def __init__(self, failing_event: str | None = None):
+        self.failing_event = failing_event
+        self.sent: List[dict] = []
+        self.acknowledged = asyncio.Event()
+        self.acknowledged.set()
+
+    async def send_event(self, topic_name: str, message: dict) -> asyncio.Future:
+        if message['event_name'] == self.failing_event:
+            raise RuntimeError('The broker is not available')
+        self.sent.append(message)
+        return asyncio.ensure_future(self.acknowledged.wait())
+
+
+async def create_task(producer, title: str):
+    # Events are written along with the task, as the web server does
+    async with database.create_session() as session:
+        reporter = Account(public_id=title, email=f'{title}@example.com', full_name='', role=AccountRole.manager)
+        session.add(reporter)
+        await session.flush()
+        task = Task(title=title, reporter_id=reporter.id, assignee_id=reporter.id)
+        session.add(task)
+        outbox = Outbox(session, producer)
+        outbox.add('task-stream', 'TaskCreated', 2, {'public_id': task.public_id})
+        outbox.add('task-lifecycle', 'TaskAdded', 1, {'task': task.public_id})
+        outbox.add('task-lifecycle', 'TaskAssigned', 1, {'task': task.public_id, 'assignee': title})
+        await session.commit()
+
+
+async def get_outbox_events() -> List[str]:
+    async with database.create_session() as session:
+        return (await session.execute(
+            select(OutboxEvent.message['event_name'].as_string()).order_by(asc(OutboxEvent.id))
+        )).scalars().all()
+
+
+def test_events_are_relayed_in_order_of_writing(database_settings, producer):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_task(producer, 'first')
+        await create_task(producer, 'second')
+        broker = Broker()
+        relayed = [await relay_batch(broker, batch_size=4), await relay_batch(broker, batch_size=4)]
+        left = await get_outbox_events()
+        await database.engine.dispose()
+        return relayed, broker.sent, left
+
+    relayed, sent, left = asyncio.run(scenario())
+    assert relayed == [4, 2]
+    assert [(message['event_name'], message['data'].get('assignee')) for message in sent] == [
+        ('TaskCreated', None), ('TaskAdded', None), ('TaskAssigned', 'first'),
+        ('TaskCreated', None), ('TaskAdded', None), ('TaskAssigned', 'second'),
+    ]
+    assert left == []
+
+
+def test_rows_are_deleted_after_acknowledgement(database_settings, producer):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_task(producer, 'first')
+        broker = Broker()
+        broker.acknowledged.clear()
+        relaying = asyncio.create_task(relay_batch(broker, batch_size=10))
+        while len(broker.sent) < 3:
+            await asyncio.sleep(0.01)
+        left_unacknowledged = await get_outbox_events()
+        broker.acknowledged.set()
+        relayed = await relaying
+        left = await get_outbox_events()
+        await database.engine.dispose()
+        return left_unacknowledged, relayed, left
+
+    left_unacknowledged, relayed, left = asyncio.run(scenario())
+    assert left_unacknowledged == ['TaskCreated', 'TaskAdded', 'TaskAssigned']
+    assert relayed == 3
+    assert left == []
+
+
+def test_failed_batch_is_relayed_again(database_settings, producer):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_task(producer, 'first')
+        with pytest.raises(RuntimeError):
+            await relay_batch(Broker(failing_event='TaskAdded'), batch_size=10)
+        left_after_failure = await get_outbox_events()
+        broker = Broker()
+        relayed = await relay_batch(broker, batch_size=10)
+        await database.engine.dispose()
+        return left_after_failure, relayed, broker.sent
+
+    left_after_failure, relayed, sent = asyncio.run(scenario())
+    assert left_after_failure == ['TaskCreated', 'TaskAdded', 'TaskAssigned']
+    assert relayed == 3
+    assert [message['event_name'] for message in sent] == ['TaskCreated', 'TaskAdded', 'TaskAssigned']
+
+
+def test_rows_locked_by_another_relay_are_skipped(database_settings, producer):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_task(producer, 'first')
+        broker = Broker()
+        # The first event is being relayed by another process meanwhile
+        async with database.create_session() as other_relay:
+            await other_relay.execute(
+                select(OutboxEvent).order_by(asc(OutboxEvent.id)).limit(1).with_for_update(skip_locked=True)
+            )
+            relayed_meanwhile = await relay_batch(broker, batch_size=10)
+            left_locked = await get_outbox_events()
+        relayed_after = await relay_batch(broker, batch_size=10)
+        await database.engine.dispose()
+        return relayed_meanwhile, left_locked, relayed_after, broker.sent
+
+    relayed_meanwhile, left_locked, relayed_after, sent = asyncio.run(scenario())
+    assert relayed_meanwhile == 2
+    assert left_locked == ['TaskCreated']
+    assert relayed_after == 1
+    assert [message['event_name'] for message in sent] == ['TaskAdded', 'TaskAssigned', 'TaskCreated']
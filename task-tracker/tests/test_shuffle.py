@@ -0,0 +1,123 @@
+import asyncio
+
+from sqlalchemy import func, select, text, update
+
+from task_tracker import database, shuffle
+from task_tracker.models import Account, AccountRole, OutboxEvent, ShuffleJob, ShuffleJobStatus, Task, TaskStatus
+from task_tracker.worker_roster import SelectionPolicy, WorkerRoster
+
+
+async def create_tasks(open_tasks: int, closed_tasks: int):
+    async with database.create_session() as session:
+        manager = Account(public_id='manager', email='manager@example.com', full_name='', role=AccountRole.manager)
+        workers = [
+            Account(public_id=f'worker-{n}', email=f'worker-{n}@example.com', full_name='', role=AccountRole.worker)
+            for n in range(2)
+        ]
+        session.add_all([manager, *workers])
+        await session.flush()
+        session.add_all([
+            Task(
+                title=f'Task {n}',
+                status=TaskStatus.open if n < open_tasks else TaskStatus.closed,
+                reporter_id=manager.id,
+                assignee_id=workers[0].id,
+            )
+            for n in range(open_tasks + closed_tasks)
+        ])
+        await session.commit()
+
+
+async def wait_for_job(job_id: str) -> ShuffleJob:
+    while True:
+        async with database.create_session() as session:
+            job = await session.get(ShuffleJob, job_id)
+        if job.finished_at is not None:
+            return job
+        await asyncio.sleep(0.01)
+
+
+class BlockedRoster(WorkerRoster):
+    def __init__(self):
+        super().__init__(SelectionPolicy.random)
+        self.loading = asyncio.Event()
+
+    async def load(self, session):
+        self.loading.set()
+        await asyncio.Event().wait()
+
+
+def test_shuffle_job_is_stored(database_settings, producer):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_tasks(open_tasks=5, closed_tasks=2)
+        job = await shuffle.start_shuffle(producer, WorkerRoster(SelectionPolicy.random), chunk_size=2)
+        assert job.status == ShuffleJobStatus.pending
+        job = await wait_for_job(job.id)
+        async with database.create_session() as session:
+            events = (await session.execute(select(func.count()).select_from(OutboxEvent))).scalar_one()
+        await database.engine.dispose()
+        return job, events
+
+    job, events = asyncio.run(scenario())
+    assert job.status == ShuffleJobStatus.completed
+    assert (job.total, job.processed, job.error) == (5, 5, None)
+    assert events == 5
+
+
+def test_cancelled_shuffle_job_gets_terminal_status(database_settings, producer):
+    async def scenario():
+        await database.setup(database_settings)
+        await create_tasks(open_tasks=3, closed_tasks=0)
+        roster = BlockedRoster()
+        job = await shuffle.start_shuffle(producer, roster)
+        await roster.loading.wait()
+        await shuffle.cancel_running_jobs()
+        job = await wait_for_job(job.id)
+        await database.engine.dispose()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == ShuffleJobStatus.cancelled
+    assert job.processed == 3
+
+
+def test_task_closed_during_chunk_update_keeps_its_assignee(database_settings, producer):
+    async def wait_for_lock():
+        # Activity of the backends is snapshotted once per transaction, so every check runs in its own one
+        while True:
+            async with database.engine.connect() as connection:
+                if (await connection.execute(text(
+                    "SELECT count(*) FROM pg_stat_activity"
+                    " WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                ))).scalar_one():
+                    return
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        await database.setup(database_settings)
+        await create_tasks(open_tasks=3, closed_tasks=0)
+        async with database.create_session() as session:
+            closed_task = (await session.execute(select(Task).where(Task.title == 'Task 1'))).scalar_one()
+        # The task is closed by a transaction still running once the shuffle has picked its chunk
+        async with database.engine.connect() as closing_connection:
+            closing = await closing_connection.begin()
+            await closing_connection.execute(
+                update(Task).where(Task.id == closed_task.id).values(status=TaskStatus.closed)
+            )
+            job = await shuffle.start_shuffle(producer, WorkerRoster(SelectionPolicy.random))
+            await wait_for_lock()
+            await closing.commit()
+        job = await wait_for_job(job.id)
+        async with database.create_session() as session:
+            task = await session.get(Task, closed_task.id)
+            events = (await session.execute(select(OutboxEvent.message))).scalars().all()
+        await database.engine.dispose()
+        return job, closed_task, task, events
+
+    job, closed_task, task, events = asyncio.run(scenario())
+    assert job.status == ShuffleJobStatus.completed
+    assert job.processed == 2
+    assert task.status == TaskStatus.closed
+    assert task.assignee_id == closed_task.assignee_id
+    assert closed_task.public_id not in {event['data']['task'] for event in events}
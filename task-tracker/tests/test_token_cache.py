@@ -0,0 +1,69 @@
+import asyncio
+
+from task_tracker.models import Account, AccountRole
+from task_tracker.web_server.token_cache import TokenCache
+
+
+def create_account(role: AccountRole) -> Account:
+    return Account(id=1, public_id='account', email='account@example.com', full_name='', role=role)
+
+
+def test_account_is_cached():
+    cache = TokenCache(max_size=10, ttl=60)
+    loads = []
+
+    async def load_account():
+        loads.append(1)
+        return create_account(AccountRole.worker)
+
+    async def scenario():
+        await cache.get('token', load_account)
+        return await cache.get('token', load_account)
+
+    account = asyncio.run(scenario())
+    assert account.role == AccountRole.worker
+    assert len(loads) == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_account_invalidated_during_load_is_not_cached():
+    cache = TokenCache(max_size=10, ttl=60)
+    roles = [AccountRole.worker, AccountRole.manager]
+    loading, released = asyncio.Event(), asyncio.Event()
+
+    async def load_account():
+        role = roles.pop(0)
+        loading.set()
+        await released.wait()
+        return create_account(role)
+
+    async def scenario():
+        load = asyncio.create_task(cache.get('token', load_account))
+        await loading.wait()
+        # The role changes after the account has been read, but before the load has finished
+        cache.invalidate_account('account')
+        released.set()
+        stale_account = await load
+        return stale_account, await cache.get('token', load_account)
+
+    stale_account, account = asyncio.run(scenario())
+    assert stale_account.role == AccountRole.worker
+    assert account.role == AccountRole.manager
+    assert cache.stats()['misses'] == 2
+
+
+def test_invalidated_account_is_loaded_again():
+    cache = TokenCache(max_size=10, ttl=60)
+    roles = [AccountRole.worker, AccountRole.manager]
+
+    async def load_account():
+        return create_account(roles.pop(0))
+
+    async def scenario():
+        await cache.get('token', load_account)
+        cache.invalidate_account('account')
+        return await cache.get('token', load_account)
+
+    account = asyncio.run(scenario())
+    assert account.role == AccountRole.manager
+    assert cache.stats()['size'] == 1
@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+
+from task_tracker.web_server import main
+from task_tracker.worker_roster import SelectionPolicy, WorkerRoster
+
+
+class FlakyRoster(WorkerRoster):
+    def __init__(self, failures: int):
+        super().__init__(SelectionPolicy.random)
+        self.failures = failures
+        self.loads = 0
+
+    async def load(self, session):
+        self.loads += 1
+        if self.loads <= self.failures:
+            raise ConnectionError('database is unavailable')
+
+
+def test_worker_roster_refresh_survives_failures(monkeypatch, caplog):
+    roster = FlakyRoster(failures=2)
+    monkeypatch.setattr(main, 'get_worker_roster', lambda: roster)
+
+    async def scenario():
+        refresh = asyncio.create_task(main.refresh_worker_roster(0))
+        while roster.loads < 3:
+            await asyncio.sleep(0)
+        refresh.cancel()
+
+    asyncio.run(scenario())
+    assert roster.loads == 3
+    assert caplog.text.count('Refreshing the worker roster failed') == 2
+
+
+def test_account_consumer_is_restarted(monkeypatch, caplog):
+    runs = []
+    blocked = asyncio.Event()
+
+    async def consume(settings, topics, group):
+        runs.append(group)
+        if len(runs) == 1:
+            raise ConnectionError('broker is unavailable')
+        if len(runs) == 2:
+            return
+        blocked.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(main.event_streaming, 'consume', consume)
+    monkeypatch.setattr(main.event_streaming, 'Settings', lambda: None)
+
+    async def scenario():
+        consumer = asyncio.create_task(main.consume_account_events(0))
+        await blocked.wait()
+        consumer.cancel()
+
+    asyncio.run(scenario())
+    assert runs == [None, None, None]
+    assert 'Consuming account events failed' in caplog.text
+    assert 'Consuming account events stopped' in caplog.text
+
+
+def test_metrics_are_served():
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://task-tracker') as client:
+            await client.get('/stats/token-cache')
+            return await client.get('/metrics', follow_redirects=True)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/stats/token-cache",status="200"}' in (
+        response.text
+    )
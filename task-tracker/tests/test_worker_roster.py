@@ -0,0 +1,95 @@
+import asyncio
+import random
+
+import pytest
+
+from task_tracker.web_server import dependences
+from task_tracker.worker_roster import SelectionPolicy, WorkerRoster
+
+
+def assert_consistent(roster: WorkerRoster):
+    # Every worker is at its position of the list of random picks and in the bucket of its load
+    assert sorted(roster._public_ids) == sorted(roster._workers)
+    assert roster._positions == {public_id: position for position, public_id in enumerate(roster._public_ids)}
+    assert roster._public_ids_by_load == {
+        load: {worker.public_id for worker in roster._workers.values() if worker.open_tasks == load}
+        for load in {worker.open_tasks for worker in roster._workers.values()}
+    }
+    if roster._workers:
+        assert roster._min_load == min(roster._public_ids_by_load)
+
+
+def test_random_picks_follow_removals():
+    roster = WorkerRoster(SelectionPolicy.random)
+    for n in range(5):
+        roster.add(f'worker-{n}', n)
+    # The last worker is moved to the position of a removed one, the removal of the last one moves nothing
+    for public_id in ('worker-1', 'worker-4', 'worker-0'):
+        roster.remove(public_id)
+        assert_consistent(roster)
+    # A worker removed already is ignored
+    roster.remove('worker-1')
+    assert len(roster) == 2
+    random.seed(0)
+    assert {roster.pick().public_id for _ in range(50)} == {'worker-2', 'worker-3'}
+    for public_id in ('worker-2', 'worker-3'):
+        roster.remove(public_id)
+    assert_consistent(roster)
+    assert roster.pick() is None
+
+
+def test_least_loaded_worker_is_picked():
+    roster = WorkerRoster(SelectionPolicy.least_loaded)
+    roster.add('busy', open_tasks=3)
+    roster.add('idle', open_tasks=1)
+    roster.add('loaded', open_tasks=2)
+    assert roster.pick().public_id == 'idle'
+    roster.remove('idle')
+    assert_consistent(roster)
+    assert roster.pick().public_id == 'loaded'
+    assert roster.stats() == {'workers': 2, 'min_open_tasks': 2, 'max_open_tasks': 3}
+
+
+def test_open_tasks_move_workers_between_loads():
+    roster = WorkerRoster(SelectionPolicy.least_loaded)
+    roster.add('first')
+    roster.add('second')
+    # A task is created for the first worker, then another one, and one of them is closed and reopened
+    roster.change_open_tasks('first', 1)
+    assert_consistent(roster)
+    assert roster.pick().public_id == 'second'
+    roster.change_open_tasks('second', 1)
+    roster.change_open_tasks('second', 1)
+    assert_consistent(roster)
+    assert roster.pick().public_id == 'first'
+    roster.change_open_tasks('second', -1)
+    roster.change_open_tasks('first', 1)
+    assert_consistent(roster)
+    assert roster._public_ids_by_load == {1: {'second'}, 2: {'first'}}
+    roster.change_open_tasks('second', -1)
+    assert roster.pick().public_id == 'second'
+    roster.change_open_tasks('second', 1)
+    assert_consistent(roster)
+    assert roster.stats() == {'workers': 2, 'min_open_tasks': 1, 'max_open_tasks': 2}
+    # Loads of unknown workers are ignored and never go below zero
+    roster.change_open_tasks('unknown', 1)
+    roster.change_open_tasks('second', -5)
+    assert_consistent(roster)
+    assert roster.pick().public_id == 'second'
+
+
+@pytest.fixture
+def roster():
+    dependences.get_worker_roster.cache_clear()
+    yield dependences.get_worker_roster()
+    dependences.get_worker_roster.cache_clear()
+
+
+def test_worker_given_another_role_is_removed(roster):
+    asyncio.run(dependences.update_worker_roster('AccountRoleChanged', 1, {'public_id': 'first', 'role': 'worker'}))
+    asyncio.run(dependences.update_worker_roster('AccountRoleChanged', 1, {'public_id': 'second', 'role': 'worker'}))
+    assert len(roster) == 2
+    asyncio.run(dependences.update_worker_roster('AccountRoleChanged', 1, {'public_id': 'first', 'role': 'manager'}))
+    assert_consistent(roster)
+    assert len(roster) == 1
+    assert roster.pick().public_id == 'second'